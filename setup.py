@@ -32,4 +32,8 @@ setup(name='TxScheduling',
           'setuptools',
           'Twisted>=8',
           'zope.interface',
-      ])
+      ],
+      extras_require={
+          'numpy': ['numpy'],
+          'trollius': ['trollius'],
+      })
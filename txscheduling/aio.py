@@ -0,0 +1,409 @@
+import heapq
+import itertools
+import weakref
+from logging import getLogger
+
+import zope.interface
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+from txscheduling.interfaces import (ISchedule, IWallClockSchedule,
+                                     ICursorSchedule, ISchedulingClock)
+from txscheduling.task import _batchDelays
+
+
+
+""" This module provides an asyncio equivalent of
+txscheduling.task.ScheduledCall, for running schedules such as
+txscheduling.cron.CronSchedule in an asyncio event loop without a Twisted
+reactor, and a scheduler that multiplexes the timers of many scheduled calls
+onto one handle of the loop. On Python 2 it uses trollius. """
+
+log = getLogger('txscheduling.aio')
+
+if asyncio is not None:
+    # Named async before Python 3.4.4, when async was not yet a keyword
+    _ensureFuture = getattr(asyncio, 'ensure_future', None)
+    if _ensureFuture is None:
+        _ensureFuture = getattr(asyncio, 'async')
+
+def _isAwaitable(result):
+    return (isinstance(result, asyncio.Future) or
+            asyncio.iscoroutine(result) or hasattr(result, '__await__'))
+
+
+class ScheduledCall(object):
+    """Call a function repeatedly in an asyncio event loop.
+
+    This is the asyncio counterpart of L{txscheduling.task.ScheduledCall}.
+    If C{f} returns a coroutine or another awaitable, it is run as a task
+    and rescheduling will not take place until it is done. The result value
+    is ignored. If C{f} raises an exception or the awaitable fails, the call
+    stops and the future returned by L{start} fails with the exception.
+
+    @ivar f: The function to call.
+    @ivar a: A tuple of arguments to pass the function.
+    @ivar kw: A dictionary of keyword arguments to pass to the function.
+    @ivar clock: The event loop, or a L{Scheduler} shared by many calls,
+        whose C{time} and C{call_at} methods schedule this call. The default
+        is the current event loop when L{start} is called.
+    @ivar lastRun: The loop time this call last fired, or C{None}.
+    @ivar fired: The number of times this call fired.
+    """
+    __slots__ = ('f', 'a', 'kw', 'clock', 'schedule', 'running', 'call',
+                 'future', 'lastRun', 'fired', '_lastTime', '_cursor',
+                 '__weakref__')
+
+    def __init__(self, f, *a, **kw):
+        if asyncio is None:
+            raise ImportError('txscheduling.aio requires asyncio or trollius')
+        self.f = f
+        self.a = a
+        self.kw = kw
+        self.clock = None
+        self.schedule = None
+        self.running = False
+        self.call = None
+        self.future = None
+        self.lastRun = None
+        self.fired = 0
+        self._lastTime = None
+        self._cursor = None
+
+
+    @property
+    def loop(self):
+        """ The event loop this call runs in. """
+        return getattr(self.clock, 'loop', self.clock)
+
+
+    def start(self, schedule):
+        """Start running function based on the provided schedule.
+
+        @param schedule: An object that provides or can be adapted to an
+        ISchedule interface.
+
+        @return: A future whose result is C{self} once L{stop} is called, or
+        whose exception is set when the function raises an exception or
+        returns an awaitable that fails.
+        """
+        assert not self.running, ("Tried to start an already running "
+                                  "ScheduledCall.")
+        self.schedule = ISchedule(schedule)
+        self._cursor = None
+        if self.clock is None:
+            self.clock = asyncio.get_event_loop()
+        self.running = True
+        self.future = asyncio.Future(loop=self.loop)
+
+        try:
+            self._reschedule()
+        except Exception, e:
+            log.error('Exception while starting %r: %s' % (self, e))
+            self.running = False
+            self.future = None
+            raise
+
+        return self.future
+
+
+    def stop(self):
+        """ Stop running function. """
+        assert self.running, ("Tried to stop a ScheduledCall that was not "
+                              "running.")
+        self.running = False
+
+        if self.call is not None:
+            self.call.cancel()
+            self.call = None
+            self._stopped()
+
+
+    def __call__(self):
+        self.call = None
+        self.lastRun = self.clock.time()
+        self.fired += 1
+
+        try:
+            result = self.f(*self.a, **self.kw)
+
+            if _isAwaitable(result):
+                result = _ensureFuture(result, loop=self.loop)
+                result.add_done_callback(self._done)
+                return
+        except Exception, e:
+            self._failed(e)
+            return
+
+        self._finished()
+
+
+    def _done(self, future):
+        if future.cancelled():
+            self._failed(asyncio.CancelledError())
+        elif future.exception() is not None:
+            self._failed(future.exception())
+        else:
+            self._finished()
+
+
+    def _finished(self):
+        if self.running:
+            self._reschedule()
+        else:
+            self._stopped()
+
+
+    def _stopped(self):
+        future, self.future = self.future, None
+        future.set_result(self)
+
+
+    def _failed(self, error):
+        self.running = False
+        future, self.future = self.future, None
+        future.set_exception(error)
+
+
+    def _reschedule(self):
+        """ Schedule the next iteration of this scheduled call. """
+        clock = self.clock
+
+        if ISchedulingClock.providedBy(clock):
+            self._lastTime = clock.getNextTime(self.schedule)
+        else:
+            schedule = self._cursor
+            if schedule is None:
+                schedule = self.schedule
+                if ICursorSchedule.providedBy(schedule):
+                    schedule = self._cursor = schedule.cursor()
+            self._lastTime = clock.time() + schedule.getDelayForNext()
+
+        self.call = clock.call_at(self._lastTime, self)
+
+
+    def __repr__(self):
+        return 'ScheduledCall<%s>(%s, *%r, **%r)' % (
+            self.schedule, getattr(self.f, '__name__', repr(self.f)), self.a,
+            self.kw)
+
+
+class _Timer(object):
+    """ A timer of a L{Scheduler}, with the methods of an asyncio
+    TimerHandle. """
+    __slots__ = ('_when', '_callback', '_args', '_scheduler', '_cancelled')
+
+    def __init__(self, when, callback, args, scheduler):
+        self._when = when
+        self._callback = callback
+        self._args = args
+        self._scheduler = scheduler
+        self._cancelled = False
+
+    def when(self):
+        return self._when
+
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        if not self._cancelled:
+            self._cancelled = True
+            if self._scheduler is not None:
+                self._scheduler._cancelTimer(self)
+
+    def __repr__(self):
+        return '<_Timer %r at %s>' % (self._callback, self._when)
+
+
+class Scheduler(object):
+    """Multiplex the timers of many scheduled calls onto a single handle of
+    an asyncio event loop.
+
+    A Scheduler is meant to be the C{clock} of L{ScheduledCall} instances.
+    Its timers are kept in a heap and the loop only has a C{call_at} handle
+    for the earliest of them, so the loop's own heap holds one entry however
+    many jobs there are, and every timer that is due runs in the same
+    wakeup. Cancelled timers are dropped when they reach the top of the heap
+    or when they make up most of it.
+
+    As with L{txscheduling.task.TimerWheel}, the next time of a wall clock
+    schedule is computed once for every call using an equal schedule until
+    that time has passed, and the next times of the calls made by one
+    wakeup are computed in a batch when their schedules provide
+    L{txscheduling.interfaces.IBatchSchedule}.
+
+    @ivar loop: The event loop. The default is the current event loop.
+    """
+    zope.interface.implements(ISchedulingClock)
+
+    def __init__(self, loop=None):
+        if asyncio is None:
+            raise ImportError('txscheduling.aio requires asyncio or trollius')
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self._timers = []
+        self._cancelled = 0
+        self._counter = itertools.count()
+        self._handle = None
+        self._handleTime = None
+        self._dispatching = False
+        self._nextTimes = weakref.WeakKeyDictionary()
+
+
+    def time(self):
+        return self.loop.time()
+
+
+    # The time unit of ISchedulingClock
+    seconds = time
+
+
+    def call_at(self, when, callback, *args):
+        """ Call C{callback} at loop time C{when}, returning a timer with
+        the methods of an asyncio TimerHandle. """
+        timer = _Timer(when, callback, args, self)
+        heapq.heappush(self._timers, (when, next(self._counter), timer))
+
+        if not self._dispatching and (self._handle is None or
+                                      when < self._handleTime):
+            self._setHandle(when)
+
+        return timer
+
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.time() + delay, callback, *args)
+
+
+    def __len__(self):
+        return len(self._timers) - self._cancelled
+
+
+    def getNextTime(self, schedule):
+        """Return the loop time of the next entry of C{schedule}. See
+        L{txscheduling.interfaces.ISchedulingClock.getNextTime}.
+        """
+        now = self.time()
+
+        if not IWallClockSchedule.providedBy(schedule):
+            return now + schedule.getDelayForNext()
+
+        next = self._nextTimes.get(schedule)
+
+        if next is None or next <= now:
+            next = self._nextTimes[schedule] = (now +
+                                                schedule.getDelayForNext())
+
+        return next
+
+
+    def prepare(self, schedules):
+        """Compute the next times of the wall clock schedules among
+        C{schedules} whose time has passed, in one batch for each class of
+        L{txscheduling.interfaces.IBatchSchedule}. See
+        L{txscheduling.interfaces.ISchedulingClock.prepare}.
+        """
+        now = self.time()
+        nextTimes = self._nextTimes
+        stale = set()
+
+        for schedule in schedules:
+            if IWallClockSchedule.providedBy(schedule):
+                next = nextTimes.get(schedule)
+                if next is None or next <= now:
+                    stale.add(schedule)
+
+        for schedule, delay in _batchDelays(stale).iteritems():
+            nextTimes[schedule] = now + delay
+
+
+    def _cancelTimer(self, timer):
+        self._cancelled += 1
+
+        if self._cancelled > 64 and self._cancelled * 2 > len(self._timers):
+            self._timers = [entry for entry in self._timers
+                            if not entry[2]._cancelled]
+            heapq.heapify(self._timers)
+            self._cancelled = 0
+
+            if not self._dispatching:
+                self._resetHandle()
+
+
+    def _setHandle(self, when):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = self.loop.call_at(when, self._wakeup)
+        self._handleTime = when
+
+
+    def _wakeup(self):
+        # The loop runs handles up to its clock resolution early, so every
+        # timer due by the time the handle was set for is due now
+        now = max(self.time(), self._handleTime)
+        self._handle = None
+        timers = self._timers
+        due = []
+
+        while timers and timers[0][0] <= now:
+            timer = heapq.heappop(timers)[2]
+            timer._scheduler = None
+            if timer._cancelled:
+                self._cancelled -= 1
+            else:
+                due.append(timer)
+
+        # The calls made by this wakeup ask for their next times, so those
+        # are computed together first
+        if len(due) > 1:
+            self.prepare([getattr(timer._callback, 'schedule', None)
+                          for timer in due])
+
+        self._dispatching = True
+
+        try:
+            for timer in due:
+                # Skip timers cancelled by the timers before them
+                if timer._cancelled:
+                    continue
+
+                try:
+                    timer._callback(*timer._args)
+                except Exception:
+                    log.exception('Error calling %r from %r' % (timer, self))
+        finally:
+            self._dispatching = False
+
+        self._resetHandle()
+
+
+    def _resetHandle(self):
+        timers = self._timers
+
+        while timers and timers[0][2]._cancelled:
+            heapq.heappop(timers)[2]._scheduler = None
+            self._cancelled -= 1
+
+        if timers:
+            if self._handle is None or timers[0][0] != self._handleTime:
+                self._setHandle(timers[0][0])
+        elif self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+
+    def __repr__(self):
+        return 'Scheduler(%r)' % (self.loop,)
+
+__all__ = [
+    'ScheduledCall',
+    'Scheduler'
+]
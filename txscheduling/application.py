@@ -0,0 +1,175 @@
+from logging import getLogger
+
+from twisted.application import service
+from twisted.internet import defer
+
+from txscheduling.interfaces import IAnchoredClock
+from txscheduling.store import restoreCalls
+from txscheduling.task import ScheduledCall, TimerWheel
+
+
+
+""" This module provides Twisted application services that run scheduled
+calls while the service is running, like
+twisted.application.internet.TimerService does for looping calls. """
+
+log = getLogger('txscheduling.application')
+
+class ScheduledCallService(service.Service):
+    """Run a function on a schedule while the service is running.
+
+    Like L{twisted.application.internet.TimerService}, stopping the service
+    returns a deferred that fires once a run in progress has finished.
+
+    @ivar call: The L{ScheduledCall}, whose clock and other settings may be
+        changed before the service starts.
+    """
+
+    def __init__(self, schedule, f, *a, **kw):
+        self.schedule = schedule
+        self.call = ScheduledCall(f, *a, **kw)
+        self._finished = None
+
+    def startService(self):
+        service.Service.startService(self)
+        self._finished = self.call.start(self.schedule)
+        self._finished.addErrback(self._failed)
+
+    def _failed(self, failure):
+        log.error('%r stopped: %s' % (self.call, failure.getErrorMessage()))
+
+    def stopService(self):
+        if self.call.running:
+            self.call.stop()
+
+        d, self._finished = self._finished, None
+        if d is None:
+            return service.Service.stopService(self)
+        d.addCallback(lambda ignored: service.Service.stopService(self))
+        return d
+
+
+class SchedulerService(service.Service):
+    """Run a registry of jobs while the service is running.
+
+    Every job is a L{ScheduledCall} on the same L{TimerWheel}, so there is a
+    single delayed call on the reactor however many jobs there are, and
+    jobs with equal schedules share the search for their next entry, which
+    is made for every job in one batch when the service starts. Jobs
+    may be added and removed at any time. Those added while the service is
+    running start at once, and removing one stops it.
+
+    Stopping the service returns a deferred that fires once the runs in
+    progress have finished.
+
+    When the service starts, the saved state of every job is loaded from
+    C{store} in one go with L{txscheduling.store.restoreCalls} before the
+    jobs start, and pending changes are flushed when it stops.
+
+    When C{clock} is a L{txscheduling.interfaces.IAnchoredClock}, the entries
+    every job is waiting for are moved together when it reports a wall clock
+    jump while the service is running.
+
+    @ivar wheel: The L{TimerWheel} the jobs are scheduled on.
+    @ivar store: A provider of L{txscheduling.interfaces.IJobStore} given to
+        every job, or C{None}.
+    @ivar claimer: A L{txscheduling.claim.ClaimBatcher} given to every job,
+        or C{None}.
+    @ivar jobs: The L{ScheduledCall} of each job id.
+    """
+
+    def __init__(self, clock=None, resolution=60, store=None, claimer=None):
+        self.wheel = TimerWheel(clock, resolution)
+        self.store = store
+        self.claimer = claimer
+        self.jobs = {}
+        self._schedules = {}
+        # The deferred of each started job, firing when it stops
+        self._finished = {}
+
+    def addJob(self, jobId, schedule, f, *a, **kw):
+        """Add a job running C{f} on a schedule, replacing any job with the
+        same id.
+
+        @return: The L{ScheduledCall} of the job.
+        """
+        if jobId in self.jobs:
+            self.removeJob(jobId)
+
+        call = ScheduledCall(f, *a, **kw)
+        call.clock = self.wheel
+        call.jobId = jobId
+        call.store = self.store
+        call.claimer = self.claimer
+        self.jobs[jobId] = call
+        self._schedules[jobId] = schedule
+
+        if self.running:
+            self._startJob(jobId)
+
+        return call
+
+    def removeJob(self, jobId):
+        """ Remove a job, stopping it if it is running. """
+        call = self.jobs.pop(jobId)
+        del self._schedules[jobId]
+        self._finished.pop(jobId, None)
+
+        if call.running:
+            call.stop()
+
+        if self.store is not None:
+            self.store.remove(jobId)
+
+    def _startJob(self, jobId):
+        call = self.jobs[jobId]
+        d = self._finished[jobId] = call.start(self._schedules[jobId])
+        d.addErrback(self._failed, call)
+
+    def _failed(self, failure, call):
+        log.error('Job %r stopped: %s' % (call.jobId,
+                                          failure.getErrorMessage()))
+
+    def _clockJumped(self, jump):
+        for call in self.jobs.itervalues():
+            call.replan(jump)
+
+    def startService(self):
+        service.Service.startService(self)
+
+        if IAnchoredClock.providedBy(self.wheel.clock):
+            self.wheel.clock.addJumpObserver(self._clockJumped)
+
+        if self.store is not None:
+            restoreCalls(self.store, self.jobs.itervalues())
+
+        self.wheel.prepare(self._schedules.values())
+
+        for jobId in self.jobs:
+            self._startJob(jobId)
+
+    def stopService(self):
+        # Stop running first, so jobs added while runs in progress finish
+        # are kept for the next start rather than started
+        service.Service.stopService(self)
+
+        for call in self.jobs.itervalues():
+            if call.running:
+                call.stop()
+
+        if IAnchoredClock.providedBy(self.wheel.clock):
+            self.wheel.clock.removeJumpObserver(self._clockJumped)
+
+        finished, self._finished = self._finished.values(), {}
+        d = defer.DeferredList(finished)
+        d.addCallback(self._stopped)
+        return d
+
+    def _stopped(self, ignored):
+        if self.store is not None:
+            self.store.flush()
+
+__all__ = [
+    'ScheduledCallService',
+    'SchedulerService'
+]
@@ -0,0 +1,99 @@
+import platform
+import timeit
+
+
+
+""" Benchmarks for txscheduling. Each benchmark is a factory registered with
+the benchmark decorator. Called with a scale, a factory does its setup and
+returns a function to time along with the number of operations that
+function performs. Run them from the command line with:
+
+    python -m txscheduling.benchmarks [--output results.json]
+        [--compare baseline.json] [name ...]
+"""
+
+_benchmarks = []
+
+def benchmark(name):
+    """Register a benchmark factory under name. """
+    def register(factory):
+        _benchmarks.append((name, factory))
+        return factory
+    return register
+
+def getBenchmarks():
+    """Return the registered (name, factory) pairs in registration order. """
+    # Importing the modules registers their benchmarks
+    from txscheduling.benchmarks import aio, cron, task
+    return list(_benchmarks)
+
+def runBenchmark(factory, scale=1.0, repeat=3):
+    """Time a benchmark, returning the best of repeat runs as a dictionary of
+    the operation count, seconds and operations per second. """
+    best = None
+    operations = 0
+
+    for i in range(repeat):
+        run, operations = factory(scale)
+        start = timeit.default_timer()
+        run()
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    perSecond = None
+    if best:
+        perSecond = operations / best
+
+    return {'operations': operations,
+            'seconds': best,
+            'perSecond': perSecond}
+
+def runBenchmarks(names=None, scale=1.0, repeat=3):
+    """Run the benchmarks whose names contain any of names, or all of them,
+    and return the results as a dictionary suitable for saving as JSON. """
+    results = {}
+
+    for name, factory in getBenchmarks():
+        if names and not [n for n in names if n in name]:
+            continue
+        results[name] = runBenchmark(factory, scale, repeat)
+
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'scale': scale,
+            'repeat': repeat,
+            'results': results}
+
+def compareResults(baseline, current, tolerance=0.1):
+    """Return the names of benchmarks in current whose operations per second
+    are more than tolerance (a fraction) below baseline, with the ratio of
+    current to baseline speed.
+
+    >>> compareResults({'results': {'a': {'perSecond': 100.0},
+    ...                             'b': {'perSecond': 100.0}}},
+    ...                {'results': {'a': {'perSecond': 95.0},
+    ...                             'b': {'perSecond': 50.0},
+    ...                             'c': {'perSecond': 10.0}}})
+    [('b', 0.5)]
+    """
+    regressions = []
+
+    for name, result in sorted(current['results'].iteritems()):
+        previous = baseline['results'].get(name)
+        if not previous or not previous['perSecond'] or not result['perSecond']:
+            continue
+        ratio = result['perSecond'] / previous['perSecond']
+        if ratio < 1 - tolerance:
+            regressions.append((name, ratio))
+
+    return regressions
+
+__all__ = [
+    'benchmark',
+    'getBenchmarks',
+    'runBenchmark',
+    'runBenchmarks',
+    'compareResults'
+]
@@ -0,0 +1,52 @@
+import json
+import optparse
+import sys
+
+from txscheduling.benchmarks import compareResults, runBenchmarks
+
+
+
+""" Run the txscheduling benchmarks and write their results as JSON. """
+
+def main(args=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] [name ...]',
+        description='Run the benchmarks whose names contain any of the given '
+                    'names, or all of them, and write the results as JSON.')
+    parser.add_option('-o', '--output', metavar='FILE',
+                      help='write the results to FILE instead of stdout')
+    parser.add_option('-c', '--compare', metavar='FILE',
+                      help='compare the results to those saved in FILE and '
+                           'exit with status 1 on a regression')
+    parser.add_option('-t', '--tolerance', type='float', default=0.1,
+                      help='the fraction a benchmark may slow down before it '
+                           'is a regression [default: %default]')
+    parser.add_option('-s', '--scale', type='float', default=1.0,
+                      help='multiply the size of every benchmark by SCALE '
+                           '[default: %default]')
+    parser.add_option('-r', '--repeat', type='int', default=3,
+                      help='time the best of REPEAT runs [default: %default]')
+    options, names = parser.parse_args(args)
+
+    results = runBenchmarks(names, options.scale, options.repeat)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        regressions = compareResults(baseline, results, options.tolerance)
+        for name, ratio in regressions:
+            sys.stderr.write('%s: %.0f%% of baseline\n' % (name, ratio * 100))
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import heapq
+import itertools
+
+from txscheduling import aio
+from txscheduling.benchmarks import benchmark
+from txscheduling.benchmarks.task import _cron, _fixed, _noop
+
+
+
+""" Benchmarks for dispatching asyncio scheduled calls, comparable with the
+dispatch benchmarks of txscheduling.benchmarks.task. Each one starts a number
+of calls on a loop whose time is advanced through a minute a second at a
+time and stops them, counting one operation per call. """
+
+class _Handle(object):
+    __slots__ = ('callback', 'args', 'cancelled')
+
+    def __init__(self, callback, args):
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class ManualLoop(object):
+    """The part of an asyncio event loop scheduled calls and futures use,
+    with a time that only moves when advanced, like
+    L{twisted.internet.task.Clock}. """
+
+    def __init__(self):
+        self.now = 0.0
+        self._scheduled = []
+        self._ready = []
+        self._counter = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def get_debug(self):
+        return False
+
+    def call_at(self, when, callback, *args):
+        handle = _Handle(callback, args)
+        heapq.heappush(self._scheduled, (when, next(self._counter), handle))
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def call_soon(self, callback, *args, **kw):
+        handle = _Handle(callback, args)
+        self._ready.append(handle)
+        return handle
+
+    def advance(self, seconds):
+        """ Move time forward and run everything that is due, in order. """
+        self.now += seconds
+        self._runReady()
+
+        while self._scheduled and self._scheduled[0][0] <= self.now:
+            handle = heapq.heappop(self._scheduled)[2]
+            if not handle.cancelled:
+                handle.callback(*handle.args)
+            self._runReady()
+
+    def _runReady(self):
+        while self._ready:
+            ready, self._ready = self._ready, []
+            for handle in ready:
+                if not handle.cancelled:
+                    handle.callback(*handle.args)
+
+    def pending(self):
+        """ Return the number of scheduled handles that are not cancelled. """
+        return len([entry for entry in self._scheduled
+                    if not entry[2].cancelled])
+
+
+def _dispatch(makeClock, makeSchedule, seconds):
+    def factory(scale):
+        count = max(1, int(1000 * scale))
+        loop = ManualLoop()
+        clock = makeClock(loop)
+        calls = []
+        for i in range(count):
+            call = aio.ScheduledCall(_noop)
+            call.clock = clock
+            calls.append(call)
+
+        def run():
+            for i, call in enumerate(calls):
+                call.start(makeSchedule(i))
+            for second in range(seconds):
+                loop.advance(1)
+            for call in calls:
+                call.stop()
+            loop.advance(0)
+
+        return run, count
+    return factory
+
+def _direct(loop):
+    return loop
+
+if aio.asyncio is not None:
+    benchmark('dispatch.aio')(_dispatch(_direct, _fixed, 60))
+    benchmark('dispatch.aio.scheduler')(_dispatch(aio.Scheduler, _fixed, 60))
+    benchmark('dispatch.aio.scheduler.cron')(_dispatch(aio.Scheduler, _cron,
+                                                       60))
+
+__all__ = [
+    'ManualLoop'
+]
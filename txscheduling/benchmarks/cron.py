@@ -0,0 +1,227 @@
+import datetime
+import time
+
+from txscheduling import cron, timezone
+from txscheduling.benchmarks import benchmark
+
+
+
+""" Benchmarks for parsing cron lines and searching for their entries. """
+
+# Lines seen in typical crontabs
+REALISTIC_LINES = (
+    '*/5 * * * *',
+    '0 * * * *',
+    '30 2 * * *',
+    '15 9,17 * * 1-5',
+    '*/15 8-18 * * 1-5',
+    '0 0 1 * *',
+    '0 4 * * 0',
+)
+
+# Lines that are expensive for one reason or another: the sparsest possible
+# schedule, the densest, schedules restricting both dom and dow and one with
+# seconds
+WORST_CASE_LINES = (
+    '0 0 29 2 *',
+    '* * * * *',
+    '0 0 13 * 5',
+    '0 12 1,15 * 1',
+    '59 23 31 * 0',
+    '*/10 * * * * *',
+)
+
+START = datetime.datetime(2011, 1, 1)
+
+def _startTimes(count):
+    """Return count start times spread over roughly two years. """
+    step = datetime.timedelta(minutes=1051)
+    return [START + step * i for i in range(count)]
+
+class _Uncached(dict):
+    """ An entry cache that keeps nothing, so every field is tokenized. """
+
+    def __setitem__(self, key, value):
+        pass
+
+def _parser(lines, entryCache=False):
+    """Return a function parsing lines without the parse cache, and without
+    the entry cache unless entryCache is true, in which case it starts
+    empty. """
+    def run():
+        maxsize = cron.parseCache.maxsize
+        cron.parseCache.maxsize = 0
+        cron.parseCache.clear()
+        saved = cron._entryCache
+        if entryCache:
+            cron._entryCache = {}
+        else:
+            cron._entryCache = _Uncached()
+        try:
+            for line in lines:
+                cron.parseCronLine(line)
+        finally:
+            cron.parseCache.maxsize = maxsize
+            cron._entryCache = saved
+
+    return run
+
+@benchmark('parseCronLine')
+def parseCronLine(scale):
+    lines = list(REALISTIC_LINES + WORST_CASE_LINES) * max(1, int(200 * scale))
+    return _parser(lines), len(lines)
+
+@benchmark('parseCronLine.entryCache')
+def parseCronLineEntryCache(scale):
+    lines = list(REALISTIC_LINES + WORST_CASE_LINES) * max(1, int(200 * scale))
+    return _parser(lines, entryCache=True), len(lines)
+
+def _crontab(count):
+    """Return count distinct lines in the styles found in large crontabs. """
+    lines = []
+    for i in range(count):
+        minute, hour = i % 60, (i // 60) % 24
+        lines.append(('%d %d * * *' % (minute, hour),
+                      '%d,%d %d-%d * * 1-5' % (minute, (minute + 30) % 60,
+                                               hour % 12, hour % 12 + 8),
+                      '*/%d %d * * *' % (minute % 29 + 1, hour),
+                      '%d %d 1,15 * *' % (minute, hour),
+                      '%d %d * 1-12/3 0' % (minute, hour))[i % 5])
+    return lines
+
+@benchmark('parseCronLine.crontab')
+def parseCronLineCrontab(scale):
+    lines = _crontab(max(1, int(5000 * scale)))
+    return _parser(lines), len(lines)
+
+@benchmark('parseCronLine.crontab.entryCache')
+def parseCronLineCrontabEntryCache(scale):
+    lines = _crontab(max(1, int(5000 * scale)))
+    return _parser(lines, entryCache=True), len(lines)
+
+@benchmark('parseCronLine.cached')
+def parseCronLineCached(scale):
+    lines = list(REALISTIC_LINES + WORST_CASE_LINES) * max(1, int(2000 * scale))
+    for line in lines:
+        cron.parseCronLine(line)
+
+    def run():
+        for line in lines:
+            cron.parseCronLine(line)
+
+    return run, len(lines)
+
+def _getNextEntry(lines):
+    def factory(scale):
+        schedules = [cron.CronSchedule(line) for line in lines]
+        starts = _startTimes(max(1, int(500 * scale)))
+
+        def run():
+            for schedule in schedules:
+                getNextEntry = schedule.getNextEntry
+                for start in starts:
+                    getNextEntry(start)
+
+        return run, len(schedules) * len(starts)
+    return factory
+
+benchmark('getNextEntry.realistic')(_getNextEntry(REALISTIC_LINES))
+
+for line in WORST_CASE_LINES:
+    benchmark('getNextEntry[%s]' % (line,))(_getNextEntry((line,)))
+
+@benchmark('getNextEntries')
+def getNextEntries(scale):
+    schedules = [cron.CronSchedule(line) for line in REALISTIC_LINES]
+    count = max(1, int(1000 * scale))
+
+    def run():
+        for schedule in schedules:
+            schedule.getNextEntries(START, count, timestamps=True)
+
+    return run, len(schedules) * count
+
+def _getDelayForNext(useTable, zone=None):
+    def factory(scale):
+        schedules = [cron.CronSchedule(line, zone) for line in REALISTIC_LINES]
+        if useTable:
+            year = time.localtime().tm_year
+            for schedule in schedules:
+                schedule.useTable(schedule.buildTable(year))
+        count = max(1, int(500 * scale))
+
+        def run():
+            for schedule in schedules:
+                getDelayForNext = schedule.getDelayForNext
+                for i in xrange(count):
+                    getDelayForNext()
+
+        return run, len(schedules) * count
+    return factory
+
+benchmark('getDelayForNext')(_getDelayForNext(False))
+benchmark('getDelayForNext.table')(_getDelayForNext(True))
+benchmark('getDelayForNext.zone')(_getDelayForNext(False, timezone.local))
+
+def _reschedule(cursor):
+    def factory(scale):
+        schedules = [cron.CronSchedule(line) for line in REALISTIC_LINES]
+        count = max(1, int(500 * scale))
+        start = time.mktime(START.timetuple())
+
+        def run():
+            for schedule in schedules:
+                now = start
+                if cursor:
+                    getDelayForNext = schedule.cursor().getDelayForNext
+                    for i in xrange(count):
+                        now += getDelayForNext(now)
+                else:
+                    # What getDelayForNext does for the current time
+                    for i in xrange(count):
+                        for entry in schedule._iterLocal(
+                            datetime.datetime.fromtimestamp(now), True):
+                            break
+                        now = entry
+
+        return run, len(schedules) * count
+    return factory
+
+# Stepping through entries as a call firing on time reschedules itself
+benchmark('reschedule.search')(_reschedule(False))
+benchmark('reschedule.cursor')(_reschedule(True))
+
+def _crontabDelays(batch):
+    def factory(scale):
+        schedules = [cron.CronSchedule(line)
+                     for line in _crontab(max(1, int(2000 * scale)))]
+        getDelaysForNext = cron.CronSchedule.getDelaysForNext
+
+        def run():
+            if batch:
+                getDelaysForNext(schedules)
+            else:
+                for schedule in schedules:
+                    schedule.getDelayForNext()
+
+        return run, len(schedules)
+    return factory
+
+benchmark('getDelayForNext.crontab')(_crontabDelays(False))
+benchmark('getDelaysForNext.crontab')(_crontabDelays(True))
+
+if cron.numpy is not None:
+    @benchmark('evaluateSchedules')
+    def evaluateSchedules(scale):
+        schedules = [cron.CronSchedule(line) for line in
+                     REALISTIC_LINES * max(1, int(20 * scale))]
+        end = START + datetime.timedelta(days=7)
+
+        def run():
+            cron.evaluateSchedules(schedules, START, end)
+
+        # The operation count is the number of entries found, which does
+        # not depend on the run
+        return run, len(cron.evaluateSchedules(schedules, START, end))
+
+__all__ = []
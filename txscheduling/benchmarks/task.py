@@ -0,0 +1,125 @@
+import gc
+import os
+import resource
+
+import zope.interface
+
+from twisted.internet.task import Clock
+
+from txscheduling import task
+from txscheduling.cron import CronSchedule
+from txscheduling.interfaces import ISchedule
+from txscheduling.benchmarks import benchmark
+
+
+
+""" Benchmarks for dispatching scheduled calls on a fake clock. Each one
+starts a number of calls, advances the clock through a minute a second at a
+time and stops them, counting one operation per call. """
+
+class _FixedSchedule(object):
+    zope.interface.implements(ISchedule)
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def getDelayForNext(self):
+        return self.delay
+
+
+def _noop():
+    pass
+
+def _dispatch(makeClock, makeSchedule, seconds):
+    def factory(scale):
+        count = max(1, int(1000 * scale))
+        clock = Clock()
+        scheduler = makeClock(clock)
+        calls = []
+        for i in range(count):
+            call = task.ScheduledCall(_noop)
+            call.clock = scheduler
+            calls.append(call)
+
+        def run():
+            for i, call in enumerate(calls):
+                call.start(makeSchedule(i))
+            for second in range(seconds):
+                clock.advance(1)
+            for call in calls:
+                call.stop()
+
+        return run, count
+    return factory
+
+def _direct(clock):
+    return clock
+
+def _fixed(i):
+    return _FixedSchedule(1 + i % 60)
+
+def _cron(i):
+    return CronSchedule.intern('* * * * *')
+
+def _allocated():
+    """Return the bytes allocated by Python as traced by tracemalloc, or the
+    resident set size of the process on Linux, or None. """
+    try:
+        import tracemalloc
+    except ImportError:
+        pass
+    else:
+        if tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+
+def measureJobMemory(count=20000, shared=True):
+    """Return the bytes each of count running ScheduledCall instances on a
+    TimerWheel takes, sharing one CronSchedule or each with its own, or None
+    if memory cannot be measured. Memory is traced with tracemalloc where it
+    is available, and otherwise read from the resident set size, which is
+    only an estimate. """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    else:
+        tracemalloc.start()
+
+    try:
+        wheel = task.TimerWheel(Clock())
+        gc.collect()
+        before = _allocated()
+        if before is None:
+            return None
+
+        calls = []
+        for i in range(count):
+            if shared:
+                schedule = CronSchedule.intern('*/5 * * * *')
+            else:
+                schedule = CronSchedule('%d %d * * *' % (i % 60, i % 24))
+            call = task.ScheduledCall(_noop)
+            call.clock = wheel
+            call.start(schedule)
+            calls.append(call)
+
+        gc.collect()
+        used = _allocated() - before
+        for call in calls:
+            call.stop()
+        return used // count
+    finally:
+        if tracemalloc is not None:
+            tracemalloc.stop()
+
+benchmark('dispatch.clock')(_dispatch(_direct, _fixed, 60))
+benchmark('dispatch.timerWheel')(_dispatch(task.TimerWheel, _fixed, 60))
+benchmark('dispatch.timerWheel.cron')(_dispatch(task.TimerWheel, _cron, 60))
+
+__all__ = [
+    'measureJobMemory'
+]
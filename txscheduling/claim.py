@@ -0,0 +1,186 @@
+import os
+import socket
+import sqlite3
+
+import zope.interface
+
+from twisted.internet import defer
+
+from txscheduling.executor import ThreadExecutor
+from txscheduling.interfaces import IClaimProvider
+
+
+
+""" This module provides the claim step that lets several nodes run the same
+scheduled calls while each entry runs on only one of them, and an
+implementation of the txscheduling.interfaces.IClaimProvider interface
+backed by an SQLite database that every node can open. """
+
+class ClaimBatcher(object):
+    """Collect the claims of scheduled calls and ask the provider for all of
+    them at once.
+
+    Set a ClaimBatcher as the C{claimer} of any number of
+    L{txscheduling.task.ScheduledCall} instances. Claims made in the same
+    reactor turn, such as those of every call made by one wakeup of a
+    L{txscheduling.task.TimerWheel}, are sent to the provider together, one
+    request for each C{resolution} seconds of entries, so a thousand calls
+    due in the same minute cost a single round trip.
+
+    @ivar provider: The provider of
+        L{txscheduling.interfaces.IClaimProvider} asked for claims.
+    @ivar clock: The provider of L{twisted.internet.interfaces.IReactorTime}
+        scheduling requests. The default is L{twisted.internet.reactor}.
+    @ivar resolution: The seconds of entries claimed in one request.
+    @ivar requests: The number of requests made to the provider.
+    @ivar claims: The number of slots asked for.
+    @ivar claimed: The number of slots this node won.
+    """
+
+    def __init__(self, provider, clock=None, resolution=60):
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.provider = IClaimProvider(provider)
+        self.clock = clock
+        self.resolution = resolution
+        self.requests = 0
+        self.claims = 0
+        self.claimed = 0
+        self._pending = {}
+        self._timer = None
+
+    def claim(self, jobId, time):
+        """Return a deferred firing with C{True} if this node won the entry
+        of a job due at the wall clock time C{time}, a POSIX timestamp, and
+        should run it. """
+        slot = (jobId, int(round(time)))
+        d = defer.Deferred()
+        self._pending.setdefault(slot[1] // self.resolution, []).append(
+            (slot, d))
+
+        if self._timer is None:
+            self._timer = self.clock.callLater(0, self._request)
+
+        return d
+
+    def _request(self):
+        self._timer = None
+        pending, self._pending = self._pending, {}
+
+        for key in sorted(pending):
+            waiting = pending[key]
+            self.requests += 1
+            self.claims += len(waiting)
+            d = defer.maybeDeferred(self.provider.claim,
+                                    [slot for slot, w in waiting])
+            d.addCallbacks(self._claimed, self._failed,
+                           callbackArgs=(waiting,), errbackArgs=(waiting,))
+
+    def _claimed(self, claimed, waiting):
+        for slot, d in waiting:
+            won = slot in claimed
+            self.claimed += won
+            d.callback(won)
+
+    def _failed(self, failure, waiting):
+        for slot, d in waiting:
+            d.errback(failure)
+
+
+def _jobKey(jobId):
+    """ Return the bytes a job id is stored as, unicode ids being encoded
+    as UTF-8 and other ids converted with str. """
+    if isinstance(jobId, unicode):
+        return jobId.encode('utf-8')
+    return str(jobId)
+
+
+class SQLiteClaimProvider(object):
+    """Claim slots in a table of an SQLite database shared by the nodes,
+    usually a file on the same machine or a shared filesystem with working
+    locks.
+
+    Each request inserts its slots in one write transaction, which SQLite
+    serializes between processes with its file lock, and the first node to
+    insert a slot owns it. Slots more than C{retention} seconds older than
+    those requested are deleted as requests are made. Job ids are stored as
+    bytes, see L{_jobKey}.
+
+    Waiting for the lock may take up to C{timeout} seconds, so transactions
+    run with C{executor}, by default a thread pool of one thread owned by
+    the provider, and L{claim} returns a deferred.
+
+    @ivar path: The file name of the database.
+    @ivar node: The name this node records its claims under. The default is
+        the host name and process id.
+    @ivar executor: The provider of L{txscheduling.interfaces.IExecutor} the
+        transactions run with. It must run one at a time.
+    """
+    zope.interface.implements(IClaimProvider)
+
+    def __init__(self, path, node=None, retention=86400, timeout=5.0,
+                 executor=None):
+        if node is None:
+            node = '%s:%d' % (socket.gethostname(), os.getpid())
+        self.path = path
+        self.node = node
+        self.retention = retention
+        self._ownExecutor = executor is None
+        if executor is None:
+            executor = ThreadExecutor(1, name='txscheduling-claims')
+        self.executor = executor
+        # Transactions are begun explicitly so the write lock is taken
+        # before the slots are read, and run in the thread of the executor
+        self._connection = sqlite3.connect(path, timeout=timeout,
+                                           isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS claims (job_id BLOB NOT NULL, '
+            'slot INTEGER NOT NULL, node TEXT NOT NULL, '
+            'PRIMARY KEY (job_id, slot))')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS claims_slot ON claims (slot)')
+
+    def claim(self, slots):
+        if not slots:
+            return defer.succeed(set())
+        return self.executor.run(self._claim, slots)
+
+    def _claim(self, slots):
+        """ Claim slots in one transaction. """
+        times = [time for jobId, time in slots]
+        keys = [(_jobKey(jobId), time) for jobId, time in slots]
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+
+        try:
+            connection.executemany(
+                'INSERT OR IGNORE INTO claims (job_id, slot, node) '
+                'VALUES (?, ?, ?)',
+                [(sqlite3.Binary(key), time, self.node)
+                 for key, time in keys])
+            owned = set([(str(key), time) for key, time in connection.execute(
+                        'SELECT job_id, slot FROM claims WHERE node = ? AND '
+                        'slot BETWEEN ? AND ?',
+                        (self.node, min(times), max(times)))])
+            connection.execute('DELETE FROM claims WHERE slot < ?',
+                               (min(times) - self.retention,))
+        except:
+            connection.execute('ROLLBACK')
+            raise
+
+        connection.execute('COMMIT')
+        return set([slot for slot, key in zip(slots, keys) if key in owned])
+
+    def close(self):
+        if self._ownExecutor:
+            self.executor.stop()
+        self._connection.close()
+
+    def __repr__(self):
+        return 'SQLiteClaimProvider(%r, %r)' % (self.path, self.node)
+
+__all__ = [
+    'ClaimBatcher',
+    'SQLiteClaimProvider'
+]
@@ -0,0 +1,194 @@
+import time
+import weakref
+from logging import getLogger
+
+import zope.interface
+
+from twisted.internet import task
+from twisted.internet.interfaces import IReactorTime
+
+from txscheduling.cron import NoMatch
+from txscheduling.interfaces import IAnchoredClock, IWallClockSchedule
+from txscheduling.task import _batchDelays
+
+
+
+""" This module provides an implementation of the
+txscheduling.interfaces.IAnchoredClock interface, which converts the
+entries of wall clock schedules to the time of a reactor with a single
+offset and detects jumps of the wall clock. """
+
+log = getLogger('txscheduling.clock')
+
+class AnchoredClock(object):
+    """Schedule on a reactor with the wall clock anchored to it.
+
+    The difference between the wall clock and the clock is measured once and
+    kept as C{offset}. The next entry of each wall clock schedule is kept as
+    an integer POSIX timestamp until it has passed, so the time of the next
+    call of every user of an equal schedule is that timestamp plus the
+    offset, without searching or converting dates again.
+
+    The offset is measured again every C{checkInterval} seconds, by a looping
+    call on C{clock} that runs while the clock has jump observers or kept
+    entries, and before computing next times if it has not been measured
+    for that long. When it has moved by more than C{tolerance} seconds, because the wall
+    clock was stepped or the host was suspended, the mapping and the kept
+    entries are replaced and jump observers are told, so that calls waiting
+    for entries computed with the old mapping can be moved, such as with
+    L{txscheduling.task.ScheduledCall.replan}.
+
+    Jumps can only be detected when the time of C{clock} is monotonic, as
+    with a reactor whose C{seconds} reads a monotonic clock. The reactors of
+    Twisted up to at least 20.3 read C{time.time}, so anchored to one of
+    them the offset stays about 0 and no jump is ever seen. Their delayed
+    calls follow the wall clock themselves, firing late by the jump when it
+    is stepped back and at once, as misfires, when it is stepped forward.
+
+    An AnchoredClock provides L{twisted.internet.interfaces.IReactorTime} and
+    can be the clock of scheduled calls or of a
+    L{txscheduling.task.TimerWheel}.
+
+    @ivar clock: The provider of L{twisted.internet.interfaces.IReactorTime}
+        anchored to. The default is L{twisted.internet.reactor}.
+    @ivar offset: The time of C{clock} minus the wall clock time.
+    @ivar jumps: The number of jumps detected.
+    """
+    zope.interface.implements(IReactorTime, IAnchoredClock)
+
+    # Read for the wall clock time; replaced by tests
+    _wallTime = staticmethod(time.time)
+
+    def __init__(self, clock=None, tolerance=1.0, checkInterval=1.0):
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.clock = clock
+        self.tolerance = tolerance
+        self.checkInterval = checkInterval
+        self.jumps = 0
+        self._observers = []
+        self._entries = weakref.WeakKeyDictionary()
+        self.offset = self.clock.seconds() - self._wallTime()
+        self._checked = self.clock.seconds()
+        self._checker = task.LoopingCall(self._checkPeriodically)
+        self._checker.clock = self.clock
+
+    def seconds(self):
+        return self.clock.seconds()
+
+    def callLater(self, delay, f, *a, **kw):
+        return self.clock.callLater(delay, f, *a, **kw)
+
+    def getDelayedCalls(self):
+        return self.clock.getDelayedCalls()
+
+    def wallTime(self):
+        return self.clock.seconds() - self.offset
+
+    def addJumpObserver(self, observer):
+        self._observers.append(observer)
+        self._startChecking()
+
+    def removeJumpObserver(self, observer):
+        self._observers.remove(observer)
+
+    def _startChecking(self):
+        if not self._checker.running:
+            self._checker.start(self.checkInterval, now=False)
+
+    def _checkPeriodically(self):
+        # Without observers or entries there is nothing a jump would move
+        if not self._observers and not len(self._entries):
+            self._checker.stop()
+            return
+
+        try:
+            self.check()
+        except Exception:
+            log.exception('Error checking %r for wall clock jumps' % (self,))
+
+    def check(self):
+        """Measure the offset now and handle a jump if it has moved by more
+        than C{tolerance} seconds.
+
+        @return: The seconds the wall clock jumped by, or 0.
+        """
+        now = self.clock.seconds()
+        self._checked = now
+        offset = now - self._wallTime()
+        jump = self.offset - offset
+
+        if abs(jump) <= self.tolerance:
+            return 0
+
+        log.warning('The wall clock jumped by %.3f seconds' % (jump,))
+        self.offset = offset
+        self._entries.clear()
+        self.jumps += 1
+
+        for observer in list(self._observers):
+            observer(jump)
+
+        return jump
+
+    def prepare(self, schedules):
+        """Compute the next entries of the wall clock schedules among
+        C{schedules} whose entry has passed, in one batch for each class of
+        L{txscheduling.interfaces.IBatchSchedule}. See
+        L{txscheduling.interfaces.ISchedulingClock.prepare}.
+        """
+        now = self._checkedSeconds()
+        wall = now - self.offset
+        entries = self._entries
+        stale = set()
+
+        for schedule in schedules:
+            if IWallClockSchedule.providedBy(schedule):
+                entry = entries.get(schedule)
+                if entry is None or entry <= wall:
+                    stale.add(schedule)
+
+        for schedule, delay in _batchDelays(stale, wall).iteritems():
+            entries[schedule] = int(round(wall + delay))
+
+        if stale:
+            self._startChecking()
+
+    def _checkedSeconds(self):
+        """ Return the current time, checking the offset first if it has not
+        been checked for C{checkInterval} seconds. """
+        now = self.clock.seconds()
+
+        if now - self._checked >= self.checkInterval:
+            self.check()
+
+        return now
+
+    def getNextTime(self, schedule):
+        """Return the time of the next entry of C{schedule}. See
+        L{txscheduling.interfaces.ISchedulingClock.getNextTime}.
+        """
+        now = self._checkedSeconds()
+
+        if not IWallClockSchedule.providedBy(schedule):
+            return now + schedule.getDelayForNext()
+
+        wall = now - self.offset
+        entry = self._entries.get(schedule)
+
+        if entry is None or entry <= wall:
+            for entry in schedule.iterEntries(wall, timestamps=True):
+                break
+            else:
+                raise NoMatch('no matching entry after %s' % (wall,))
+            self._entries[schedule] = entry
+            self._startChecking()
+
+        return entry + self.offset
+
+    def __repr__(self):
+        return 'AnchoredClock(%r)' % (self.clock,)
+
+__all__ = [
+    'AnchoredClock'
+]
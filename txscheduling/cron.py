@@ -1,10 +1,27 @@
+import array
+import bisect
+import mmap
+import struct
+import sys
 import time
 import datetime
+import calendar
+import itertools
+import operator
 import re
+import weakref
+from collections import OrderedDict
 
 import zope.interface
 
-from txscheduling.interfaces import ISchedule
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from txscheduling import timezone
+from txscheduling.interfaces import (IBatchSchedule, ICursorSchedule,
+                                     ISchedule)
 
 
 
@@ -13,233 +30,654 @@ txscheduling.interface.ISchedule interface along with two useful
 functions for parsing cron lines. """
 
 class CronSchedule(object):
-    zope.interface.implements(ISchedule)
+    """ A schedule of the entries of a cron line.
     
-    _minutes = None
-    _hours = None
-    _doms = None # days of the month
-    _months = None
-    _dows = None # days of the week
-  
-    def __init__(self,cron_line):
-        kwargs = parseCronLine(cron_line)
-    
-        self._minutes = kwargs.get('minutes')
-        self._hours = kwargs.get('hours')
-        self._doms = kwargs.get('doms')
-        self._months = kwargs.get('months')
-        self._dows = kwargs.get('dows')
+    Each field is compiled into an integer bitmask (bit n is set when min + n
+    is a member) and a table mapping every position to the first member at
+    or after it, see _compileField. The masks and tables come from the parse
+    cache and are shared by every schedule with the same line, and instances
+    have slots rather than a __dict__, so a schedule costs about 250 bytes of
+    its own. """
+    zope.interface.implements(ICursorSchedule, IBatchSchedule)
+    __slots__ = ('line', 'zone', '_transitions', 'ambiguous', 'missing',
+                 '_table', '_seconds', '_secondMask', '_secondNext',
+                 '_minuteMask', '_minuteNext', '_hourMask', '_hourNext',
+                 '_domMask', '_domNext', '_monthMask', '_monthNext',
+                 '_dowMask', '_dayMasks', '_allDoms', '_allDows',
+                 '__weakref__')
+    
+    _interned = weakref.WeakValueDictionary()
   
+    def __init__(self,cron_line,zone=None,
+                 ambiguous=timezone.AMBIGUOUS_EARLIEST,
+                 missing=timezone.MISSING_TRANSITION):
+        """ Without a zone, entries are naive local times converted with
+        time.mktime, as they always have been. With a zone, a
+        C{datetime.tzinfo} such as L{txscheduling.timezone.local} or one from
+        pytz, entries are times in that zone and are converted to UTC with
+        its cached transitions. Local times that occur twice when the offset
+        decreases run at the earliest or latest occurrence according to
+        ambiguous. Those that do not occur when it increases are skipped or
+        run at the moment of the change according to missing. """
+        if ambiguous not in timezone._ambiguousPolicies:
+            raise ValueError('Unknown ambiguous time policy: %r' % (ambiguous,))
+        
+        if missing not in timezone._missingPolicies:
+            raise ValueError('Unknown missing time policy: %r' % (missing,))
+        
+        self.line = _normalizeCronLine(cron_line)
+        kwargs, compiled = parseCache.lookup(self.line)
+        
+        # The timezone entries are in and its transitions, or None for the
+        # local time of time.mktime
+        self.zone = zone
+        self._transitions = None
+        if zone is not None:
+            self._transitions = timezone.getTransitions(zone)
+        
+        self.ambiguous = ambiguous
+        self.missing = missing
+        
+        # The FireTable consulted before searching, see useTable
+        self._table = None
+        
+        # Only the seconds are kept as values, to tell minute schedules apart
+        self._seconds = kwargs.get('seconds', (0,))
+        
+        (self._secondMask, self._secondNext,
+         self._minuteMask, self._minuteNext, self._hourMask, self._hourNext,
+         self._domMask, self._domNext, self._monthMask, self._monthNext,
+         self._dowMask, self._dayMasks, self._allDoms,
+         self._allDows) = compiled
+    
+    @classmethod
+    def intern(cls, cron_line, zone=None,
+               ambiguous=timezone.AMBIGUOUS_EARLIEST,
+               missing=timezone.MISSING_TRANSITION):
+        """ Return a CronSchedule for cron_line that is shared with every other
+        caller interning an equivalent line while it is in use. The entries of
+        a schedule never change after construction, so sharing them is safe,
+        but the schedule is the same object for every caller: a FireTable
+        given to useTable, or None to stop using one, applies to all of
+        them. """
+        key = (cls, _normalizeCronLine(cron_line), zone, ambiguous, missing)
+        schedule = cls._interned.get(key)
+        
+        if schedule is None:
+            schedule = cls._interned.setdefault(key, cls(*key[1:]))
+        
+        return schedule
+    
     def __eq__(self,other):
         if not isinstance(other,CronSchedule):
             return False
     
-        return (self._minutes == other._minutes and
-                self._hours   == other._hours and
-                self._doms    == other._doms and
-                self._months  == other._months and
-                self._dows    == other._dows)
-  
-    def _getNextMonth(self, current):
-        # If the current month is a valid option, try to parse for the next valid day
-        if current.month in self._months:
-            try:
-                return self._getNextDay(current)
-            except NoMatch:
-                pass
-    
-        # Find the next month if it occurs in the current year
-        for month in self._months:
-            if month > current.month:
-                return self._getFirstDay(current.replace(month=month,
-                                                         day=1,
-                                                         hour=self._hours[0],
-                                                         minute=self._minutes[0]))
-    
-        # No remaining months this year, go to next year
-        return self._getFirstDay(current.replace(year=current.year+1,
-                                                 month=self._months[0],
-                                                 day=1,
-                                                 hour=self._hours[0],
-                                                 minute=self._minutes[0]))
+        return (self._secondMask == other._secondMask and
+                self._minuteMask == other._minuteMask and
+                self._hourMask   == other._hourMask and
+                self._domMask    == other._domMask and
+                self._monthMask  == other._monthMask and
+                self._dowMask    == other._dowMask and
+                self.zone        == other.zone and
+                (self.zone is None or
+                 (self.ambiguous == other.ambiguous and
+                  self.missing   == other.missing)))
+    
+    def __ne__(self,other):
+        return not self.__eq__(other)
+    
+    def __repr__(self):
+        args = [repr(self.line)]
+        
+        if self.zone is not None:
+            args.append('zone=%r' % (self.zone,))
+            
+            if self.ambiguous != timezone.AMBIGUOUS_EARLIEST:
+                args.append('ambiguous=%r' % (self.ambiguous,))
+            
+            if self.missing != timezone.MISSING_TRANSITION:
+                args.append('missing=%r' % (self.missing,))
+        
+        return 'CronSchedule(%s)' % (', '.join(args),)
+    
+    def __hash__(self):
+        return hash((self._secondMask, self._minuteMask, self._hourMask,
+                     self._domMask, self._monthMask, self._dowMask, self.zone))
+
+    def __reduce__(self):
+        # Pickled as the arguments it was made from, so unpickling goes
+        # through the parse cache instead of copying the compiled tables
+        return (self.__class__, (self.line, self.zone, self.ambiguous,
+                                 self.missing))
+
+    def _findEntry(self, year, month, day, hour, minute):
+        """ Return the first (year, month, day, hour, minute) entry at or after
+        the given position, or None if there is none in _SEARCH_MONTHS
+        candidate months. Positions past the end of a field (minute 60, hour
+        24, day 32, month 13) are allowed and roll over to the next value of
+        the enclosing field.
+        
+        Months outside the schedule are skipped with the month table and the
+        matching days of a month are found with one mask operation, so every
+        iteration examines one candidate month. Lines that cannot match are
+        rejected when parsed, and every other line matches within 13
+        candidate months: the rest of the starting month followed by at most
+        a year of months, or for lines only matching February 29, at most
+        nine Februaries around the eight years between leap days at 2100. """
+        hour_next = self._hourNext
+        first_hour = hour_next[0]
+        first_minute = self._minuteNext[0]
+        
+        # The first time on the starting day, or the first time of any later
+        # day if the starting day has no times left
+        next_hour = hour_next[hour]
+        next_minute = first_minute
+        
+        if next_hour == hour:
+            next_minute = self._minuteNext[minute]
+            
+            if next_minute is None:
+                next_hour = hour_next[hour + 1]
+                next_minute = first_minute
+        
+        if next_hour is None:
+            day += 1
+            next_hour = first_hour
+        
+        start = (year, month, day)
+        month_next = self._monthNext
+        day_masks = self._dayMasks
+        
+        for i in xrange(_SEARCH_MONTHS):
+            next_month = month_next[month]
+            
+            if next_month is None:
+                year, month, day = year + 1, month_next[1], 1
+            elif next_month != month:
+                month, day = next_month, 1
+            
+            days = ((day_masks[_firstWeekday(year, month)] &
+                     _monthDays(year, month)) >> (day - 1))
+            
+            if days:
+                day += (days & -days).bit_length() - 1
+                
+                if (year, month, day) == start:
+                    return year, month, day, next_hour, next_minute
+                
+                return year, month, day, first_hour, first_minute
+            
+            month, day = month + 1, 1
+        
+        return None
   
-    def _getFirstDay(self,current):
-        all_doms = False
-        all_dows = False
-        fdom = current.replace(day=1)
+    def _findTime(self, year, month, day, hour, minute, second):
+        """ Return the first (year, month, day, hour, minute, second) entry
+        after the given second, or None. The seconds table tells whether the
+        current minute has a later second, so this is at most one search. """
+        next_second = self._secondNext[second + 1]
+        
+        if next_second is not None:
+            entry = self._findEntry(year, month, day, hour, minute)
+            
+            if entry == (year, month, day, hour, minute):
+                return entry + (next_second,)
+        else:
+            entry = self._findEntry(year, month, day, hour, minute + 1)
+        
+        if entry is None:
+            return None
+        
+        return entry + (self._seconds[0],)
     
-        if len(self._doms) == 31:
-            all_doms = True
+    def _iterTimes(self, year, month, day, hour, minute, second):
+        """ Generate the (year, month, day, hour, minute, second) entries
+        after the given second in order. The position within the current day
+        is kept between entries, so walking forward is a table lookup per
+        entry and a search only when a day is exhausted. Schedules with a
+        seconds field step through their seconds within each minute rather
+        than second by second. """
+        hour_next = self._hourNext
+        minute_next = self._minuteNext
+        first_minute = minute_next[0]
+        seconds = self._seconds
+        next_second = self._secondNext[second + 1]
+        
+        # The seconds left in the first minute
+        partial = seconds
+        
+        if next_second is None:
+            entry = self._findEntry(year, month, day, hour, minute + 1)
+        else:
+            entry = self._findEntry(year, month, day, hour, minute)
+            
+            if entry == (year, month, day, hour, minute):
+                partial = seconds[seconds.index(next_second):]
+        
+        while entry is not None:
+            year, month, day, hour, minute = entry
+            
+            while True:
+                for second in partial:
+                    yield year, month, day, hour, minute, second
+                
+                partial = seconds
+                minute = minute_next[minute + 1]
+                
+                if minute is None:
+                    hour = hour_next[hour + 1]
+                    
+                    if hour is None:
+                        break
+                    
+                    minute = first_minute
+            
+            entry = self._findEntry(year, month, day + 1, 0, 0)
     
-        if len(self._dows) == 7:
-            all_dows = True
+    def _timestamp(self, current):
+        """ Return current, which is None for now, a POSIX timestamp or a
+        datetime, as a POSIX timestamp. Naive datetimes are local times in
+        the zone of this schedule. """
+        if current is None:
+            return time.time()
+        
+        if isinstance(current, datetime.datetime):
+            if current.tzinfo is not None:
+                return (calendar.timegm(current.utctimetuple()) +
+                        current.microsecond / 1000000.0)
+            
+            return self._transitions.resolve(
+                timezone.wallSeconds(current.year, current.month, current.day,
+                                     current.hour, current.minute) +
+                current.second)
+        
+        if not isinstance(current, (int, long, float)):
+            raise ValueError('current value must be a datetime.datetime object '
+                             'or a timestamp')
+        
+        return current
     
-        # All days of the week and days of the month, return day = 1
-        if all_doms and all_dows:
-            return fdom
+    def _iterZone(self, timestamp):
+        """ Generate the POSIX timestamps of the entries after the second
+        containing timestamp in the zone of this schedule. Local times are
+        resolved with the ambiguous and missing policies, and an entry that
+        resolves to a time that has already been generated or passed is
+        dropped, so each moment runs once. """
+        transitions = self._transitions
+        resolve = transitions.resolve
+        wallSeconds = timezone.wallSeconds
+        ambiguous = self.ambiguous
+        missing = self.missing
+        
+        last = int(timestamp // 1)
+        wall = datetime.datetime.utcfromtimestamp(
+            last + transitions.utcoffset(last))
+        
+        for year, month, day, hour, minute, second in self._iterTimes(
+            wall.year, wall.month, wall.day, wall.hour, wall.minute,
+            wall.second):
+            entry = resolve(wallSeconds(year, month, day, hour, minute) +
+                            second, ambiguous, missing)
+            
+            if entry is not None and entry > last:
+                last = entry
+                yield entry
     
-        # All days of the week, return first day of the month
-        if all_dows:
-            return current.replace(day=self._doms[0])
+    def getNextEntry(self,current=None):
+        """ Return the first entry after current as a datetime. Schedules with
+        a zone return aware datetimes in their zone. """
+        if self.zone is not None:
+            for entry in self._iterZone(self._timestamp(current)):
+                return self._transitions.datetime(entry)
+            
+            raise NoMatch('no matching entry after %s' % (current,))
+        
+        if current is None:
+            current = datetime.datetime.now()
+        elif not isinstance(current,datetime.datetime):
+            if not isinstance(current, (int, long, float)):
+                raise ValueError('current value must be a datetime.datetime '
+                                 'object or a timestamp')
+            
+            current = datetime.datetime.fromtimestamp(current)
+        
+        if self._table is not None and current.tzinfo is None:
+            minute = self._table.getNextMinute(
+                int(time.mktime(current.timetuple()) // 60))
+            
+            if minute is not None:
+                return datetime.datetime.fromtimestamp(minute * 60)
+        
+        entry = self._findTime(current.year, current.month, current.day,
+                               current.hour, current.minute, current.second)
+        
+        if entry is None:
+            raise NoMatch('no matching entry after %s' % (current,))
+        
+        year, month, day, hour, minute, second = entry
+        
+        return current.replace(year=year, month=month, day=day, hour=hour,
+                               minute=minute, second=second, microsecond=0)
     
-        dows = self._dows
+    def iterEntries(self,current=None,timestamps=False):
+        """ Generate the entries of this schedule after current, a datetime
+        or a POSIX timestamp, in order. If timestamps is true, POSIX
+        timestamps are generated instead of datetime objects.
         
-        if dows[0] == 0:
-            import copy
-            dows = copy.copy(dows)
-            del dows[0]
-            dows.append(7)
+        Without a zone, entries are naive local times and their timestamps
+        come from time.mktime. With a zone, entries are aware datetimes in
+        the zone and timestamps are resolved with its transitions. """
+        if self.zone is not None:
+            entries = self._iterZone(self._timestamp(current))
+            
+            if timestamps:
+                return entries
+            
+            return (self._transitions.datetime(entry) for entry in entries)
+        
+        if current is None:
+            current = datetime.datetime.now()
+        elif not isinstance(current,datetime.datetime):
+            if not isinstance(current, (int, long, float)):
+                raise ValueError('current value must be a datetime.datetime '
+                                 'object or a timestamp')
+            
+            current = datetime.datetime.fromtimestamp(current)
+        
+        return self._iterLocal(current, timestamps)
     
-        current_dow = fdom.isoweekday()
+    def _iterLocal(self, current, timestamps):
+        tzinfo = current.tzinfo
+        mktime = time.mktime
+        base_hour = None
+        
+        # Timestamps are integers found with one mktime call per hour
+        for year, month, day, hour, minute, second in self._iterTimes(
+            current.year, current.month, current.day, current.hour,
+            current.minute, current.second):
+            if timestamps:
+                if (year, month, day, hour) != base_hour:
+                    base_hour = (year, month, day, hour)
+                    base = int(mktime((year, month, day, hour, 0, 0, 0, 0,
+                                       -1)))
+                
+                yield base + minute * 60 + second
+            else:
+                yield datetime.datetime(year, month, day, hour, minute, second,
+                                        0, tzinfo)
     
-        # If the current day of the week is in the days of the week, return
-        if not all_dows and current_dow in dows:
-            return fdom
+    def getNextEntries(self,current=None,count=1,timestamps=False):
+        """ Return a list of the next count entries after current. See
+        iterEntries. """
+        return list(itertools.islice(self.iterEntries(current, timestamps),
+                                     count))
     
-        # If the first day of the month is specifically listed, return it
-        if not all_doms and self._doms[0] == 1:
-            return fdom
+    def getDelayForNext(self):
+        if self.zone is not None:
+            now = time.time()
+            
+            for entry in self._iterZone(now):
+                return entry - now
+            
+            raise NoMatch('no matching entry after %s' % (now,))
+        
+        if self._table is not None:
+            now = time.time()
+            minute = self._table.getNextMinute(int(now // 60))
+            
+            if minute is not None:
+                return minute * 60 - now
+        
+        # One reading of the clock and an integer timestamp for the entry
+        now = time.time()
+        
+        for entry in self._iterLocal(datetime.datetime.fromtimestamp(now),
+                                     True):
+            return entry - now
+        
+        raise NoMatch('no matching entry after %s' % (now,))
     
-        dow_distance = None
-        dom_distance = None
+    def cursor(self):
+        """ Return a new EntryCursor over the entries of this schedule. """
+        return EntryCursor(self)
     
-        distance = None
+    @classmethod
+    def getDelaysForNext(cls, schedules, now=None):
+        """ Return the delays before the next entries of many schedules after
+        now, a single POSIX timestamp that defaults to the current time, in
+        order. See IBatchSchedule.
+        
+        A schedule given more than once, such as an interned one, is searched
+        once, the calendar fields of now are found once for local time and
+        once for each zone, and entries in the same hour share one
+        time.mktime call. With numpy, whole minute schedules in local time
+        without a table are searched together with array operations, see
+        _arrayDelays. """
+        if now is None:
+            now = time.time()
+        
+        unique = dict(zip(map(id, schedules), schedules))
+        delays = {}
+        
+        if numpy is not None and len(unique) >= _ARRAY_BATCH:
+            local = [schedule for schedule in unique.itervalues()
+                     if schedule.zone is None and schedule._table is None and
+                     schedule._seconds == (0,)]
+            delays.update(zip(map(id, local), _arrayDelays(local, now)))
+        
+        fields = {}
+        bases = {}
+        
+        for key, schedule in unique.iteritems():
+            if delays.get(key) is None:
+                delays[key] = schedule._delayAt(now, fields, bases)
+        
+        return [delays[id(schedule)] for schedule in schedules]
     
-        if not all_dows:
-            for dow in dows:
-                if dow > current_dow:
-                    dow_distance = dow-current_dow
-                    break
-      
-        if dow_distance is None:
-            dow_distance = dows[0]+7-current_dow
+    def _delayAt(self, now, fields, bases):
+        """ Return the delay before the next entry after now for
+        getDelaysForNext. The calendar fields of now in each zone, keyed by
+        its transitions or None for local time, and the timestamps of local
+        hours are kept in fields and bases for the next schedule. """
+        if self.zone is not None:
+            transitions = self._transitions
+            wall = fields.get(transitions)
+            
+            if wall is None:
+                last = int(now // 1)
+                wall = fields[transitions] = datetime.datetime.utcfromtimestamp(
+                    last + transitions.utcoffset(last)).timetuple()[:6]
+            
+            entry = self._findTime(*wall)
+            
+            if entry is not None:
+                year, month, day, hour, minute, second = entry
+                entry = transitions.resolve(
+                    timezone.wallSeconds(year, month, day, hour, minute) +
+                    second, self.ambiguous, self.missing)
+                
+                if entry is not None and entry > now:
+                    return entry - now
+            
+            # Entries that do not resolve to a later moment are left to the
+            # full search
+            for entry in self._iterZone(now):
+                return entry - now
+            
+            raise NoMatch('no matching entry after %s' % (now,))
+        
+        if self._table is not None:
+            minute = self._table.getNextMinute(int(now // 60))
+            
+            if minute is not None:
+                return minute * 60 - now
+        
+        current = fields.get(None)
+        
+        if current is None:
+            current = fields[None] = time.localtime(now)[:6]
+        
+        entry = self._findTime(*current)
+        
+        if entry is None:
+            raise NoMatch('no matching entry after %s' % (now,))
+        
+        year, month, day, hour, minute, second = entry
+        base = bases.get(entry[:4])
+        
+        if base is None:
+            base = bases[entry[:4]] = int(time.mktime(
+                    (year, month, day, hour, 0, 0, 0, 0, -1)))
+        
+        return base + minute * 60 + second - now
     
-        if not all_doms:
-            dom_distance = self._doms[0] - 1
+    def buildTable(self, year):
+        """ Return a FireTable of the entries of this schedule in year. """
+        return FireTable.build(self, year)
     
-        if not dow_distance is None and not dom_distance is None:
-            if dow_distance <= dom_distance:
-                distance = dow_distance
-            else:
-                distance = dom_distance
-      
-        if distance is None and not dow_distance is None:
-            distance = dow_distance
+    def useTable(self, table):
+        """ Answer getNextEntry and getDelayForNext for naive local times
+        covered by table with a bisect of it, falling back to searching
+        outside of it. Pass None to stop using a table. The table must have
+        been built from an equal schedule. Since the answers do not change,
+        interned schedules can use a table too, but the table is then used,
+        or stopped, for every caller sharing the schedule. """
+        if table is not None and self.zone is not None:
+            raise ValueError('FireTables are only built in local time')
+        
+        if table is not None and self._seconds != (0,):
+            raise ValueError('FireTables only hold whole minutes')
+        
+        if table is not None and table.key != _tableKey(self):
+            raise ValueError('FireTable was built for a different schedule')
+        
+        self._table = table
+
+
+class EntryCursor(object):
+    """ A cursor over the entries of a CronSchedule, used by scheduled calls
+    to find each next entry from the one before it.
     
-        if distance is None and not dom_distance is None:
-            distance = dom_distance
+    The cursor keeps the last entry it returned, as a POSIX timestamp and as
+    the calendar fields it was found from. When that entry has passed, the
+    next one is found by bumping the second, minute or hour of those fields
+    with the tables, searching only when the day has no entries left, and
+    hours already converted by time.mktime are not converted again, so each
+    step costs a few lookups however the schedule is shaped. Only when the
+    next entry has also passed, because the clock drifted or jumped past the
+    cursor, or on first use, does it search from the calendar fields of now.
+    The cursor belongs to one user while the schedule, which it does not
+    modify, may be interned and shared. """
+    zope.interface.implements(ISchedule)
+    __slots__ = ('schedule', 'entry', '_fields', '_hour', '_base')
     
-        return current.replace(day=distance + 1)
-  
-    def _getNextDay(self, current):
-        all_doms = False
-        all_dows = False
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.entry = None
+        self._fields = None
+        # The local hour last converted with time.mktime and its timestamp
+        self._hour = None
+        self._base = None
     
-        if len(self._doms) == 31:
-            all_doms = True
+    def getDelayForNext(self, now=None):
+        """ Return the seconds from now, a POSIX timestamp that defaults to
+        the current time, until the next entry. """
+        if now is None:
+            now = time.time()
         
-        if len(self._dows) == 7:
-            all_dows = True
+        entry = self.entry
         
-        dows = self._dows
+        if entry is not None and entry > now:
+            return entry - now
         
-        if dows[0] == 0:
-            import copy
-            dows = copy.copy(dows)
-            del dows[0]
-            dows.append(7)
+        if self._fields is not None:
+            entry = self._step(self._fields, entry, True)
+            
+            if entry > now:
+                return entry - now
         
-        # If the current day is a valid option, try to parse for the next valid hour
-        if ((all_doms and all_dows) or
-            (current.day in self._doms) or
-            (current.isoweekday() in dows)):
-            try:
-                return self._getNextHour(current)
-            except NoMatch:
-                pass
+        entry = self._step(self._fieldsAt(now), int(now // 1), False)
+        return entry - now
+    
+    def _fieldsAt(self, now):
+        """ Return the calendar fields of now in the zone of the schedule. """
+        transitions = self.schedule._transitions
         
-        distance = None
+        if transitions is None:
+            return time.localtime(now)[:6]
+        
+        last = int(now // 1)
+        return datetime.datetime.utcfromtimestamp(
+            last + transitions.utcoffset(last)).timetuple()[:6]
     
-        if all_doms and all_dows:
-            distance = 1
-        else:
-            dow_distance = None
-            dom_distance = None
-          
-            if not all_dows:
-                current_dow = current.isoweekday()
+    def _step(self, fields, last, matched):
+        """ Move to the first entry after the calendar fields, which are an
+        entry when matched is true, that resolves to a moment after last,
+        skipping local times that resolve to no moment or to one already
+        passed, as CronSchedule._iterZone does. """
+        schedule = self.schedule
+        transitions = schedule._transitions
+        
+        while True:
+            if matched:
+                fields = self._after(fields)
+            else:
+                fields = schedule._findTime(*fields)
+                matched = True
             
-                for dow in dows:
-                    if dow > current_dow:
-                        dow_distance = dow-current_dow
-                        break
-                
-                if dow_distance is None:
-                    dow_distance = dows[0]+7-current_dow
-          
-            if not all_doms:
-                for dom in self._doms:
-                    if dom > current.day:
-                        dom_distance = dom - current.day
-                        break
-          
-            if not dow_distance is None and dom_distance is not None:
-                if dow_distance <= dom_distance:
-                    distance = dow_distance
-                else:
-                    distance = dom_distance
-          
-            if distance is None and dow_distance is not None:
-                distance = dow_distance
-          
-            if distance is None and dom_distance is not None:
-                distance = dom_distance
-          
-            if distance is None or distance <= 0:
-                raise NoMatch('no matching days in month')
-          
-        next_day = (current.replace(hour=self._hours[0],
-                                    minute=self._minutes[0]) + 
-                    distance * datetime.timedelta(days=1))
+            if fields is None:
+                raise NoMatch('no matching entry after %s' % (last,))
+            
+            year, month, day, hour, minute, second = fields
+            
+            if transitions is not None:
+                entry = transitions.resolve(
+                    timezone.wallSeconds(year, month, day, hour, minute) +
+                    second, schedule.ambiguous, schedule.missing)
+            else:
+                if fields[:4] != self._hour:
+                    self._hour = fields[:4]
+                    self._base = int(time.mktime((year, month, day, hour, 0,
+                                                  0, 0, 0, -1)))
+                entry = self._base + minute * 60 + second
+            
+            if entry is not None and entry > last:
+                self._fields = fields
+                self.entry = entry
+                return entry
+    
+    def _after(self, fields):
+        """ Return the calendar fields of the entry after an entry, bumping
+        the second, minute or hour with the tables while the day has entries
+        left and only searching for a later day, as _iterTimes does. """
+        schedule = self.schedule
+        year, month, day, hour, minute, second = fields
+        next = schedule._secondNext[second + 1]
         
-        if next_day.month != current.month:
-          raise NoMatch('no remaining days in the current month')
+        if next is not None:
+            return year, month, day, hour, minute, next
         
-        return next_day
-  
-    def _getNextHour(self, current):
-        if current.hour in self._hours:
-            try:
-                return self._getNextMinute(current)
-            except NoMatch:
-                pass
-    
-        for hour in self._hours:
-            if hour > current.hour:
-                return current.replace(hour=hour,minute=self._minutes[0])
-        
-        raise NoMatch('no remaining hours in the current day')
-  
-    def _getNextMinute(self, current):
-        for minute in self._minutes:
-            if minute > current.minute:
-                return current.replace(minute=minute)
-    
-        raise NoMatch('no remaining minutes in the current hour')
-  
-    def getNextEntry(self,current=None):
-        if current is None:
-            current = datetime.datetime.now()
+        first_second = schedule._seconds[0]
+        next = schedule._minuteNext[minute + 1]
         
-        if not isinstance(current,datetime.datetime):
-            raise ValueError('current value must be a datetime.datetime object')
+        if next is not None:
+            return year, month, day, hour, next, first_second
         
-        return self._getNextMonth(current.replace(second=0,microsecond=0))
-    
-    def getDelayForNext(self):
-        next = self.getNextEntry()
+        next = schedule._hourNext[hour + 1]
+        
+        if next is not None:
+            return (year, month, day, next, schedule._minuteNext[0],
+                    first_second)
+        
+        entry = schedule._findEntry(year, month, day + 1, 0, 0)
+        
+        if entry is None:
+            return None
         
-        return time.mktime(next.timetuple()) - time.time()
+        return entry + (first_second,)
+    
+    def __repr__(self):
+        return 'EntryCursor(%r)' % (self.schedule,)
 
 
 class InvalidCronLine(Exception):
@@ -251,17 +689,235 @@ class InvalidCronEntry(Exception):
 class NoMatch(Exception):
   pass
 
-_cronStepRe = re.compile('^\*/(?P<step>\d{1,2})$')
-_cronRangeRe = re.compile('^(?P<begin>\d{1,2})-(?P<end>\d{1,2})$')
-_cronRangeStepRe = re.compile('^(?P<begin>\d{1,2})-(?P<end>\d{1,2})/(?P<step>\d{1,2})$')
+# One comma separated item of a cron entry: a star with an optional step, a
+# range of numbers or names with an optional step, or a single name
+_cronItemRe = re.compile(r'''^(?:
+    \*(?:/(?P<starStep>\d{1,2}))? |
+    (?P<begin>\d{1,2}|[a-z]{3})-(?P<end>\d{1,2}|[a-z]{3})
+        (?:/(?P<step>\d{1,2}))? |
+    (?P<name>[a-z]{3})
+)$''', re.VERBOSE | re.IGNORECASE)
+
+_MONTH_NAMES = dict((name, number + 1) for number, name in enumerate(
+        ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct',
+         'nov', 'dec')))
+_DOW_NAMES = dict((name, number) for number, name in enumerate(
+        ('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat')))
+
+# The lines the @ shortcuts stand for
+_SHORTCUTS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+# Parsed entries by (entry, min, max), since crontabs repeat the same few
+# entries on many lines
+_entryCache = {}
+_ENTRY_CACHE_SIZE = 4096
+
+# Most candidate months CronSchedule._findEntry examines, see its docstring
+_SEARCH_MONTHS = 13
+
+# Days in each month of a common year and the most days each month can have,
+# indexed by month
+_MONTH_DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_MONTH_MAX_DAYS = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Day of the week offsets of the first of each month, indexed by month
+_MONTH_OFFSETS = (0, 0, 3, 2, 5, 0, 3, 5, 1, 4, 6, 2, 4)
+
+# Masks of the days of months with 0 to 31 days, bit n being day n + 1
+_DAY_MASKS = tuple((1 << days) - 1 for days in range(32))
+
+# The fewest distinct schedules CronSchedule.getDelaysForNext searches with
+# array operations
+_ARRAY_BATCH = 64
+
+# The masks _arrayDelays reads from each schedule
+_arrayMasks = operator.attrgetter('_minuteMask', '_hourMask', '_monthMask')
+_arrayDayMasks = operator.attrgetter('_dayMasks')
+
+_fieldTables = {}
+_dowDayMasks = {}
+
+def _firstWeekday(year, month):
+    """Return the day of the week of the first of a month, 0 being Sunday.
+    
+    >>> _firstWeekday(2011, 1), _firstWeekday(2012, 3), _firstWeekday(2100, 3)
+    (6, 4, 1)
+    """
+    if month < 3:
+        year -= 1
+    return (year + year // 4 - year // 100 + year // 400 +
+            _MONTH_OFFSETS[month] + 1) % 7
+
+def _monthDays(year, month):
+    """Return the mask of the days in a month.
+    
+    >>> bin(_monthDays(2012, 2)), bin(_monthDays(2100, 2))
+    ('0b11111111111111111111111111111', '0b1111111111111111111111111111')
+    """
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return _DAY_MASKS[29]
+    return _DAY_MASKS[_MONTH_DAYS[month]]
+
+def _fullMask(min, max):
+    return (1 << (max - min + 1)) - 1
+
+def _compileField(values, min, max):
+    """Compile a sorted list of values from parseCronEntry into an integer
+    bitmask and a lookup table. The table is indexed by value from 0 to max + 1
+    and holds the first member at or after that value, or None once the
+    members are exhausted. Tables are shared between schedules with the same
+    field.
+    
+    >>> mask, table = _compileField([1, 3], 0, 4)
+    >>> bin(mask)
+    '0b1010'
+    >>> table
+    (1, 1, 3, 3, None, None)
+    """
+    mask = 0
+    for value in values:
+        mask |= 1 << (value - min)
+    
+    key = (mask, min, max)
+    table = _fieldTables.get(key)
+    
+    if table is None:
+        table = [None] * (max + 2)
+        next = None
+        for value in range(max, -1, -1):
+            if value >= min and mask >> (value - min) & 1:
+                next = value
+            table[value] = next
+        table = _fieldTables.setdefault(key, tuple(table))
+    
+    return mask, table
+
+def _compileFields(fields):
+    """Compile the fields returned by _parseCronFields into the masks and
+    tables used by CronSchedule. """
+    second_mask, second_next = _compileField(fields.get('seconds', (0,)), 0,
+                                             59)
+    minute_mask, minute_next = _compileField(fields['minutes'], 0, 59)
+    hour_mask, hour_next = _compileField(fields['hours'], 0, 23)
+    dom_mask, dom_next = _compileField(fields['doms'], 1, 31)
+    month_mask, month_next = _compileField(fields['months'], 1, 12)
+    dow_mask = _compileField(fields['dows'], 0, 6)[0]
+    
+    return (second_mask, second_next, minute_mask, minute_next, hour_mask,
+            hour_next, dom_mask, dom_next, month_mask, month_next, dow_mask,
+            _compileDayMasks(dom_mask, dow_mask), dom_mask == _fullMask(1, 31),
+            dow_mask == _fullMask(0, 6))
+
+def _compileDayMasks(dom_mask, dow_mask):
+    """Return a table indexed by the day of the week of the first of a month
+    (0 is Sunday) holding the mask of the days of a 31 day month that match
+    the days of the month and the days of the week. When both are restricted
+    a day matching either one matches, otherwise only the restricted field is
+    considered. Tables of the days of the week alone are shared.
+    
+    >>> [bin(mask) for mask in _compileDayMasks(1, 0b0000010)[:2]]
+    ['0b100000010000001000000100000011', '0b10000001000000100000010000001']
+    """
+    all_doms = dom_mask == _fullMask(1, 31)
+    all_dows = dow_mask == _fullMask(0, 6)
+    
+    if all_dows:
+        return (dom_mask,) * 7
+    
+    table = _dowDayMasks.get(dow_mask)
+    
+    if table is None:
+        table = []
+        for first in range(7):
+            mask = 0
+            for day in range(31):
+                if dow_mask >> ((first + day) % 7) & 1:
+                    mask |= 1 << day
+            table.append(mask)
+        table = _dowDayMasks.setdefault(dow_mask, tuple(table))
+    
+    if all_doms:
+        return table
+    
+    return tuple(dom_mask | mask for mask in table)
+
+_whitespaceRe = re.compile('\s+')
+
+class ParseCache(object):
+    """A bounded least recently used cache of parsed cron lines, keyed by the
+    normalized cron line. The hits and misses attributes count lookups since
+    the cache was created or last cleared.
+    
+    >>> cache = ParseCache(maxsize=2)
+    >>> cache.lookup('* * * * *')[0]['minutes'] == tuple(range(0, 60))
+    True
+    >>> cache.lookup('0 * * * *')[0]['minutes']
+    (0,)
+    >>> cache.lookup('* * * * *')[0]['months']
+    (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12)
+    >>> cache.lookup('5 * * * *')[0]['minutes']
+    (5,)
+    >>> sorted(cache.info().items())
+    [('hits', 1), ('maxsize', 2), ('misses', 3), ('size', 2)]
+    """
+    
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+    
+    def info(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize}
+    
+    def lookup(self, line):
+        """Return the parsed fields of a normalized cron line as a dictionary
+        of sorted tuples along with their compiled form, parsing the line if
+        it is not cached. The dictionary is shared and must not be
+        modified. """
+        entries = self._entries
+        
+        try:
+            entry = entries.pop(line)
+        except KeyError:
+            self.misses += 1
+            fields = _parseCronFields(line)
+            entry = (fields, _compileFields(fields))
+        else:
+            self.hits += 1
+        
+        if self.maxsize > 0:
+            entries[line] = entry
+            
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+        
+        return entry
+
+parseCache = ParseCache()
 
 def parseCronLine(line):
     """
     Parse a standard cron string (minus the command) and return them as a
     dictionary. The syntax for this was pulled from the
     Wikipedia page: http://en.wikipedia.org/wiki/Cron
-    Currently, there is no support for textual days of the week
-    (i.e. Monday,Tuesday).
     
     Examples:
     
@@ -273,7 +929,26 @@ def parseCronLine(line):
     ...      'months': range(1,13)}
     True
     
-    Cron lines must have 5 whitespace separated entries
+    Lines with 6 entries start with the seconds
+    >>> parseCronLine('*/20 0 0 * * *')['seconds']
+    [0, 20, 40]
+    
+    Months and days of the week may be given by their English abbreviations
+    >>> fields = parseCronLine('0 9 * jan-Mar MON,wed,FRI')
+    >>> fields['months'], fields['dows']
+    ([1, 2, 3], [1, 3, 5])
+    
+    The shortcuts @yearly, @annually, @monthly, @weekly, @daily, @midnight
+    and @hourly stand for the lines they name
+    >>> parseCronLine('@weekly') == parseCronLine('0 0 * * 0')
+    True
+    
+    >>> parseCronLine('@reboot')
+    Traceback (most recent call last):
+    ...
+    InvalidCronLine: Unsupported cron shortcut: @reboot
+    
+    Cron lines must have 5 or 6 whitespace separated entries
     >>> parseCronLine('* * * *')
     Traceback (most recent call last):
     ...
@@ -291,29 +966,61 @@ def parseCronLine(line):
     ...
     InvalidCronLine: Cron line must be a string
     
+    Parsed lines are kept in parseCache, keyed by the line with whitespace
+    normalized, so repeated lines are only parsed once.
+    
     """
+    fields = parseCache.lookup(_normalizeCronLine(line))[0]
+    
+    return dict((name, list(values)) for name, values in fields.iteritems())
+
+def _normalizeCronLine(line):
     if not line:
         raise InvalidCronLine('Empty cron line provided')
     
     if not isinstance(line, basestring):
         raise InvalidCronLine('Cron line must be a string')
     
-    line = re.split('\s+',line.strip())
+    return ' '.join(_whitespaceRe.split(line.strip()))
+
+def _parseCronFields(line):
+    """Parse a normalized cron line into a dictionary of sorted tuples. Lines
+    with six fields start with the seconds. """
+    text = line
     
-    if len(line) != 5:
+    if line.startswith('@'):
+        try:
+            line = _SHORTCUTS[line.lower()]
+        except KeyError:
+            raise InvalidCronLine('Unsupported cron shortcut: %s' % (text,))
+    
+    line = line.split(' ')
+    
+    if len(line) not in (5, 6):
         raise InvalidCronLine('Improper number of elements encountered: %s' % len(line)) 
       
     schedule = {}
+    
+    if len(line) == 6:
+        schedule['seconds'] = _parseEntry(line[0],0,59)
+        line = line[1:]
       
-    schedule['minutes'] = parseCronEntry(line[0],0,59)
-    schedule['hours']   = parseCronEntry(line[1],0,23)
-    schedule['doms']    = parseCronEntry(line[2],1,31)
-    schedule['months']  = parseCronEntry(line[3],1,12)
-    schedule['dows']    = parseCronEntry(line[4],0,6)
+    schedule['minutes'] = _parseEntry(line[0],0,59)
+    schedule['hours']   = _parseEntry(line[1],0,23)
+    schedule['doms']    = _parseEntry(line[2],1,31)
+    schedule['months']  = _parseEntry(line[3],1,12,_MONTH_NAMES)
+    schedule['dows']    = _parseEntry(line[4],0,6,_DOW_NAMES)
+    
+    # Only the days of the month can rule out every day, and only when the
+    # days of the week are unrestricted
+    if (len(schedule['dows']) == 7 and
+        schedule['doms'][0] > max([_MONTH_MAX_DAYS[month] for month in
+                                   schedule['months']])):
+        raise InvalidCronLine('Cron line never matches: %s' % (text,))
       
     return schedule
 
-def parseCronEntry(entry,min,max):
+def parseCronEntry(entry,min,max,names=None):
     """Parse a single cron entry for something like hours or minutes from a cron
     scheduling line.  The given min and max are used to verify that results are
     in the proper range. The following formats are supports:
@@ -321,6 +1028,8 @@ def parseCronEntry(entry,min,max):
     */5 => Only those values in the available range that are divisible by five
     1-5 => The range of 1-5
     And any combination of the above using commas to separate the entries.
+    Where names maps lower case names to values, names may be used in place
+    of numbers, in any case.
     
     Examples:
     
@@ -364,6 +1073,15 @@ def parseCronEntry(entry,min,max):
     >>> parseCronEntry('*/5,1,12-14,22-28/3',1,30)
     [1, 5, 10, 12, 13, 14, 15, 20, 24, 25, 27, 30]
     
+    Named entries
+    >>> parseCronEntry('Sat,sun-TUE', 0, 6, _DOW_NAMES)
+    [0, 1, 2, 6]
+    
+    >>> parseCronEntry('mon-fry', 0, 6, _DOW_NAMES)
+    Traceback (most recent call last):
+      ...
+    InvalidCronEntry: Unknown name: fry
+    
     Minimum argument must be convertible to an integer
     >>> parseCronEntry('1','a', 5000)
     Traceback (most recent call last):
@@ -463,15 +1181,43 @@ def parseCronEntry(entry,min,max):
       
     if min < 0:
         raise ValueError('minimum must be non-negative')
-      
-    try:
-        entry = entry.split(',')
-    except AttributeError:
-        raise InvalidCronEntry('Cron entry must be a string')
-      
+    
+    return list(_parseItems(entry, min, max, names))
+
+def _parseEntry(entry, min, max, names=None):
+    """Return the values of a cron entry as a sorted tuple, from the entry
+    cache if it has been parsed before. See parseCronEntry. """
+    key = (entry, min, max)
+    values = _entryCache.get(key)
+    
+    if values is None:
+        values = _parseItems(entry, min, max, names)
+        
+        if len(_entryCache) >= _ENTRY_CACHE_SIZE:
+            _entryCache.clear()
+        
+        _entryCache[key] = values
+    
+    return values
+
+def _parseValue(token, names):
+    if token.isdigit():
+        return int(token)
+    
+    value = (names or {}).get(token.lower())
+    
+    if value is None:
+        raise InvalidCronEntry('Unknown name: %s' % (token,))
+    
+    return value
+
+def _parseItems(entry, min, max, names):
+    """Parse the comma separated items of an entry with one match of
+    _cronItemRe each. Items that do not match are ignored. """
     total = set()
+    match = _cronItemRe.match
       
-    for e in entry:
+    for e in entry.split(','):
         try:
             int_val = int(e)
         except ValueError:
@@ -480,41 +1226,28 @@ def parseCronEntry(entry,min,max):
             total.add(int_val)
             continue
         
-        begin = None
-        end = None
-        step = 1
-        
-        if e == '*':
-            begin = min
-            end = max + 1
+        item = match(e)
         
-        if begin is None:
-            #If this match works, then it is of the form */int
-            match = _cronStepRe.search(e)
+        if item is None:
+            continue
         
-            if not match is None:
-                begin = min
-                end = max + 1
-                step = int(match.group('step'))
-            
-        if begin is None:
-            match = _cronRangeRe.search(e)
+        begin, end, step, starStep, name = item.group('begin', 'end', 'step',
+                                                      'starStep', 'name')
         
-            if not match is None:
-                begin = int(match.group('begin'))
-                end = int(match.group('end')) + 1
-                step = 1
+        if name is not None:
+            total.add(_parseValue(name, names))
+            continue
         
         if begin is None:
-            match = _cronRangeStepRe.search(e)
-          
-            if not match is None:
-                begin = int(match.group('begin'))
-                end = int(match.group('end')) + 1
-                step = int(match.group('step'))
+            begin = min
+            end = max + 1
+            step = int(starStep or 1)
+        else:
+            begin = _parseValue(begin, names)
+            end = _parseValue(end, names) + 1
+            step = int(step or 1)
         
-        if (begin is not None and begin < end and step > 0 and 
-            begin >= min and end <= max + 1):
+        if (begin < end and step > 0 and begin >= min and end <= max + 1):
             
             # need to align the start properly
             while begin % step != 0 and begin < end:
@@ -524,21 +1257,355 @@ def parseCronEntry(entry,min,max):
                 raise InvalidCronEntry('Invalid range or step specified: %s' % (e))
           
             total.update(range(begin,end,step))
-        elif not begin is None:
+        else:
             raise InvalidCronEntry('Invalid range or step specified: %s' % (e))
       
     if len(total) == 0:
         raise InvalidCronEntry('Invalid cron entry')
       
-    total = list(total)
-    total.sort()
+    total = sorted(total)
       
-    if total[0] < min or total[len(total)-1] > max:
-        raise InvalidCronEntry('Value, %s-%s, out of allowed range: %s-%s' % (total[0],total[len(total)-1],min,max))
+    if total[0] < min or total[-1] > max:
+        raise InvalidCronEntry('Value, %s-%s, out of allowed range: %s-%s' % (total[0],total[-1],min,max))
       
-    return total
+    return tuple(total)
+
+
+def evaluateSchedules(schedules, start, end, chunk=1024):
+    """Return every entry of the given CronSchedules after start and up to and
+    including end as an array of (schedule index, timestamp) rows. Timestamps
+    are POSIX timestamps of the local times getNextEntry would return. Rows
+    are ordered by schedule index and then by timestamp.
+    
+    The window is decomposed into hour slots once and each chunk of schedules
+    is tested against all of the slots with array operations, so this
+    requires numpy.
+    """
+    if numpy is None:
+        raise ImportError('evaluateSchedules requires numpy')
+    
+    if [schedule for schedule in schedules if schedule.zone is not None]:
+        raise ValueError('evaluateSchedules only supports local time')
+    
+    if [schedule for schedule in schedules if schedule._seconds != (0,)]:
+        raise ValueError('evaluateSchedules only supports whole minutes')
+    
+    if (not isinstance(start, datetime.datetime) or
+        not isinstance(end, datetime.datetime)):
+        raise ValueError('start and end must be datetime.datetime objects')
+    
+    # Hour slots covering the window, with the minutes allowed in each
+    first = slot = start.replace(minute=0, second=0, microsecond=0)
+    last = end.replace(minute=0, second=0, microsecond=0)
+    slots = []
+    
+    while slot <= last:
+        low = 0
+        high = 59
+        
+        if slot == first:
+            low = start.minute + 1
+        
+        if slot == last:
+            high = end.minute
+        
+        slots.append((slot.day - 1, slot.month - 1, slot.isoweekday() % 7,
+                      slot.hour, low, high,
+                      time.mktime((slot.year, slot.month, slot.day, slot.hour,
+                                   0, 0, 0, 0, -1))))
+        slot += datetime.timedelta(hours=1)
+    
+    if not slots or not schedules:
+        return numpy.zeros((0, 2), dtype=numpy.int64)
+    
+    slots = numpy.array(slots, dtype=numpy.int64)
+    slot_dom, slot_month, slot_dow, slot_hour, slot_low, slot_high, slot_base = (
+        slots.T)
+    minutes = numpy.arange(60, dtype=numpy.int64)
+    
+    masks = numpy.array([(s._minuteMask, s._hourMask, s._domMask,
+                          s._monthMask, s._dowMask, s._allDoms, s._allDows)
+                         for s in schedules], dtype=numpy.int64)
+    rows = []
+    
+    for offset in range(0, len(masks), chunk):
+        minute_mask, hour_mask, dom_mask, month_mask, dow_mask, all_doms, \
+            all_dows = masks[offset:offset + chunk].T[:, :, None]
+        
+        dom_ok = (dom_mask >> slot_dom) & 1 == 1
+        dow_ok = (dow_mask >> slot_dow) & 1 == 1
+        day_ok = numpy.where(all_doms & all_dows, True,
+                             numpy.where(all_doms, dow_ok,
+                                         numpy.where(all_dows, dom_ok,
+                                                     dom_ok | dow_ok)))
+        ok = (day_ok &
+              ((month_mask >> slot_month) & 1 == 1) &
+              ((hour_mask >> slot_hour) & 1 == 1))
+        
+        index, hour = numpy.nonzero(ok)
+        
+        minute_ok = (((minute_mask[index, 0][:, None] >> minutes) & 1 == 1) &
+                     (minutes >= slot_low[hour][:, None]) &
+                     (minutes <= slot_high[hour][:, None]))
+        match, minute = numpy.nonzero(minute_ok)
+        
+        rows.append(numpy.column_stack((index[match] + offset,
+                                        slot_base[hour[match]] + minute * 60)))
+    
+    return numpy.concatenate(rows)
+
+def _lowestBits(masks):
+    """ Return the positions of the lowest set bits of non-zero masks. """
+    return numpy.log2(masks & -masks).astype(numpy.int64)
+
+def _arrayDelays(schedules, now):
+    """Return the delays before the next entries after now of whole minute
+    CronSchedules in local time, or None for those without an entry in
+    _SEARCH_MONTHS candidate months.
+    
+    The schedules are searched together with array operations, one step at
+    a time as _findEntry searches one: the rest of the current hour and the
+    later hours of today are found with bit operations on the masks, then
+    the matching days of each candidate month with the day masks of its
+    first weekday, for the schedules not found yet. After today an entry is
+    at the first hour and minute of its day. The calendar fields of now and
+    of each month are found once, and the timestamps of local hours come
+    from time.mktime, as in CronSchedule.iterEntries, once for each hour
+    found. """
+    count = len(schedules)
+    result = [None] * count
+    
+    if not count:
+        return result
+    
+    minute_mask, hour_mask, month_mask = numpy.fromiter(
+        itertools.chain.from_iterable(map(_arrayMasks, schedules)),
+        numpy.int64, count * 3).reshape(-1, 3).T
+    day_masks = numpy.fromiter(
+        itertools.chain.from_iterable(map(_arrayDayMasks, schedules)),
+        numpy.int64, count * 7).reshape(-1, 7)
+    first_hour = _lowestBits(hour_mask)
+    first_minute = _lowestBits(minute_mask)
+    
+    # The day, as an ordinal, hour and minute of each entry found
+    start = datetime.datetime.fromtimestamp(now)
+    ordinal = numpy.zeros(count, dtype=numpy.int64)
+    hour = first_hour.copy()
+    minute = first_minute.copy()
+    
+    today = (((day_masks[:, _firstWeekday(start.year, start.month)] >>
+               (start.day - 1)) & 1 == 1) &
+             ((month_mask >> (start.month - 1)) & 1 == 1))
+    minutes = minute_mask & ~numpy.int64((1 << (start.minute + 1)) - 1)
+    index = numpy.nonzero(today & ((hour_mask >> start.hour) & 1 == 1) &
+                          (minutes != 0))[0]
+    ordinal[index] = start.toordinal()
+    hour[index] = start.hour
+    minute[index] = _lowestBits(minutes[index])
+    
+    hours = hour_mask & ~numpy.int64((1 << (start.hour + 1)) - 1)
+    index = numpy.nonzero(today & (ordinal == 0) & (hours != 0))[0]
+    ordinal[index] = start.toordinal()
+    hour[index] = _lowestBits(hours[index])
+    
+    pending = numpy.nonzero(ordinal == 0)[0]
+    year, month, day = start.year, start.month, start.day + 1
+    
+    for i in xrange(_SEARCH_MONTHS):
+        if not len(pending):
+            break
+        
+        days = numpy.where((month_mask[pending] >> (month - 1)) & 1 == 1,
+                           (day_masks[pending, _firstWeekday(year, month)] &
+                            _monthDays(year, month)) >> (day - 1), 0)
+        hit = days != 0
+        index = pending[hit]
+        ordinal[index] = (datetime.date(year, month, 1).toordinal() + day - 1 +
+                          _lowestBits(days[hit]))
+        pending = pending[~hit]
+        
+        year, month, day = year + month // 12, month % 12 + 1, 1
+    
+    found = numpy.nonzero(ordinal)[0]
+    keys, inverse = numpy.unique(ordinal[found] * 24 + hour[found],
+                                 return_inverse=True)
+    bases = []
+    
+    for key in keys.tolist():
+        date = datetime.date.fromordinal(key // 24)
+        bases.append(time.mktime((date.year, date.month, date.day, key % 24,
+                                  0, 0, 0, 0, -1)))
+    
+    delays = numpy.array(bases)[inverse] + minute[found] * 60 - now
+    
+    for index, delay in zip(found.tolist(), delays.tolist()):
+        result[index] = delay
+    
+    return result
+
+def _tableKey(schedule):
+    return (schedule._minuteMask, schedule._hourMask, schedule._domMask,
+            schedule._monthMask, schedule._dowMask)
+
+class _MappedMinutes(object):
+    """A read-only sequence of the little-endian unsigned 32 bit integers
+    in a buffer, read in place so mapped files are not copied. """
+    
+    def __init__(self, data, offset, count):
+        self.data = data
+        self.offset = offset
+        self.count = count
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        
+        if not 0 <= index < self.count:
+            raise IndexError('minute index out of range')
+        
+        return _unpackMinute(self.data, self.offset + 4 * index)[0]
+
+_unpackMinute = struct.Struct('<I').unpack_from
+
+# Magic, format version, schedule masks, time.timezone, time.altzone and the
+# first and last minutes covered
+_tableHeader = struct.Struct('<4sI5QiiII')
+_TABLE_MAGIC = 'TXFT'
+_TABLE_VERSION = 1
+
+class FireTable(object):
+    """The entries of a CronSchedule in the minutes from start up to end,
+    as a sorted sequence of POSIX timestamps divided by 60. Entries are
+    local times, so a table is only valid in the timezone it was built in.
+    
+    Tables are saved as a header followed by the minutes as little-endian
+    unsigned 32 bit integers. Loading one maps the file read-only, so
+    processes loading the same file share one copy of it.
+    
+    @ivar key: The masks of the schedule the table was built from.
+    """
+    
+    def __init__(self, key, minutes, start, end):
+        self.key = key
+        self.minutes = minutes
+        self.start = start
+        self.end = end
+        self._map = None
+    
+    @classmethod
+    def build(cls, schedule, year):
+        """Return the table of the entries of a CronSchedule in year. """
+        if schedule.zone is not None:
+            raise ValueError('FireTables are only built in local time')
+        
+        if schedule._seconds != (0,):
+            raise ValueError('FireTables only hold whole minutes')
+        
+        start = int(time.mktime((year, 1, 1, 0, 0, 0, 0, 0, -1)) // 60)
+        end = int(time.mktime((year + 1, 1, 1, 0, 0, 0, 0, 0, -1)) // 60)
+        minutes = array.array('I')
+        
+        for timestamp in schedule.iterEntries(
+            datetime.datetime(year - 1, 12, 31, 23, 59), timestamps=True):
+            minute = int(timestamp // 60)
+            if minute >= end:
+                break
+            minutes.append(minute)
+        
+        # Repeated hours when daylight saving time ends can put entries out
+        # of order
+        minutes = array.array('I', sorted(set(minutes)))
+        
+        return cls(_tableKey(schedule), minutes, start, end)
+    
+    @classmethod
+    def load(cls, path):
+        """Map a table saved by save. Raises ValueError if the file is not
+        a table or was saved in a different timezone. """
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        try:
+            header = _tableHeader.unpack_from(data)
+        except struct.error:
+            data.close()
+            raise ValueError('Not a FireTable: %s' % (path,))
+        
+        magic, version = header[:2]
+        key = header[2:7]
+        timezone, altzone, start, end = header[7:]
+        
+        if magic != _TABLE_MAGIC or version != _TABLE_VERSION:
+            data.close()
+            raise ValueError('Not a FireTable: %s' % (path,))
+        
+        if (timezone, altzone) != (time.timezone, time.altzone):
+            data.close()
+            raise ValueError('FireTable was saved in a different timezone: %s'
+                             % (path,))
+        
+        table = cls(key, _MappedMinutes(data, _tableHeader.size,
+                                        (len(data) - _tableHeader.size) // 4),
+                    start, end)
+        table._map = data
+        
+        return table
+    
+    def save(self, path):
+        minutes = self.minutes
+        
+        if not isinstance(minutes, array.array):
+            minutes = array.array('I', minutes)
+        
+        if sys.byteorder != 'little':
+            minutes = array.array('I', minutes)
+            minutes.byteswap()
+        
+        with open(path, 'wb') as f:
+            f.write(_tableHeader.pack(_TABLE_MAGIC, _TABLE_VERSION,
+                                      *(self.key + (time.timezone,
+                                                    time.altzone,
+                                                    self.start, self.end))))
+            minutes.tofile(f)
+    
+    def close(self):
+        """Unmap a loaded table. It cannot be used afterwards. """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+    
+    def __len__(self):
+        return len(self.minutes)
+    
+    def getNextMinute(self, minute):
+        """Return the first entry after minute, or None if the table does
+        not cover the minutes after it.
+        
+        >>> table = FireTable(None, [10, 20, 30], 5, 35)
+        >>> table.getNextMinute(10), table.getNextMinute(29)
+        (20, 30)
+        >>> table.getNextMinute(3), table.getNextMinute(30)
+        (None, None)
+        """
+        if not self.start - 1 <= minute < self.end:
+            return None
+        
+        minutes = self.minutes
+        index = bisect.bisect_right(minutes, minute)
+        
+        if index == len(minutes):
+            return None
+        
+        return minutes[index]
 
 __all__ = [
     'CronSchedule',
-    'InvalidCronLine'
+    'EntryCursor',
+    'FireTable',
+    'InvalidCronLine',
+    'evaluateSchedules',
+    'parseCache'
 ]
\ No newline at end of file
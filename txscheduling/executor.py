@@ -0,0 +1,316 @@
+import cPickle as pickle
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+from logging import getLogger
+from multiprocessing.queues import SimpleQueue
+
+import zope.interface
+
+from twisted.internet import defer, task, threads
+from twisted.python import failure, threadpool
+
+from txscheduling.interfaces import IExecutor
+
+
+
+""" This module provides implementations of the
+txscheduling.interfaces.IExecutor interface for running the functions of
+scheduled calls on the reactor thread, in a thread pool or in a pool of
+worker processes. """
+
+log = getLogger('txscheduling.executor')
+
+class ReactorExecutor(object):
+    """Run functions on the reactor thread. This is what a ScheduledCall does
+    without an executor. """
+    zope.interface.implements(IExecutor)
+
+    def run(self, f, *a, **kw):
+        return defer.maybeDeferred(f, *a, **kw)
+
+    def __repr__(self):
+        return 'ReactorExecutor()'
+
+
+class ThreadExecutor(object):
+    """Run functions in a dedicated thread pool.
+
+    The pool is started when the reactor starts running and stopped when it
+    shuts down.
+
+    @ivar pool: The L{twisted.python.threadpool.ThreadPool} functions run in.
+    """
+    zope.interface.implements(IExecutor)
+
+    def __init__(self, size=4, reactor=None, name='txscheduling'):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.pool = threadpool.ThreadPool(minthreads=0, maxthreads=size,
+                                          name=name)
+        self.reactor.callWhenRunning(self.start)
+        self.reactor.addSystemEventTrigger('during', 'shutdown', self.stop)
+
+    def run(self, f, *a, **kw):
+        return threads.deferToThreadPool(self.reactor, self.pool, f, *a, **kw)
+
+    def start(self):
+        if not self.pool.started:
+            self.pool.start()
+
+    def stop(self):
+        if self.pool.started:
+            self.pool.stop()
+
+    def __repr__(self):
+        return 'ThreadExecutor(%d)' % (self.pool.max,)
+
+
+def _initWorker():
+    # Workers inherit the signal handlers the reactor installs in the parent,
+    # which would keep them from exiting when the pool terminates them.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+# The queue a worker of a ProcessExecutor reports the tasks it starts to
+_started = None
+
+def _initProcessWorker(started):
+    global _started
+    _initWorker()
+    _started = started
+
+
+def _callPickled(data, taskId=None):
+    """Call a pickled function in a worker process and return its pickled
+    outcome. Nothing is allowed to escape, since the pool only reports
+    results that it can pass back. """
+    if _started is not None and taskId is not None:
+        _started.put((taskId, os.getpid()))
+
+    try:
+        f, a, kw = pickle.loads(data)
+        outcome = (True, f(*a, **kw))
+    except:
+        outcome = (False, sys.exc_info()[1])
+
+    try:
+        return pickle.dumps(outcome, pickle.HIGHEST_PROTOCOL)
+    except Exception, e:
+        return pickle.dumps((False, RuntimeError(
+                    'Unable to return %r from a worker process: %s' % (
+                        outcome[1], e))),
+                            pickle.HIGHEST_PROTOCOL)
+
+
+class WorkerLost(Exception):
+    """ The worker process running a function exited without a result. """
+
+
+class _ProcessTask(object):
+    """ A function running in a worker of a L{ProcessExecutor}. """
+    __slots__ = ('id', 'f', 'started', 'deferred', 'pid', 'returned')
+
+    def __init__(self, id, f, started):
+        self.id = id
+        self.f = f
+        self.started = started
+        self.deferred = defer.Deferred()
+        # The worker running it, once it has reported starting it
+        self.pid = None
+        self.returned = False
+
+
+class ProcessExecutor(object):
+    """Run functions in a pool of worker processes.
+
+    The workers are forked when the executor is created, so it should be
+    created before the reactor starts running. Functions, their arguments
+    and their results must be picklable, which means functions need to be
+    defined at the top level of a module. Workers are terminated when the
+    reactor shuts down.
+
+    A worker that is killed, such as by the OOM killer, never returns a
+    result, so while functions are running the workers are checked every
+    C{checkInterval} seconds and the deferreds of functions whose worker
+    has exited fail with a L{WorkerLost}. Functions running longer than
+    C{timeout} seconds, if given, fail with a
+    L{twisted.internet.defer.TimeoutError}, although their worker carries
+    on with them.
+
+    @ivar pool: The L{multiprocessing.Pool} functions run in.
+    """
+    zope.interface.implements(IExecutor)
+
+    def __init__(self, size=None, reactor=None, timeout=None,
+                 checkInterval=1.0):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.size = size or multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.checkInterval = checkInterval
+        # Written to synchronously, so a report is not lost with its worker
+        self._started = SimpleQueue()
+        self.pool = multiprocessing.Pool(self.size, _initProcessWorker,
+                                         (self._started,))
+        self._tasks = {}
+        self._taskIds = itertools.count()
+        self._watchdog = task.LoopingCall(self._check)
+        self._watchdog.clock = self.reactor
+        self.reactor.addSystemEventTrigger('during', 'shutdown', self.stop)
+
+    def run(self, f, *a, **kw):
+        if self.pool is None:
+            return defer.fail(RuntimeError('%r has been stopped' % (self,)))
+
+        try:
+            data = pickle.dumps((f, a, kw), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return defer.fail()
+
+        running = _ProcessTask(next(self._taskIds), f, self.reactor.seconds())
+        self._tasks[running.id] = running
+
+        def returned(outcome):
+            # Called in a thread of the pool
+            running.returned = True
+            self.reactor.callFromThread(done, outcome)
+
+        def done(outcome):
+            if self._tasks.pop(running.id, None) is None:
+                # Already failed by the watchdog
+                return
+            succeeded, result = pickle.loads(outcome)
+            if succeeded:
+                running.deferred.callback(result)
+            else:
+                running.deferred.errback(failure.Failure(result))
+
+        self.pool.apply_async(_callPickled, (data, running.id),
+                              callback=returned)
+
+        if not self._watchdog.running:
+            self._watchdog.start(self.checkInterval, now=False)
+
+        return running.deferred
+
+    def _check(self):
+        """ Fail the functions whose worker has exited or that have run for
+        longer than the timeout. """
+        tasks = self._tasks
+
+        if not tasks or self.pool is None:
+            self._watchdog.stop()
+            return
+
+        while not self._started.empty():
+            taskId, pid = self._started.get()
+            if taskId in tasks:
+                tasks[taskId].pid = pid
+
+        alive = set([worker.pid for worker in self.pool._pool
+                     if worker.exitcode is None])
+        now = self.reactor.seconds()
+
+        for running in tasks.values():
+            if running.returned:
+                continue
+
+            if running.pid is not None and running.pid not in alive:
+                error = WorkerLost('The worker process running %r exited' % (
+                        running.f,))
+            elif (self.timeout is not None and
+                  now - running.started > self.timeout):
+                error = defer.TimeoutError('%r ran for longer than %s seconds'
+                                           % (running.f, self.timeout))
+            else:
+                continue
+
+            del tasks[running.id]
+            running.deferred.errback(failure.Failure(error))
+
+    def stop(self):
+        if self._watchdog.running:
+            self._watchdog.stop()
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def __repr__(self):
+        return 'ProcessExecutor(%d)' % (self.size,)
+
+
+_executorFactories = {
+    'reactor': ReactorExecutor,
+    'thread': ThreadExecutor,
+    'process': ProcessExecutor,
+}
+_executors = {}
+
+# Named executors that fork when they are created
+_forking = ('process',)
+
+def createExecutor(name, *a, **kw):
+    """Create the executor shared under one of the names 'reactor', 'thread'
+    or 'process', passing the remaining arguments to its class, and return
+    it. The process pool forks its workers here, so call this before the
+    reactor starts running to use the 'process' executor.
+    """
+    if name not in _executorFactories:
+        raise ValueError('Unknown executor: %r' % (name,))
+
+    stop = getattr(_executors.get(name), 'stop', None)
+    if stop is not None:
+        stop()
+
+    executor = _executors[name] = _executorFactories[name](*a, **kw)
+    return executor
+
+
+def getExecutor(executor):
+    """Return the IExecutor for executor, which is either a provider of
+    IExecutor or one of the names 'reactor', 'thread' or 'process'. A name
+    returns an executor shared by every caller using it, created with the
+    default settings the first time it is asked for. The 'process' executor
+    forks, so once the reactor is running it must already have been made
+    with L{createExecutor}.
+
+    >>> getExecutor('reactor')
+    ReactorExecutor()
+    >>> getExecutor('fork')
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown executor: 'fork'
+    """
+    if IExecutor.providedBy(executor):
+        return executor
+
+    if executor not in _executorFactories:
+        raise ValueError('Unknown executor: %r' % (executor,))
+
+    if executor not in _executors:
+        if executor in _forking:
+            from twisted.internet import reactor
+            if reactor.running:
+                raise RuntimeError(
+                    'The %r executor forks and must be created with '
+                    'createExecutor before the reactor runs' % (executor,))
+
+        _executors[executor] = _executorFactories[executor]()
+
+    return _executors[executor]
+
+__all__ = [
+    'ReactorExecutor',
+    'ThreadExecutor',
+    'ProcessExecutor',
+    'WorkerLost',
+    'createExecutor',
+    'getExecutor'
+]
@@ -15,4 +15,195 @@ class ISchedule(zope.interface.Interface):
         @rtype: C{float}
         @return: The number of seconds to delay before the next execution of
         this schedule.
-        """
\ No newline at end of file
+        """
+
+
+class IWallClockSchedule(ISchedule):
+    """A schedule whose entries are fixed points in wall clock time, such as
+    a cron schedule. The next entry does not depend on when or by whom it is
+    asked for, so every user of an equal schedule can share it. """
+    
+    
+    def iterEntries(self, current=None, timestamps=False):
+        """Generate the entries of this schedule after a time in order.
+        
+        @param current: A C{datetime.datetime} or POSIX timestamp to start
+        after, which defaults to now.
+        
+        @param timestamps: If true, generate POSIX timestamps instead of
+        C{datetime.datetime} objects.
+        """
+
+
+class ICursorSchedule(IWallClockSchedule):
+    """A wall clock schedule that can walk its entries with a cursor, so a
+    user stepping from one entry to the next does not search from scratch
+    each time. The schedule itself keeps no state and may be shared. """
+    
+    
+    def cursor(self):
+        """Return a new cursor over the entries of this schedule.
+        
+        @rtype: L{ISchedule}
+        @return: A provider of L{ISchedule} whose C{getDelayForNext} also
+        takes an optional POSIX timestamp to measure from, and advances from
+        the entry it last returned while that is still ahead of the clock.
+        """
+
+
+class IBatchSchedule(ISchedule):
+    """A schedule that can compute the delays of many schedules of its class
+    at once, sharing the work that does not depend on the schedule, such as
+    reading the clock and breaking the current time into calendar fields. """
+    
+    
+    def getDelaysForNext(self, schedules, now=None):
+        """Return the delays before the next execution of many schedules.
+        
+        @param schedules: A sequence of providers of this interface of the
+        same class as this one.
+        
+        @param now: The POSIX timestamp to measure the delays from, which
+        defaults to a single reading of the clock.
+        
+        @rtype: C{list} of C{float}
+        @return: The number of seconds to delay before the next execution of
+        each schedule, in order.
+        """
+
+
+class ISchedulingClock(zope.interface.Interface):
+    """A clock, providing L{twisted.internet.interfaces.IReactorTime}, that
+    can also share the computation of the next entry between the users of
+    equal schedules. """
+    
+    
+    def getNextTime(self, schedule):
+        """Return the time of the next execution of a schedule.
+        
+        @param schedule: A provider of L{ISchedule}.
+        
+        @rtype: C{float}
+        @return: The time of the next execution in the units of the
+        C{seconds} method of this clock.
+        """
+    
+    
+    def prepare(self, schedules):
+        """Compute the next times of many schedules ahead of calls to
+        L{getNextTime} for them, in batches for those providing
+        L{IBatchSchedule}. Implementations without a cache of next times
+        may do nothing.
+        
+        @param schedules: A sequence of providers of L{ISchedule}.
+        """
+
+
+class IAnchoredClock(ISchedulingClock):
+    """A scheduling clock that maps wall clock time to its own time, such as
+    the monotonic time of a reactor, and reports when the wall clock jumps
+    relative to it. """
+    
+    
+    def wallTime(self):
+        """Return the wall clock time, as a POSIX timestamp, matching the
+        current time of this clock. """
+    
+    
+    def addJumpObserver(self, observer):
+        """Call observer with the seconds the wall clock moved relative to
+        this clock whenever a jump is detected, after the mapping has been
+        updated. """
+    
+    
+    def removeJumpObserver(self, observer):
+        """Stop calling an observer added with L{addJumpObserver}. """
+
+
+class IExecutor(zope.interface.Interface):
+    """An executor runs the function of a scheduled call somewhere, such as
+    the reactor thread, a thread pool or another process. """
+    
+    
+    def run(self, f, *a, **kw):
+        """Call a function with the given arguments.
+        
+        @rtype: L{twisted.internet.defer.Deferred}
+        @return: A Deferred firing with the result of the function, or
+        failing with the exception it raised.
+        """
+
+
+class IScheduledCallObserver(zope.interface.Interface):
+    """An observer of the timing of scheduled calls. """
+    
+    
+    def fired(self, call, lateness, skipped):
+        """Called when a scheduled call fires.
+        
+        @param call: The L{txscheduling.task.ScheduledCall}.
+        
+        @param lateness: The seconds since the call was due.
+        
+        @param skipped: The number of entries that will not be run because
+        the call was late.
+        """
+    
+    
+    def finished(self, call, duration, skipped):
+        """Called when the function of a scheduled call has finished.
+        
+        @param call: The L{txscheduling.task.ScheduledCall}.
+        
+        @param duration: The seconds since the call fired.
+        
+        @param skipped: The number of entries that passed while the function
+        was running.
+        """
+
+
+class IJobStore(zope.interface.Interface):
+    """Persistent state of scheduled calls, so that they can resume after a
+    restart and catch up on the entries missed while they were down. """
+    
+    
+    def load(self):
+        """Return every saved job.
+        
+        @rtype: C{dict}
+        @return: The L{txscheduling.store.JobState} of each job by its id.
+        """
+    
+    
+    def record(self, state):
+        """Save the state of a job, replacing any earlier state. Stores may
+        write it later together with other changes.
+        
+        @param state: A L{txscheduling.store.JobState}.
+        """
+    
+    
+    def remove(self, jobId):
+        """Forget a job. Stores may do this later together with other
+        changes. """
+    
+    
+    def flush(self):
+        """Write any changes that have not been written yet. """
+
+
+class IClaimProvider(zope.interface.Interface):
+    """A lock shared by every node running the same jobs, so that each entry
+    of a job runs on only one of them. """
+    
+    
+    def claim(self, slots):
+        """Claim entries of jobs for this node. A slot is claimed by at most
+        one node, however many ask for it.
+        
+        @param slots: A list of C{(jobId, time)} slots, where time is the
+        POSIX timestamp of the entry in whole seconds.
+        
+        @return: The set of slots claimed by this node, or a deferred firing
+        with it.
+        """
@@ -0,0 +1,143 @@
+import bisect
+
+import zope.interface
+
+from txscheduling.interfaces import IScheduledCallObserver
+
+
+
+""" This module provides histograms and an implementation of the
+txscheduling.interfaces.IScheduledCallObserver interface that collects
+them for scheduled calls. """
+
+# Upper bounds of the histogram buckets for seconds and for slot counts
+SECONDS_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300,
+                  3600)
+SLOT_BOUNDS = (0, 1, 2, 5, 10, 100, 1000)
+
+class Histogram(object):
+    """Count values in buckets with fixed upper bounds. Values above the last
+    bound are counted in an overflow bucket.
+
+    >>> h = Histogram((1, 10))
+    >>> for value in (0.5, 1, 3, 50):
+    ...     h.record(value)
+    >>> snapshot = h.snapshot()
+    >>> snapshot['buckets']
+    [[1, 2], [10, 1], [None, 1]]
+    >>> snapshot['count'], snapshot['max'], snapshot['mean']
+    (4, 50, 13.625)
+    """
+
+    def __init__(self, bounds=SECONDS_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        mean = None
+        if self.count:
+            mean = self.total / float(self.count)
+        return {'count': self.count,
+                'total': self.total,
+                'min': self.min,
+                'max': self.max,
+                'mean': mean,
+                'buckets': [[bound, count] for bound, count in
+                            zip(self.bounds + (None,), self.counts)]}
+
+
+class CallMetrics(object):
+    """The histograms kept for one or more scheduled calls.
+
+    @ivar lateness: Seconds between when calls were due and when they fired.
+    @ivar duration: Seconds between when calls fired and when their function
+        returned or its deferred fired, including time spent waiting for a
+        limiter.
+    @ivar skipped: Entries skipped at each firing, either missed while the
+        call was late or passed while the function was running.
+    @ivar overruns: The number of runs that lasted past the next entry.
+    """
+
+    def __init__(self):
+        self.lateness = Histogram(SECONDS_BOUNDS)
+        self.duration = Histogram(SECONDS_BOUNDS)
+        self.skipped = Histogram(SLOT_BOUNDS)
+        self.overruns = 0
+
+    def snapshot(self):
+        return {'lateness': self.lateness.snapshot(),
+                'duration': self.duration.snapshot(),
+                'skipped': self.skipped.snapshot(),
+                'overruns': self.overruns}
+
+
+class MetricsObserver(object):
+    """Collect L{CallMetrics} for every scheduled call it observes and for
+    all of them together. Set it as the C{observer} of any number of
+    L{txscheduling.task.ScheduledCall} instances.
+
+    @ivar aggregate: The L{CallMetrics} of all observed calls.
+    @ivar perCall: Whether to also keep L{CallMetrics} for each call.
+    """
+    zope.interface.implements(IScheduledCallObserver)
+
+    def __init__(self, perCall=True):
+        self.aggregate = CallMetrics()
+        self.perCall = perCall
+        self.calls = {}
+
+    def _metrics(self, call):
+        metrics = self.calls.get(call)
+        if metrics is None:
+            metrics = self.calls[call] = CallMetrics()
+        return metrics
+
+    def fired(self, call, lateness, skipped):
+        self.aggregate.lateness.record(lateness)
+        self.aggregate.skipped.record(skipped)
+        if self.perCall:
+            metrics = self._metrics(call)
+            metrics.lateness.record(lateness)
+            metrics.skipped.record(skipped)
+
+    def finished(self, call, duration, skipped):
+        self.aggregate.duration.record(duration)
+        if skipped:
+            self.aggregate.skipped.record(skipped)
+            self.aggregate.overruns += 1
+        if self.perCall:
+            metrics = self._metrics(call)
+            metrics.duration.record(duration)
+            if skipped:
+                metrics.skipped.record(skipped)
+                metrics.overruns += 1
+
+    def forget(self, call):
+        """Drop the metrics kept for a call that is no longer used. """
+        self.calls.pop(call, None)
+
+    def snapshot(self):
+        """Return the metrics as a dictionary of plain values, with the
+        metrics of each call keyed by its repr. """
+        return {'aggregate': self.aggregate.snapshot(),
+                'calls': dict((repr(call), metrics.snapshot())
+                              for call, metrics in self.calls.iteritems())}
+
+__all__ = [
+    'Histogram',
+    'CallMetrics',
+    'MetricsObserver'
+]
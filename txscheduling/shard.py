@@ -0,0 +1,342 @@
+import cPickle as pickle
+import itertools
+import multiprocessing
+import os
+import time
+import zlib
+from logging import getLogger
+
+import zope.interface
+
+from twisted.internet import defer, task
+
+from txscheduling.executor import _initWorker
+from txscheduling.interfaces import IExecutor
+from txscheduling.task import ScheduledCall, TimerWheel
+
+
+
+""" This module provides a scheduler that spreads scheduled calls over
+several worker processes, so that computing next entries and dispatching
+calls is not limited to the one core a reactor runs on. """
+
+log = getLogger('txscheduling.shard')
+
+# The ScheduledCall settings copied to the call a shard runs
+_callSettings = ('misfirePolicy', 'misfireGraceTime', 'misfireLimit')
+
+def shardFor(jobId, shards):
+    """Return the index of the shard out of C{shards} that runs a job. The
+    hash is stable across processes and restarts, unlike C{hash}, so a job
+    always lands in the same shard for the same number of shards. Unicode
+    ids are hashed as UTF-8 and ids other than strings, such as integers, as
+    their repr.
+
+    >>> shardFor('backup', 4)
+    0
+    >>> shardFor(u'backup', 4)
+    0
+    >>> shardFor(5, 4) == shardFor(5, 4)
+    True
+    """
+    if isinstance(jobId, unicode):
+        key = jobId.encode('utf-8')
+    elif isinstance(jobId, str):
+        key = jobId
+    else:
+        key = repr(jobId)
+    return (zlib.crc32(key) & 0xffffffff) % shards
+
+
+class _SynchronousExecutor(object):
+    """Run functions in a shard, which has no running reactor, failing
+    those that return a deferred that has not fired yet, since it would
+    never fire and the call would silently stop rescheduling. """
+    zope.interface.implements(IExecutor)
+
+    def run(self, f, *a, **kw):
+        d = defer.maybeDeferred(f, *a, **kw)
+
+        if not d.called:
+            return defer.fail(RuntimeError(
+                    '%r returned a deferred that has not fired, but shards do '
+                    'not run a reactor' % (f,)))
+
+        return d
+
+
+class _Shard(object):
+    """The scheduled calls of one worker process, multiplexed onto a
+    L{TimerWheel} over a clock that is advanced to the current time. """
+
+    def __init__(self, index):
+        self.index = index
+        self.clock = task.Clock()
+        self.clock.advance(time.time())
+        self.wheel = TimerWheel(self.clock)
+        self.executor = _SynchronousExecutor()
+        self.calls = {}
+        self.running = True
+        # Counts of the calls no longer running, so stats cover the lifetime
+        # of the shard
+        self.retired = {'fired': 0, 'misfires': 0, 'missed': 0}
+        self.errors = 0
+
+    def timeout(self):
+        """ Return the seconds until the next call is due, or None to wait
+        for a command. """
+        calls = self.clock.getDelayedCalls()
+        if not calls:
+            return None
+        return max(0.0, min([c.getTime() for c in calls]) - time.time())
+
+    def advance(self):
+        self.clock.advance(max(0.0, time.time() - self.clock.seconds()))
+
+    def handle(self, command):
+        """ Carry out a command from the scheduler and return the reply to
+        send, if any. """
+        name = command[0]
+
+        if name == 'start':
+            self.startCall(command[1], command[2])
+        elif name == 'stop':
+            self.stopCall(command[1])
+        elif name == 'stats':
+            # Tagged with the request, so late replies can be told apart
+            return ('stats', command[1], self.stats())
+        elif name == 'shutdown':
+            self.running = False
+            for jobId in self.calls.keys():
+                self.stopCall(jobId)
+        else:
+            log.error('Unknown shard command: %r' % (name,))
+
+    def startCall(self, jobId, data):
+        if jobId in self.calls:
+            self.stopCall(jobId)
+
+        try:
+            f, a, kw, schedule, settings = pickle.loads(data)
+            call = ScheduledCall(f, *a, **kw)
+            call.clock = self.wheel
+            call.executor = self.executor
+            call.jobId = jobId
+            for name, value in settings.iteritems():
+                setattr(call, name, value)
+            d = call.start(schedule)
+        except Exception, e:
+            log.error('Unable to start job %r in shard %d: %s' % (
+                    jobId, self.index, e))
+            self.errors += 1
+            return
+
+        self.calls[jobId] = call
+        d.addErrback(self._failed, jobId, call)
+
+    def _failed(self, failure, jobId, call):
+        log.error('Job %r stopped in shard %d: %s' % (
+                jobId, self.index, failure.getErrorMessage()))
+        self.errors += 1
+        if self.calls.get(jobId) is call:
+            self._retire(jobId)
+
+    def _retire(self, jobId):
+        call = self.calls.pop(jobId)
+        stats = call.misfireStats()
+        for name in self.retired:
+            self.retired[name] += stats[name]
+        return call
+
+    def stopCall(self, jobId):
+        if jobId not in self.calls:
+            return
+
+        call = self._retire(jobId)
+        if call.running:
+            call.stop()
+
+    def stats(self):
+        stats = dict(self.retired)
+        stats.update({'shard': self.index,
+                      'pid': os.getpid(),
+                      'jobs': len(self.calls),
+                      'pending': len(self.wheel),
+                      'errors': self.errors,
+                      'maxLateness': 0.0})
+
+        for call in self.calls.itervalues():
+            callStats = call.misfireStats()
+            for name in self.retired:
+                stats[name] += callStats[name]
+            stats['maxLateness'] = max(stats['maxLateness'],
+                                       callStats['maxLateness'])
+
+        return stats
+
+
+def _runShard(index, connection):
+    """ The main loop of a worker process. """
+    _initWorker()
+    shard = _Shard(index)
+
+    while shard.running:
+        try:
+            if connection.poll(shard.timeout()):
+                reply = shard.handle(connection.recv())
+                if reply is not None:
+                    connection.send(reply)
+        except (EOFError, IOError):
+            # The scheduler has gone away
+            break
+
+        shard.advance()
+
+    connection.close()
+
+
+class ShardedScheduler(object):
+    """Run scheduled calls in several worker processes.
+
+    Jobs are L{ScheduledCall} instances with a C{jobId}, which decides the
+    shard they run in with L{shardFor}. Their function, arguments and
+    schedule are pickled and sent to the shard over a pipe, so they must be
+    picklable, which means functions need to be defined at the top level of
+    a module. The misfire settings of the call are copied. In the shard the
+    call runs on a L{TimerWheel} of its own, so every shard has a single
+    timer however many jobs it has. Shards do not run a reactor, so jobs
+    must finish synchronously. A job returning a deferred that has not
+    fired by the time it returns fails and is counted in the errors of its
+    shard.
+
+    Jobs can be added before or after the workers are started. The workers
+    are forked by L{start}, so it should be called before the reactor starts
+    running, and are shut down by L{stop}.
+
+    @ivar size: The number of shards.
+    @ivar jobs: The pickled job of each registered job id.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or multiprocessing.cpu_count()
+        self.jobs = {}
+        self.shards = None
+        self._requests = itertools.count()
+
+    @property
+    def running(self):
+        return self.shards is not None
+
+    def start(self):
+        """ Fork the workers and start every registered job. """
+        assert not self.running, ("Tried to start an already running "
+                                  "ShardedScheduler.")
+        shards = []
+
+        for index in range(self.size):
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_runShard,
+                                              args=(index, child),
+                                              name='txscheduling-shard-%d' % (
+                    index,))
+            process.daemon = True
+            process.start()
+            child.close()
+            shards.append((process, connection))
+
+        self.shards = shards
+
+        for jobId, data in self.jobs.iteritems():
+            self._send(jobId, ('start', jobId, data))
+
+    def stop(self, timeout=5):
+        """ Stop every job and wait up to C{timeout} seconds for each worker
+        to exit before terminating it. """
+        assert self.running, ("Tried to stop a ShardedScheduler that was not "
+                              "running.")
+        shards, self.shards = self.shards, None
+
+        for process, connection in shards:
+            try:
+                connection.send(('shutdown',))
+            except IOError:
+                pass
+
+        for process, connection in shards:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+
+    def shardFor(self, jobId):
+        return shardFor(jobId, self.size)
+
+    def _send(self, jobId, command):
+        self.shards[self.shardFor(jobId)][1].send(command)
+
+    def add(self, call, schedule):
+        """Register a job, and start it if the workers are running. A job
+        already registered with the same id is replaced.
+
+        @param call: A L{ScheduledCall} that has not been started, with a
+            C{jobId}.
+        @param schedule: The schedule to run the call on.
+        """
+        if call.jobId is None:
+            raise ValueError('Sharded calls need a jobId: %r' % (call.f,))
+
+        settings = dict((name, getattr(call, name)) for name in _callSettings)
+        data = pickle.dumps((call.f, call.a, call.kw, schedule, settings),
+                            pickle.HIGHEST_PROTOCOL)
+        self.jobs[call.jobId] = data
+
+        if self.running:
+            self._send(call.jobId, ('start', call.jobId, data))
+
+    def remove(self, jobId):
+        """ Unregister a job, and stop it if the workers are running. """
+        del self.jobs[jobId]
+
+        if self.running:
+            self._send(jobId, ('stop', jobId))
+
+    def stats(self, timeout=5):
+        """Return a dictionary of statistics for each shard, in shard order,
+        with the number of jobs and pending calls, the fired, misfire,
+        missed and error counts of its jobs and their greatest lateness.
+
+        This blocks until every shard replies, for at most C{timeout}
+        seconds each, so it is meant for command line tools and for startup
+        and shutdown rather than for code running in the reactor thread,
+        which it would stall. Replies arriving after a timeout are dropped
+        by later calls.
+        """
+        assert self.running, "Tried to get the stats of a stopped scheduler."
+        request = next(self._requests)
+
+        for process, connection in self.shards:
+            connection.send(('stats', request))
+
+        stats = []
+        for index, (process, connection) in enumerate(self.shards):
+            deadline = time.time() + timeout
+
+            # Replies to earlier requests that timed out are dropped
+            while True:
+                if not connection.poll(max(0, deadline - time.time())):
+                    raise RuntimeError('Shard %d did not reply' % (index,))
+                reply = connection.recv()
+                if reply[1] == request:
+                    break
+
+            stats.append(reply[2])
+
+        return stats
+
+    def __repr__(self):
+        return 'ShardedScheduler(%d)' % (self.size,)
+
+__all__ = [
+    'ShardedScheduler',
+    'shardFor'
+]
@@ -0,0 +1,228 @@
+import collections
+import sqlite3
+from logging import getLogger
+
+import zope.interface
+
+from txscheduling.interfaces import IJobStore
+
+
+
+""" This module provides implementations of the
+txscheduling.interfaces.IJobStore interface, which keep the last run and
+next due times of scheduled calls across restarts. """
+
+log = getLogger('txscheduling.store')
+
+class JobState(collections.namedtuple('JobState',
+                                       'id schedule lastRun nextRun')):
+    """The saved state of a scheduled call.
+
+    @ivar id: The C{jobId} of the call.
+    @ivar schedule: The L{scheduleKey} of its schedule, so that state saved
+        for a schedule that has since changed is not restored.
+    @ivar lastRun: The wall clock time it last fired, as a POSIX timestamp,
+        or C{None}.
+    @ivar nextRun: The wall clock time it is next due.
+    """
+    __slots__ = ()
+
+
+def scheduleKey(schedule):
+    """Return the string saved states identify a schedule by, which is its
+    C{scheduleKey} attribute if it has one and otherwise its repr, such as
+    the line and zone of a CronSchedule. A repr that differs between
+    processes, like the default one showing an address, never matches after
+    a restart, so such schedules need a C{scheduleKey}.
+
+    >>> from txscheduling.cron import CronSchedule
+    >>> scheduleKey(CronSchedule('0 2 * * *'))
+    "CronSchedule('0 2 * * *')"
+    """
+    key = getattr(schedule, 'scheduleKey', None)
+    if key is None:
+        key = repr(schedule)
+    return key
+
+
+def jobKey(jobId):
+    """Return a job id as the text job stores save it as. Byte strings are
+    decoded as UTF-8, or as Latin-1 if they are not valid UTF-8, and other
+    ids, such as integers, are converted with unicode, so a saved job is
+    found again by L{restoreCalls} whatever type its id has.
+
+    >>> jobKey(5)
+    u'5'
+    """
+    if isinstance(jobId, str):
+        try:
+            return jobId.decode('utf-8')
+        except UnicodeDecodeError:
+            return jobId.decode('latin-1')
+    return unicode(jobId)
+
+
+class MemoryJobStore(object):
+    """Keep job states in a dictionary, for tests and for processes that only
+    need them while they run.
+
+    >>> jobs = MemoryJobStore()
+    >>> jobs.record(JobState('backup', "CronSchedule('0 2 * * *')", None, 60.0))
+    >>> jobs.load()['backup'].nextRun
+    60.0
+    """
+    zope.interface.implements(IJobStore)
+
+    def __init__(self):
+        self.jobs = {}
+
+    def load(self):
+        return dict(self.jobs)
+
+    def record(self, state):
+        self.jobs[state.id] = state
+
+    def remove(self, jobId):
+        self.jobs.pop(jobId, None)
+
+    def flush(self):
+        pass
+
+
+class SQLiteJobStore(object):
+    """Keep job states in an SQLite database.
+
+    Job ids are saved as text with L{jobKey}. Recorded and removed jobs are
+    collected in memory, with later changes to
+    a job replacing earlier ones, and written in a single transaction
+    C{flushInterval} seconds after the first change, or when L{flush} or
+    L{close} is called. However many jobs fire, the database sees one
+    transaction per interval.
+
+    @ivar path: The file name of the database.
+    @ivar flushInterval: The seconds changes may wait before being written.
+    @ivar clock: The provider of L{twisted.internet.interfaces.IReactorTime}
+        scheduling writes. The default is L{twisted.internet.reactor}.
+    """
+    zope.interface.implements(IJobStore)
+
+    def __init__(self, path, flushInterval=1.0, clock=None):
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.path = path
+        self.flushInterval = flushInterval
+        self.clock = clock
+        self._pending = {}
+        self._timer = None
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, '
+            'schedule TEXT NOT NULL, last_run REAL, next_run REAL)')
+        self._connection.commit()
+
+    def load(self):
+        """Return every saved job, including changes not yet written. """
+        jobs = dict((row[0], JobState(*row)) for row in
+                    self._connection.execute(
+                'SELECT id, schedule, last_run, next_run FROM jobs'))
+
+        for jobId, state in self._pending.iteritems():
+            if state is None:
+                jobs.pop(jobId, None)
+            else:
+                jobs[jobId] = state
+
+        return jobs
+
+    def record(self, state):
+        jobId = jobKey(state.id)
+        self._pending[jobId] = state._replace(id=jobId)
+        self._scheduleFlush()
+
+    def remove(self, jobId):
+        self._pending[jobKey(jobId)] = None
+        self._scheduleFlush()
+
+    def _scheduleFlush(self):
+        if self._timer is None:
+            self._timer = self.clock.callLater(self.flushInterval,
+                                               self._timedFlush)
+
+    def _timedFlush(self):
+        self._timer = None
+        try:
+            self.flush()
+        except sqlite3.Error:
+            log.exception('Error writing jobs to %s' % (self.path,))
+
+    def flush(self):
+        if self._timer is not None:
+            if self._timer.active():
+                self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, {}
+
+        if not pending:
+            return
+
+        removed = [(jobId,) for jobId, state in pending.iteritems()
+                   if state is None]
+        recorded = [tuple(state) for state in pending.itervalues()
+                    if state is not None]
+
+        try:
+            with self._connection:
+                if removed:
+                    self._connection.executemany(
+                        'DELETE FROM jobs WHERE id = ?', removed)
+                if recorded:
+                    self._connection.executemany(
+                        'INSERT OR REPLACE INTO jobs '
+                        '(id, schedule, last_run, next_run) '
+                        'VALUES (?, ?, ?, ?)', recorded)
+        except sqlite3.Error:
+            # Keep the changes for the next attempt, unless they have been
+            # superseded since
+            pending.update(self._pending)
+            self._pending = pending
+            raise
+
+    def close(self):
+        """Write any pending changes and close the database. """
+        self.flush()
+        self._connection.close()
+
+    def __repr__(self):
+        return 'SQLiteJobStore(%r)' % (self.path,)
+
+
+def restoreCalls(store, calls):
+    """Load every job from a store in one go and hand its saved state to the
+    L{txscheduling.task.ScheduledCall} with the same C{jobId}, compared as
+    L{jobKey} text. Call this before starting the calls. Calls whose jobs
+    were due while the process was down fire as soon as they start, as a
+    misfire.
+
+    @return: The number of calls given a saved state.
+    """
+    states = dict((jobKey(jobId), state)
+                  for jobId, state in store.load().iteritems())
+    restored = 0
+
+    for call in calls:
+        state = states.get(jobKey(call.jobId))
+        if state is not None:
+            call.restore(state)
+            restored += 1
+
+    return restored
+
+__all__ = [
+    'JobState',
+    'MemoryJobStore',
+    'SQLiteJobStore',
+    'jobKey',
+    'restoreCalls',
+    'scheduleKey'
+]
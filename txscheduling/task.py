@@ -1,14 +1,53 @@
+import heapq
+import weakref
 from logging import getLogger
 
+import zope.interface
+
 from twisted.python import reflect
-from twisted.internet import defer
+from twisted.internet import defer, error
+from twisted.internet.interfaces import IReactorTime, IDelayedCall
 
-from txscheduling.interfaces import ISchedule
+from txscheduling.interfaces import (ISchedule, IWallClockSchedule,
+                                     IBatchSchedule, ICursorSchedule,
+                                     ISchedulingClock, IAnchoredClock)
+from txscheduling.executor import getExecutor
+from txscheduling.store import JobState, scheduleKey
 
 
 
 log = getLogger('twisted.schedule.task')
 
+MISFIRE_SKIP = 'skip'
+MISFIRE_RUN_ONCE = 'run_once'
+MISFIRE_RUN_ALL = 'run_all_missed'
+
+_misfirePolicies = (MISFIRE_SKIP, MISFIRE_RUN_ONCE, MISFIRE_RUN_ALL)
+
+# The bytes a running ScheduledCall may take on a TimerWheel, including its
+# delayed call, its deferred and a CronSchedule of its own. Measured at about
+# 1.3KB with a shared schedule and 1.6KB with its own on 64 bit CPython 2.7,
+# down from 6KB and 9.5KB before calls, schedules and wheel delayed calls had
+# slots. The tests check it with sys.getsizeof, which counts about 1.1KB and
+# 1.4KB; the compiled tables schedules of the same line share through the
+# parse cache are not counted.
+JOB_MEMORY_BUDGET = 2048
+
+def _batchDelays(schedules, now=None):
+    """Return a dictionary of the delays before the next execution of the
+    schedules providing L{IBatchSchedule}, computed in one batch for each
+    class of schedule as of one reading of the clock. """
+    batches = {}
+    for schedule in schedules:
+        if IBatchSchedule.providedBy(schedule):
+            batches.setdefault(schedule.__class__, []).append(schedule)
+
+    delays = {}
+    for batch in batches.itervalues():
+        delays.update(zip(batch, batch[0].getDelaysForNext(batch, now)))
+    return delays
+
+
 class ScheduledCall(object):
     """Call a function repeatedly.
 
@@ -22,12 +61,65 @@ class ScheduledCall(object):
         L{twisted.internet.interfaces.IReactorTime}.  The default is
         L{twisted.internet.reactor}. Feel free to set this to
         something else, but it probably ought to be set *before*
-        calling L{start}.
+        calling L{start}. Many scheduled calls can share one
+        L{TimerWheel} as their clock.
+    @ivar limiter: A L{ConcurrencyLimiter} that calls of C{f} wait on before
+        running, or C{None} to run them immediately.
+    @ivar group: The group of this call in C{limiter}.
+    @ivar executor: A provider of L{txscheduling.interfaces.IExecutor} that
+        runs C{f}, or C{None} to run it on the reactor thread.
+    @ivar misfirePolicy: What to do when this call fires more than
+        C{misfireGraceTime} seconds after it was scheduled, because the
+        reactor was blocked or the host was suspended. L{MISFIRE_RUN_ONCE}
+        calls C{f} once, L{MISFIRE_SKIP} does not call C{f} and
+        L{MISFIRE_RUN_ALL} calls C{f} once for the late entry and each entry
+        of a L{txscheduling.interfaces.IWallClockSchedule} missed since, up
+        to C{misfireLimit} times. The next call is always scheduled for the
+        next entry after now.
+    @ivar misfireGraceTime: The seconds a call may be late without counting
+        as a misfire.
+    @ivar misfireLimit: The most times L{MISFIRE_RUN_ALL} calls C{f} for one
+        misfire.
+    @ivar observer: A provider of
+        L{txscheduling.interfaces.IScheduledCallObserver} told about the
+        timing of each call, such as a
+        L{txscheduling.metrics.MetricsObserver}, or C{None}.
+    @ivar store: A provider of L{txscheduling.interfaces.IJobStore} the
+        last run and next due times of this call are recorded in whenever it
+        is scheduled, or C{None}.
+    @ivar jobId: The id of this call in C{store} and C{claimer}.
+    @ivar claimer: A L{txscheduling.claim.ClaimBatcher}, or anything else
+        with its C{claim} method, that this call claims each entry with
+        before calling C{f}, or C{None}. Entries claimed by another node are
+        skipped, which is only meaningful for wall clock schedules, whose
+        entries are the same on every node.
+    @ivar unclaimed: The number of entries skipped because another node
+        claimed them or the claim failed.
+    @ivar lastRun: The time this call last fired, or C{None}.
 
     @type _lastTime: C{float}
     @ivar _lastTime: The time at which this instance most recently scheduled
         itself to run.
+    @ivar _cursor: The cursor over the entries of a
+        L{txscheduling.interfaces.ICursorSchedule} each next entry is found
+        with when C{clock} does not compute next times itself, so that this
+        call steps from the entry it last waited for rather than searching
+        from scratch, or C{None}. It belongs to this call even when the
+        schedule is shared.
+
+    Instances have slots rather than a C{__dict__}, since a process may keep
+    tens of thousands of them. With a shared schedule, such as one from
+    L{txscheduling.cron.CronSchedule.intern}, and a L{TimerWheel} as the
+    clock, a running call and its delayed call and deferred take about
+    1.3KB. See L{JOB_MEMORY_BUDGET}.
     """
+    __slots__ = ('call', 'running', 'scheduled', '_lastTime', 'starttime',
+                 'f', 'a', 'kw', 'limiter', 'group', 'executor',
+                 'misfirePolicy', 'misfireGraceTime', 'misfireLimit',
+                 'observer', 'store', 'jobId', 'claimer', 'unclaimed',
+                 'lastRun', '_restored', 'fired', 'misfires', 'missed',
+                 'totalLateness', 'maxLateness', 'clock', 'schedule',
+                 '_cursor', 'deferred', '__weakref__')
 
     def __init__(self, f, *a, **kw):
         self.call = None
@@ -38,16 +130,41 @@ class ScheduledCall(object):
         self.f = f
         self.a = a
         self.kw = kw
+        self.limiter = None
+        self.group = None
+        self.executor = None
+        self.misfirePolicy = MISFIRE_RUN_ONCE
+        self.misfireGraceTime = 1.0
+        self.misfireLimit = 10
+        self.observer = None
+        self.store = None
+        self.jobId = None
+        self.claimer = None
+        self.unclaimed = 0
+        self.lastRun = None
+        self._restored = None
+        self.fired = 0
+        self.misfires = 0
+        self.missed = 0
+        self.totalLateness = 0.0
+        self.maxLateness = 0.0
+        self.schedule = None
+        self._cursor = None
+        self.deferred = None
         from twisted.internet import reactor
         self.clock = reactor
 
 
-    def start(self, schedule):
+    def start(self, schedule, executor=None):
         """Start running function based on the provided schedule.
 
         @param schedule: An object that provides or can be adapted to an
         ISchedule interface.
 
+        @param executor: A provider of L{txscheduling.interfaces.IExecutor}
+        or one of the names C{'reactor'}, C{'thread'} or C{'process'} to use
+        as the executor of this call. See
+        L{txscheduling.executor.getExecutor}.
 
         @return: A Deferred whose callback will be invoked with
         C{self} when C{self.stop} is called, or whose errback will be
@@ -56,7 +173,15 @@ class ScheduledCall(object):
         """
         assert not self.running, ("Tried to start an already running "
                                   "ScheduledCall.")
+        if self.misfirePolicy not in _misfirePolicies:
+            raise ValueError('Unknown misfire policy: %r' % (
+                    self.misfirePolicy,))
+        if self.claimer is not None and self.jobId is None:
+            raise ValueError('Claimed calls need a jobId: %r' % (self.f,))
         self.schedule = ISchedule(schedule)
+        self._cursor = None
+        if executor is not None:
+            self.executor = getExecutor(executor)
         try:
             self.running = True
             self.deferred = defer.Deferred()
@@ -104,18 +229,233 @@ class ScheduledCall(object):
             d.errback(failure)
 
         self.call = None
-        d = defer.maybeDeferred(self.f, *self.a, **self.kw)
+        now = self.clock.seconds()
+        self.lastRun = now
+        lateness = max(0.0, now - self._lastTime)
+        self.fired += 1
+        self.totalLateness += lateness
+        self.maxLateness = max(self.maxLateness, lateness)
+
+        if self.claimer is None:
+            d = self._fire(now, lateness)
+        else:
+            d = self.claimer.claim(self.jobId,
+                                   self._lastTime - self._wallOffset())
+            d.addCallbacks(self._claimed, self._claimFailed,
+                           callbackArgs=(now, lateness))
+
         d.addCallback(cb)
         d.addErrback(eb)
 
 
+    def _claimed(self, claimed, now, lateness):
+        """ Fire if this node claimed the entry. """
+        if claimed:
+            return self._fire(now, lateness)
+        self.unclaimed += 1
+
+
+    def _claimFailed(self, failure):
+        """ Skip the entry rather than risk running it twice. """
+        log.error('Unable to claim an entry of %r: %s' % (
+                self, failure.getErrorMessage()))
+        self.unclaimed += 1
+
+
+    def _fire(self, now, lateness):
+        """ Run the function for the entry that is due, applying the misfire
+        policy if it is late. """
+        def runAgain(result):
+            if self.running:
+                return self._run()
+
+        skipped = 0
+
+        if lateness <= self.misfireGraceTime:
+            d = self._run()
+        else:
+            self.misfires += 1
+            entries = self._countMissed(lateness)
+            log.warning('%r fired %.3f seconds late, missing %d entries' % (
+                    self, lateness, entries))
+
+            if self.misfirePolicy == MISFIRE_SKIP:
+                runs = 0
+            elif self.misfirePolicy == MISFIRE_RUN_ONCE:
+                runs = 1
+            else:
+                runs = min(entries, self.misfireLimit)
+
+            skipped = entries - runs
+            self.missed += skipped
+            d = defer.succeed(None)
+            for i in range(runs):
+                d.addCallback(runAgain)
+
+        observer = self.observer
+        if observer is not None:
+            observer.fired(self, lateness, skipped)
+            d.addBoth(self._finished, observer, now)
+
+        return d
+
+
+    def _run(self):
+        """ Run the function once with the executor and limiter. """
+        if self.executor is None:
+            run = defer.maybeDeferred
+        else:
+            run = self.executor.run
+        if self.limiter is None:
+            return run(self.f, *self.a, **self.kw)
+        return self.limiter.run(self.group, run, self.f, *self.a, **self.kw)
+
+
+    def _finished(self, result, observer, fired):
+        """ Tell the observer that the function has finished. """
+        now = self.clock.seconds()
+        offset = self._wallOffset()
+        observer.finished(self, now - fired,
+                          self._countEntries(fired - offset, now - offset))
+        return result
+
+
+    def _countMissed(self, lateness):
+        """ Return the number of entries, including the one this call was
+        scheduled for, that passed in the C{lateness} seconds since it was
+        due. Only entries of wall clock schedules can be counted. """
+        if not IWallClockSchedule.providedBy(self.schedule):
+            return 1
+
+        # Rounded to the second so that an entry due a moment before a
+        # minute boundary is not counted twice
+        due = round(self._lastTime - self._wallOffset())
+        return 1 + self._countEntries(due, due + lateness)
+
+
+    def _countEntries(self, start, end):
+        """ Return the number of entries of a wall clock schedule after the
+        wall clock time C{start} up to and including C{end}, or 0 for other
+        schedules. """
+        if not IWallClockSchedule.providedBy(self.schedule):
+            return 0
+
+        count = 0
+        for entry in self.schedule.iterEntries(start, timestamps=True):
+            if entry > end:
+                break
+            count += 1
+        return count
+
+
+    def misfireStats(self):
+        """ Return a dictionary of the lateness and misfire counts of this
+        call. """
+        stats = {'fired': self.fired,
+                 'misfires': self.misfires,
+                 'missed': self.missed,
+                 'totalLateness': self.totalLateness,
+                 'maxLateness': self.maxLateness,
+                 'meanLateness': 0.0}
+        if self.fired:
+            stats['meanLateness'] = self.totalLateness / self.fired
+        return stats
+
+
+    def restore(self, state):
+        """Resume from a L{txscheduling.store.JobState} saved by an earlier
+        process. Call this before L{start}. The state is only used if it was
+        saved for a schedule with the same L{txscheduling.store.scheduleKey}.
+        If the saved next due time has passed,
+        the call fires as soon as it starts and handles the entries missed
+        since with its misfire policy.
+        """
+        assert not self.running, ("Tried to restore a running "
+                                  "ScheduledCall.")
+        self._restored = state
+
+
+    def _restoredTime(self):
+        """ Return the saved next due time to use instead of the schedule,
+        if any, and forget the saved state. """
+        state, self._restored = self._restored, None
+
+        if state is None:
+            return None
+
+        if state.schedule != scheduleKey(self.schedule):
+            log.warning('Not restoring %r, whose state was saved for %s' % (
+                    self, state.schedule))
+            return None
+
+        offset = self._wallOffset()
+
+        if state.lastRun is not None:
+            self.lastRun = state.lastRun + offset
+
+        if (state.nextRun is not None and
+            state.nextRun + offset < self.clock.seconds()):
+            return state.nextRun + offset
+
+
+    def _wallOffset(self):
+        """ Return the time of the clock minus the wall clock time, which
+        is 0 unless the clock is a L{txscheduling.interfaces.IAnchoredClock}
+        or a L{TimerWheel} over one. Claims and saved states are kept in
+        wall clock time, which is the same on every node and after a
+        restart. """
+        wallTime = getattr(self.clock, 'wallTime', None)
+        if wallTime is None:
+            return 0
+        return self.clock.seconds() - wallTime()
+
+
+    def replan(self, jump):
+        """Move the entry a call is waiting for after the wall clock jumped
+        by C{jump} seconds relative to its clock, as reported by a
+        L{txscheduling.interfaces.IAnchoredClock}. Only entries of wall clock
+        schedules move. An entry the wall clock jumped past is due at once,
+        late, and handled by the misfire policy. """
+        if (not self.running or self.call is None or
+            not IWallClockSchedule.providedBy(self.schedule)):
+            return
+
+        self._lastTime -= jump
+        self.call.reset(max(0, self._lastTime - self.clock.seconds()))
+
+
     def _reschedule(self):
         """ Schedule the next iteration of this scheduled call. """
         if self.call is None:
-            delay = self.schedule.getDelayForNext()
-            self._lastTime = self.clock.seconds() + delay
+            restored = None
+            if self._restored is not None:
+                restored = self._restoredTime()
+
+            if restored is not None:
+                self._lastTime = restored
+                delay = 0
+            elif ISchedulingClock.providedBy(self.clock):
+                self._lastTime = self.clock.getNextTime(self.schedule)
+                delay = self._lastTime - self.clock.seconds()
+            else:
+                schedule = self._cursor
+                if schedule is None:
+                    schedule = self.schedule
+                    if ICursorSchedule.providedBy(schedule):
+                        schedule = self._cursor = schedule.cursor()
+                delay = schedule.getDelayForNext()
+                self._lastTime = self.clock.seconds() + delay
             self.call = self.clock.callLater(delay, self)
 
+            if self.store is not None:
+                offset = self._wallOffset()
+                lastRun = self.lastRun
+                if lastRun is not None:
+                    lastRun -= offset
+                self.store.record(JobState(self.jobId,
+                                           scheduleKey(self.schedule),
+                                           lastRun, self._lastTime - offset))
+
 
     def __repr__(self):
         if hasattr(self.f, 'func_name'):
@@ -127,4 +467,394 @@ class ScheduledCall(object):
 
         return 'ScheduledCall<%s>(%s, *%s, **%s)' % (
             self.schedule, func, reflect.safe_repr(self.a),
-            reflect.safe_repr(self.kw))
\ No newline at end of file
+            reflect.safe_repr(self.kw))
+
+
+class _WheelDelayedCall(object):
+    """A delayed call of a L{TimerWheel}, with the behaviour of
+    L{twisted.internet.base.DelayedCall} in a fraction of its memory.
+    Resetting and delaying move the call to its new bucket at once. """
+    zope.interface.implements(IDelayedCall)
+    __slots__ = ('time', 'func', 'args', 'kw', 'wheel', 'bucket',
+                 'cancelled', 'called')
+
+    def __init__(self, time, func, args, kw, wheel):
+        self.time = time
+        self.func = func
+        self.args = args
+        self.kw = kw
+        self.wheel = wheel
+        # The bucket of the wheel that currently holds this call
+        self.bucket = None
+        self.cancelled = 0
+        self.called = 0
+
+    def getTime(self):
+        return self.time
+
+    def _checkActive(self):
+        if self.cancelled:
+            raise error.AlreadyCancelled
+        if self.called:
+            raise error.AlreadyCalled
+
+    def cancel(self):
+        self._checkActive()
+        self.cancelled = 1
+        self.wheel._cancelCall(self)
+
+    def reset(self, secondsFromNow):
+        self._checkActive()
+        self.time = self.wheel.seconds() + secondsFromNow
+        self.wheel._moveCall(self)
+
+    def delay(self, secondsLater):
+        self._checkActive()
+        self.time += secondsLater
+        self.wheel._moveCall(self)
+
+    def active(self):
+        return not (self.cancelled or self.called)
+
+    def __repr__(self):
+        return '<_WheelDelayedCall %s at %s>' % (
+            reflect.safe_repr(self.func), self.time)
+
+
+class TimerWheel(object):
+    """Multiplex any number of delayed calls onto a single delayed call of
+    another clock.
+
+    Calls are kept in buckets covering C{resolution} seconds each, so adding,
+    cancelling and moving a call are constant time operations when its
+    bucket already exists and only the distinct bucket times are kept in a
+    heap. The underlying clock has a single delayed call for the earliest
+    pending call and every call that is due is made in the same wakeup.
+
+    A TimerWheel provides L{twisted.internet.interfaces.IReactorTime} and is
+    meant to be used as the C{clock} of L{ScheduledCall} instances. The
+    default resolution of sixty seconds matches cron schedules, whose entries
+    fall on minute boundaries.
+
+    The next time of a L{IWallClockSchedule} is computed once and shared by
+    every call using an equal schedule until that time has passed. Calls
+    firing at the same entry of a schedule therefore have the same time and
+    are made together, however many there are. The next times of the
+    schedules of the L{ScheduledCall} instances made by one wakeup are
+    computed in a batch when they provide
+    L{txscheduling.interfaces.IBatchSchedule}, see L{prepare}. When the underlying clock is
+    itself a L{txscheduling.interfaces.ISchedulingClock}, such as a
+    L{txscheduling.clock.AnchoredClock}, it computes the next times instead.
+
+    @ivar clock: The provider of L{twisted.internet.interfaces.IReactorTime}
+        the wheel schedules itself with. The default is
+        L{twisted.internet.reactor}.
+    @ivar resolution: The number of seconds covered by a bucket.
+    """
+    zope.interface.implements(IReactorTime, ISchedulingClock)
+
+    def __init__(self, clock=None, resolution=60):
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self.clock = clock
+        self.resolution = resolution
+        self._buckets = {}
+        self._keys = []
+        self._timer = None
+        self._dispatching = False
+        self._nextTimes = weakref.WeakKeyDictionary()
+
+
+    def seconds(self):
+        return self.clock.seconds()
+
+
+    def wallTime(self):
+        """ Return the wall clock time matching the current time, which is
+        the time of the clock unless it is a
+        L{txscheduling.interfaces.IAnchoredClock}. """
+        if IAnchoredClock.providedBy(self.clock):
+            return self.clock.wallTime()
+        return self.clock.seconds()
+
+
+    def getNextTime(self, schedule):
+        """Return the time of the next entry of C{schedule}. See
+        L{txscheduling.interfaces.ISchedulingClock.getNextTime}.
+        """
+        if ISchedulingClock.providedBy(self.clock):
+            return self.clock.getNextTime(schedule)
+
+        now = self.seconds()
+
+        if not IWallClockSchedule.providedBy(schedule):
+            return now + schedule.getDelayForNext()
+
+        next = self._nextTimes.get(schedule)
+
+        if next is None or next <= now:
+            next = self._nextTimes[schedule] = (now +
+                                                schedule.getDelayForNext())
+
+        return next
+
+
+    def prepare(self, schedules):
+        """Compute the next times of the wall clock schedules among
+        C{schedules} whose time has passed, in one batch for each class of
+        L{txscheduling.interfaces.IBatchSchedule}. See
+        L{txscheduling.interfaces.ISchedulingClock.prepare}.
+        """
+        if ISchedulingClock.providedBy(self.clock):
+            return self.clock.prepare(schedules)
+
+        now = self.seconds()
+        nextTimes = self._nextTimes
+        stale = set()
+
+        for schedule in schedules:
+            if IWallClockSchedule.providedBy(schedule):
+                next = nextTimes.get(schedule)
+                if next is None or next <= now:
+                    stale.add(schedule)
+
+        for schedule, delay in _batchDelays(stale).iteritems():
+            nextTimes[schedule] = now + delay
+
+
+    def callLater(self, delay, f, *a, **kw):
+        """Call C{f} after C{delay} seconds. See
+        L{twisted.internet.interfaces.IReactorTime.callLater}.
+        """
+        # Most calls have no keyword arguments, which are then not kept
+        call = _WheelDelayedCall(self.seconds() + delay, f, a, kw or None,
+                                 self)
+        self._addCall(call)
+        return call
+
+
+    def getDelayedCalls(self):
+        calls = []
+        for bucket in self._buckets.itervalues():
+            calls.extend(bucket)
+        return calls
+
+
+    def __len__(self):
+        return sum([len(bucket) for bucket in self._buckets.itervalues()])
+
+
+    def _addCall(self, call):
+        key = int(call.time // self.resolution)
+        bucket = self._buckets.get(key)
+
+        if bucket is None:
+            bucket = self._buckets[key] = set()
+            heapq.heappush(self._keys, key)
+
+        bucket.add(call)
+        call.bucket = bucket
+
+        if not self._dispatching and (self._timer is None or
+                                      call.time < self._timer.getTime()):
+            self._setTimer(call.time)
+
+
+    def _cancelCall(self, call):
+        # Emptied buckets are discarded by the next wakeup, which is left
+        # alone even if this was the earliest call. Calls being dispatched
+        # are in no bucket.
+        if call.bucket is not None:
+            call.bucket.discard(call)
+            call.bucket = None
+
+
+    def _moveCall(self, call):
+        self._cancelCall(call)
+        self._addCall(call)
+
+
+    def _setTimer(self, when):
+        delay = max(0, when - self.seconds())
+
+        if self._timer is None:
+            self._timer = self.clock.callLater(delay, self._wakeup)
+        else:
+            self._timer.reset(delay)
+
+
+    def _wakeup(self):
+        self._timer = None
+        now = self.seconds()
+        due = []
+
+        while self._keys:
+            key = self._keys[0]
+            bucket = self._buckets[key]
+
+            if bucket and key * self.resolution > now:
+                break
+
+            ready = [call for call in bucket if call.time <= now]
+            bucket.difference_update(ready)
+            for call in ready:
+                call.bucket = None
+            due.extend(ready)
+
+            if bucket:
+                break
+
+            heapq.heappop(self._keys)
+            del self._buckets[key]
+
+        due.sort(key=lambda call: call.time)
+
+        # The calls made by this wakeup ask for their next times, so those
+        # are computed together first
+        if len(due) > 1:
+            self.prepare([getattr(call.func, 'schedule', None)
+                          for call in due])
+
+        self._dispatching = True
+
+        try:
+            for call in due:
+                # Skip calls cancelled or moved by the calls before them
+                if call.cancelled or call.bucket is not None:
+                    continue
+
+                call.called = 1
+                try:
+                    if call.kw:
+                        call.func(*call.args, **call.kw)
+                    else:
+                        call.func(*call.args)
+                except:
+                    log.exception('Error calling %r from %r' % (call, self))
+        finally:
+            self._dispatching = False
+
+        self._resetTimer()
+
+
+    def _resetTimer(self):
+        while self._keys:
+            bucket = self._buckets[self._keys[0]]
+
+            if bucket:
+                self._setTimer(min([call.time for call in bucket]))
+                return
+
+            del self._buckets[heapq.heappop(self._keys)]
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+    def __repr__(self):
+        return 'TimerWheel<%s>(%d calls)' % (self.resolution, len(self))
+
+
+class ConcurrencyLimiter(object):
+    """Limit how many functions run at once, overall and within groups.
+
+    Functions over a limit wait in a queue, in the order they arrived, until
+    a running function finishes. A function returning a deferred is running
+    until the deferred fires. Groups without a limit are only held to the
+    overall limit.
+
+    @ivar limit: The overall number of functions allowed to run at once, or
+        C{None} for no overall limit.
+    @ivar clock: A provider of L{twisted.internet.interfaces.IReactorTime}
+        used to measure the time spent waiting. The default is
+        L{twisted.internet.reactor}.
+    @ivar running: The number of functions running.
+    @ivar queued: The number of functions waiting to run.
+    @ivar waited: The number of functions that have started running.
+    @ivar totalWait: The total seconds started functions spent waiting.
+    @ivar maxWait: The longest time a started function spent waiting.
+    """
+
+    def __init__(self, limit=None, groupLimits=None, clock=None):
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self.clock = clock
+        self.limit = limit
+        self._semaphore = None
+        if limit is not None:
+            self._semaphore = defer.DeferredSemaphore(limit)
+        self._groupSemaphores = {}
+        self._groupQueued = {}
+        self.running = 0
+        self.queued = 0
+        self.waited = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+        for group, groupLimit in (groupLimits or {}).iteritems():
+            self.setGroupLimit(group, groupLimit)
+
+
+    def setGroupLimit(self, group, limit):
+        """Allow at most C{limit} functions of C{group} to run at once. This
+        only affects functions that start waiting afterwards. """
+        self._groupSemaphores[group] = defer.DeferredSemaphore(limit)
+
+
+    def run(self, group, f, *a, **kw):
+        """Call C{f} once the limits allow it.
+
+        @return: A Deferred firing with the result of C{f}.
+        """
+        semaphores = [self._groupSemaphores.get(group), self._semaphore]
+        semaphores = [s for s in semaphores if s is not None]
+        requested = self.clock.seconds()
+        self.queued += 1
+        self._groupQueued[group] = self._groupQueued.get(group, 0) + 1
+
+        def acquired(_):
+            wait = self.clock.seconds() - requested
+            self.queued -= 1
+            self._groupQueued[group] -= 1
+            if not self._groupQueued[group]:
+                del self._groupQueued[group]
+            self.running += 1
+            self.waited += 1
+            self.totalWait += wait
+            self.maxWait = max(self.maxWait, wait)
+            return defer.maybeDeferred(f, *a, **kw)
+
+        def release(result):
+            self.running -= 1
+            for semaphore in semaphores:
+                semaphore.release()
+            return result
+
+        d = defer.succeed(None)
+        for semaphore in semaphores:
+            d.addCallback(lambda _, semaphore=semaphore: semaphore.acquire())
+        d.addCallback(acquired)
+        d.addBoth(release)
+        return d
+
+
+    def stats(self):
+        """Return a snapshot of the queue depth and wait time metrics as a
+        dictionary. """
+        stats = {'running': self.running,
+                 'queued': self.queued,
+                 'groupsQueued': dict(self._groupQueued),
+                 'waited': self.waited,
+                 'totalWait': self.totalWait,
+                 'maxWait': self.maxWait,
+                 'meanWait': 0.0}
+        if self.waited:
+            stats['meanWait'] = self.totalWait / self.waited
+        return stats
+
+
+    def __repr__(self):
+        return 'ConcurrencyLimiter<%s>(%d running, %d queued)' % (
+            self.limit, self.running, self.queued)
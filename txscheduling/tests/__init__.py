@@ -1,11 +1,23 @@
 import unittest
 
-from txscheduling.tests import cron, task
+from txscheduling.tests import (aio, application, benchmarks, claim, clock,
+                                cron, executor, metrics, shard, store, task,
+                                timezone)
 
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTests(cron.test_suite())
     suite.addTests(task.test_suite())
+    suite.addTests(executor.test_suite())
+    suite.addTests(metrics.test_suite())
+    suite.addTests(benchmarks.test_suite())
+    suite.addTests(timezone.test_suite())
+    suite.addTests(store.test_suite())
+    suite.addTests(shard.test_suite())
+    suite.addTests(claim.test_suite())
+    suite.addTests(application.test_suite())
+    suite.addTests(clock.test_suite())
+    suite.addTests(aio.test_suite())
     return suite
 
 if __name__ == '__main__':
@@ -0,0 +1,184 @@
+import unittest
+
+from txscheduling import aio
+from txscheduling.aio import ScheduledCall, Scheduler, asyncio
+from txscheduling.benchmarks.aio import ManualLoop
+from txscheduling.tests.task import (SimpleSchedule, CountingCronSchedule,
+                                     IncrementingCallable)
+
+
+
+class TestException(Exception):
+    pass
+
+
+class ScheduledCallTestCase(unittest.TestCase):
+    """ Tests for running scheduled calls in an asyncio loop """
+    def setUp(self):
+        if aio.asyncio is None:
+            self.skipTest('asyncio and trollius are not installed')
+        self.loop = ManualLoop()
+
+    def makeCall(self, f):
+        call = ScheduledCall(f)
+        call.clock = self.loop
+        return call
+
+    def test_repeats(self):
+        """ The function is called on the schedule until stopped """
+        callable = IncrementingCallable()
+        call = self.makeCall(callable)
+        future = call.start(SimpleSchedule(1))
+
+        for i in range(3):
+            self.loop.advance(1)
+        self.assertEqual(callable.count, 3)
+
+        call.stop()
+        self.assertTrue(future.result() is call)
+        self.loop.advance(5)
+        self.assertEqual(callable.count, 3)
+
+    def test_awaitable(self):
+        """ Rescheduling waits for a returned awaitable to complete """
+        waiting = []
+
+        def f():
+            waiting.append(asyncio.Future(loop=self.loop))
+            return waiting[-1]
+
+        call = self.makeCall(f)
+        call.start(SimpleSchedule(1))
+        self.loop.advance(1)
+        self.loop.advance(5)
+        self.assertEqual(len(waiting), 1)
+
+        waiting[0].set_result(None)
+        self.loop.advance(0)
+        self.loop.advance(1)
+        self.assertEqual(len(waiting), 2)
+        call.stop()
+
+    def test_stopWhileRunning(self):
+        """ A call stopped while its awaitable runs stops once it is done """
+        waiting = asyncio.Future(loop=self.loop)
+        call = self.makeCall(lambda: waiting)
+        future = call.start(SimpleSchedule(1))
+        self.loop.advance(1)
+
+        call.stop()
+        self.assertFalse(future.done())
+        waiting.set_result(None)
+        self.loop.advance(0)
+        self.assertTrue(future.result() is call)
+        self.assertTrue(call.call is None)
+
+    def test_error(self):
+        """ An exception stops the call """
+        def f():
+            raise TestException('broken')
+
+        call = self.makeCall(f)
+        future = call.start(SimpleSchedule(1))
+        self.loop.advance(1)
+
+        self.assertFalse(call.running)
+        self.assertTrue(isinstance(future.exception(), TestException))
+        self.assertEqual(self.loop.pending(), 0)
+
+    def test_failedAwaitable(self):
+        """ A failed awaitable stops the call """
+        waiting = asyncio.Future(loop=self.loop)
+        call = self.makeCall(lambda: waiting)
+        future = call.start(SimpleSchedule(1))
+        self.loop.advance(1)
+
+        waiting.set_exception(TestException('broken'))
+        self.loop.advance(0)
+        self.assertFalse(call.running)
+        self.assertTrue(isinstance(future.exception(), TestException))
+
+    def test_eventLoop(self):
+        """ Calls run in a real event loop """
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        done = asyncio.Future(loop=loop)
+        callable = IncrementingCallable()
+
+        def f():
+            callable()
+            if callable.count == 3:
+                done.set_result(None)
+
+        call = ScheduledCall(f)
+        call.clock = Scheduler(loop)
+        future = call.start(SimpleSchedule(0.01))
+        loop.run_until_complete(done)
+        call.stop()
+        self.assertTrue(loop.run_until_complete(future) is call)
+
+
+class SchedulerTestCase(unittest.TestCase):
+    """ Tests for sharing a Scheduler between scheduled calls """
+    def setUp(self):
+        if aio.asyncio is None:
+            self.skipTest('asyncio and trollius are not installed')
+        self.loop = ManualLoop()
+        self.scheduler = Scheduler(self.loop)
+
+    def test_singleHandle(self):
+        """ Many scheduled calls use a single handle of the loop """
+        callables = [IncrementingCallable() for i in range(100)]
+        calls = [ScheduledCall(c) for c in callables]
+
+        for i, call in enumerate(calls):
+            call.clock = self.scheduler
+            call.start(SimpleSchedule(1 + (i % 3)))
+
+        self.assertEqual(self.loop.pending(), 1)
+        self.assertEqual(len(self.scheduler), 100)
+
+        for i in range(6):
+            self.loop.advance(1)
+        self.assertEqual([c.count for c in callables[:3]], [6, 3, 2])
+        self.assertEqual(self.loop.pending(), 1)
+
+        for call in calls:
+            call.stop()
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_sharedSchedule(self):
+        """ Calls sharing a wall clock schedule compute the next entry
+        once """
+        schedule = CountingCronSchedule('0 0 1 1 *')
+
+        for i in range(50):
+            call = ScheduledCall(IncrementingCallable())
+            call.clock = self.scheduler
+            call.start(schedule)
+
+        self.assertEqual(schedule.count, 1)
+        self.assertEqual(len(set([timer.when() for entry, count, timer in
+                                  self.scheduler._timers])), 1)
+
+    def test_cancel(self):
+        """ Cancelled timers do not run """
+        made = []
+        first = self.scheduler.call_later(1, made.append, 1)
+        self.scheduler.call_later(2, made.append, 2)
+        first.cancel()
+        self.assertTrue(first.cancelled())
+
+        self.loop.advance(2)
+        self.assertEqual(made, [2])
+        self.assertEqual(len(self.scheduler), 0)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ScheduledCallTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(SchedulerTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
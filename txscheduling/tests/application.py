@@ -0,0 +1,166 @@
+import unittest
+
+from twisted.internet import defer, task
+
+from txscheduling.application import ScheduledCallService, SchedulerService
+from txscheduling.store import JobState, MemoryJobStore
+from txscheduling.tests.task import (MinuteSchedule, IncrementingCallable,
+                                     TestException)
+
+
+
+def fail():
+    raise TestException()
+
+
+class ScheduledCallServiceTestCase(unittest.TestCase):
+    """ Tests for the service running a single scheduled call """
+    def test_startStop(self):
+        """ The call runs while the service is running """
+        clock = task.Clock()
+        callable = IncrementingCallable()
+        service = ScheduledCallService(MinuteSchedule(60), callable)
+        service.call.clock = clock
+
+        service.startService()
+        clock.advance(60)
+        self.assertEqual(callable.count, 1)
+
+        service.stopService()
+        self.assertFalse(service.call.running)
+        self.assertEqual(clock.getDelayedCalls(), [])
+
+    def test_stopWaits(self):
+        """ Stopping waits for a run in progress """
+        clock = task.Clock()
+        pending = defer.Deferred()
+        service = ScheduledCallService(MinuteSchedule(60), lambda: pending)
+        service.call.clock = clock
+
+        service.startService()
+        clock.advance(60)
+        stopped = []
+        service.stopService().addCallback(stopped.append)
+        self.assertEqual(stopped, [])
+        self.assertTrue(service.running)
+
+        pending.callback(None)
+        self.assertEqual(stopped, [None])
+        self.assertFalse(service.running)
+
+
+class SchedulerServiceTestCase(unittest.TestCase):
+    """ Tests for the service running a registry of jobs """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.callable = IncrementingCallable()
+        self.service = SchedulerService(self.clock)
+        self.schedule = MinuteSchedule(60)
+
+    def test_bulk(self):
+        """ Every job starts and stops with the service on one delayed
+        call """
+        calls = [self.service.addJob(i, self.schedule, self.callable)
+                 for i in range(1000)]
+        self.assertFalse([call for call in calls if call.running])
+
+        self.service.startService()
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(60)
+        self.assertEqual(self.callable.count, 1000)
+
+        self.service.stopService()
+        self.assertFalse([call for call in calls if call.running])
+        self.assertEqual(len(self.service.wheel), 0)
+
+    def test_runtime(self):
+        """ Jobs added while running start at once and removed jobs stop """
+        self.service.startService()
+        call = self.service.addJob('a', self.schedule, self.callable)
+        self.assertTrue(call.running)
+
+        replacement = self.service.addJob('a', self.schedule, self.callable)
+        self.assertFalse(call.running)
+        self.clock.advance(60)
+        self.assertEqual(self.callable.count, 1)
+
+        self.service.removeJob('a')
+        self.assertFalse(replacement.running)
+        self.assertEqual(self.service.jobs, {})
+        self.clock.advance(60)
+        self.assertEqual(self.callable.count, 1)
+
+    def test_failed(self):
+        """ A failing job stops without affecting the others """
+        self.service.addJob('failing', self.schedule, fail)
+        self.service.addJob('ok', self.schedule, self.callable)
+        self.service.startService()
+        self.clock.pump([60, 60])
+
+        self.assertFalse(self.service.jobs['failing'].running)
+        self.assertEqual(self.callable.count, 2)
+        self.service.stopService()
+
+    def test_stopWaits(self):
+        """ Stopping waits for the jobs with runs in progress """
+        pending = defer.Deferred()
+        self.service.addJob('pending', self.schedule, lambda: pending)
+        self.service.addJob('ok', self.schedule, self.callable)
+        self.service.startService()
+        self.clock.advance(60)
+
+        stopped = []
+        self.service.stopService().addCallback(stopped.append)
+        self.assertEqual(stopped, [])
+        self.assertFalse(self.service.running)
+
+        pending.callback(None)
+        self.assertEqual(len(stopped), 1)
+
+    def test_addWhileStopping(self):
+        """ Jobs added while runs in progress finish are not started until the
+        service starts again """
+        pending = defer.Deferred()
+        self.service.addJob('pending', self.schedule, lambda: pending)
+        self.service.startService()
+        self.clock.advance(60)
+
+        stopped = []
+        self.service.stopService().addCallback(stopped.append)
+        call = self.service.addJob('late', self.schedule, self.callable)
+        self.assertFalse(call.running)
+
+        pending.callback(None)
+        self.assertEqual(len(stopped), 1)
+        self.clock.advance(60)
+        self.assertEqual(self.callable.count, 0)
+
+        self.service.startService()
+        self.assertTrue(call.running)
+        self.service.stopService()
+
+    def test_store(self):
+        """ Saved jobs are restored when the service starts """
+        store = MemoryJobStore()
+        self.service.store = store
+        self.clock.advance(300)
+        store.record(JobState('a', repr(self.schedule), 60, 120))
+
+        self.service.addJob('a', self.schedule, self.callable)
+        self.service.startService()
+        self.clock.advance(0)
+        self.assertEqual(self.callable.count, 1)
+        self.assertEqual(self.service.jobs['a'].misfires, 1)
+
+        self.service.removeJob('a')
+        self.assertEqual(store.jobs, {})
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ScheduledCallServiceTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(SchedulerServiceTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
@@ -0,0 +1,56 @@
+import json
+import sys
+import unittest
+from doctest import DocTestSuite
+from StringIO import StringIO
+
+from txscheduling import benchmarks
+from txscheduling.benchmarks import __main__ as main
+from txscheduling.benchmarks import runBenchmarks
+
+
+
+class BenchmarksTestCase(unittest.TestCase):
+    """ Tests that the benchmarks run and report their results """
+    def test_runBenchmarks(self):
+        """ Every benchmark runs at a small scale and reports its speed """
+        results = runBenchmarks(scale=0.01, repeat=1)
+        self.assertEqual(set(results['results']),
+                         set(name for name, factory in
+                             benchmarks.getBenchmarks()))
+        for result in results['results'].values():
+            self.assertTrue(result['operations'] > 0)
+            self.assertTrue(result['seconds'] >= 0)
+        json.dumps(results)
+    
+    def test_names(self):
+        """ Only benchmarks whose names contain a given name run """
+        results = runBenchmarks(['parseCronLine'], scale=0.01, repeat=1)
+        self.assertEqual(sorted(results['results']),
+                         ['parseCronLine', 'parseCronLine.cached',
+                          'parseCronLine.crontab',
+                          'parseCronLine.crontab.entryCache',
+                          'parseCronLine.entryCache'])
+    
+    def test_main(self):
+        """ The command line writes the results as JSON """
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            status = main.main(['--scale', '0.01', '--repeat', '1',
+                                'getNextEntry.realistic'])
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(status, 0)
+        self.assertEqual(list(json.loads(output.getvalue())['results']),
+                         ['getNextEntry.realistic'])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(BenchmarksTestCase))
+    suite.addTest(DocTestSuite(benchmarks))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
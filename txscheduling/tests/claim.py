@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import zope.interface
+
+from twisted.internet import task, defer
+from twisted.trial.unittest import TestCase
+
+from txscheduling.claim import ClaimBatcher, SQLiteClaimProvider
+from txscheduling.executor import ReactorExecutor
+from txscheduling.interfaces import IClaimProvider
+from txscheduling.task import TimerWheel
+from txscheduling.tests.task import (TestableScheduledCall, MinuteSchedule,
+                                     IncrementingCallable)
+
+
+
+class RecordingProvider(object):
+    """ A claim provider that claims the slots of even jobs and records each
+    request """
+    zope.interface.implements(IClaimProvider)
+
+    def __init__(self):
+        self.requests = []
+
+    def claim(self, slots):
+        self.requests.append(slots)
+        return set([slot for slot in slots if slot[0] % 2 == 0])
+
+
+class FailingProvider(object):
+    zope.interface.implements(IClaimProvider)
+
+    def claim(self, slots):
+        return defer.fail(IOError('lock server unavailable'))
+
+
+class ClaimBatcherTestCase(unittest.TestCase):
+    """ Tests for batching the claims of scheduled calls """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.provider = RecordingProvider()
+        self.batcher = ClaimBatcher(self.provider, self.clock)
+        self.callable = IncrementingCallable()
+
+    def makeCalls(self, count):
+        wheel = TimerWheel(self.clock)
+        schedule = MinuteSchedule(60)
+        calls = []
+        for i in range(count):
+            call = TestableScheduledCall(wheel, self.callable)
+            call.jobId = i
+            call.claimer = self.batcher
+            call.start(schedule)
+            calls.append(call)
+        return calls
+
+    def test_batched(self):
+        """ Calls due in the same wakeup make one request """
+        calls = self.makeCalls(1000)
+        self.clock.advance(60)
+        self.assertEqual(len(self.provider.requests), 1)
+        self.assertEqual(len(self.provider.requests[0]), 1000)
+        self.assertTrue((0, 60) in self.provider.requests[0])
+        self.assertEqual(self.callable.count, 500)
+        self.assertEqual((self.batcher.claims, self.batcher.claimed),
+                         (1000, 500))
+        self.assertEqual(calls[1].unclaimed, 1)
+
+        self.clock.advance(60)
+        self.assertEqual(len(self.provider.requests), 2)
+        self.assertEqual(self.callable.count, 1000)
+
+    def test_perMinute(self):
+        """ Claims for entries in different minutes are requested
+        separately """
+        self.batcher.claim(0, 59.9999)
+        self.batcher.claim(2, 60)
+        self.batcher.claim(4, 125)
+        self.clock.advance(0)
+        self.assertEqual(self.provider.requests, [[(0, 60), (2, 60)],
+                                                  [(4, 125)]])
+
+    def test_failed(self):
+        """ Entries whose claim fails are skipped and the calls continue """
+        self.batcher.provider = FailingProvider()
+        call, = self.makeCalls(1)
+        self.clock.advance(60)
+        self.assertEqual((self.callable.count, call.unclaimed), (0, 1))
+        self.assertTrue(call.running)
+        call.stop()
+
+    def test_jobId(self):
+        """ Calls without a job id cannot be claimed """
+        call = TestableScheduledCall(self.clock, self.callable)
+        call.claimer = self.batcher
+        self.assertRaises(ValueError, call.start, MinuteSchedule(60))
+        self.assertFalse(call.running)
+
+
+def claimed(provider, slots):
+    """ Return the slots a provider running on the reactor thread claims
+    """
+    results = []
+    provider.claim(slots).addCallback(results.append)
+    return results[0]
+
+
+class SQLiteClaimProviderTestCase(TestCase):
+    """ Tests for claiming slots in a shared SQLite database """
+    def setUp(self):
+        super(SQLiteClaimProviderTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'claims.db')
+        self.providers = [SQLiteClaimProvider(self.path, node,
+                                              executor=ReactorExecutor())
+                          for node in ('a', 'b')]
+
+    def tearDown(self):
+        for provider in self.providers:
+            provider.close()
+        shutil.rmtree(self.directory)
+        super(SQLiteClaimProviderTestCase, self).tearDown()
+
+    def test_claim(self):
+        """ Each slot is claimed by the first node asking for it """
+        a, b = self.providers
+        self.assertEqual(claimed(a, [('x', 60), ('y', 60)]),
+                         set([('x', 60), ('y', 60)]))
+        self.assertEqual(claimed(b, [('x', 60), ('y', 60), ('z', 60)]),
+                         set([('z', 60)]))
+        self.assertEqual(claimed(a, [('x', 60), ('x', 120)]),
+                         set([('x', 60), ('x', 120)]))
+
+    def test_jobIds(self):
+        """ Unicode, byte string and integer job ids can be claimed """
+        a, b = self.providers
+        slots = [(u'caf\xe9', 60), ('caf\xc3\xa9 \xff', 60), (5, 60)]
+        self.assertEqual(claimed(a, slots), set(slots))
+        self.assertEqual(claimed(b, slots), set())
+
+    def test_expired(self):
+        """ Old slots are deleted """
+        a, b = self.providers
+        claimed(a, [('x', 60)])
+        claimed(b, [('x', 60 + 86401)])
+        self.assertEqual(claimed(b, [('x', 60)]), set([('x', 60)]))
+
+    def test_thread(self):
+        """ By default transactions run in a thread of the provider """
+        provider = SQLiteClaimProvider(self.path, 'c')
+        self.providers.append(provider)
+        provider.executor.start()
+        d = provider.claim([('x', 60)])
+        d.addCallback(self.assertEqual, set([('x', 60)]))
+        return d
+
+    def test_nodes(self):
+        """ Calls on two nodes sharing a database run each entry once """
+        clock = task.Clock()
+        callable = IncrementingCallable()
+        for provider in self.providers:
+            batcher = ClaimBatcher(provider, clock)
+            for i in range(10):
+                call = TestableScheduledCall(clock, callable)
+                call.jobId = 'job%d' % (i,)
+                call.claimer = batcher
+                call.start(MinuteSchedule(60))
+
+        for minute in range(3):
+            clock.advance(60)
+        self.assertEqual(callable.count, 30)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ClaimBatcherTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(SQLiteClaimProviderTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
@@ -0,0 +1,209 @@
+import unittest
+
+from twisted.internet import defer, task
+
+from txscheduling.application import SchedulerService
+from txscheduling.clock import AnchoredClock
+from txscheduling.cron import CronSchedule, NoMatch
+from txscheduling.store import JobState, MemoryJobStore
+from txscheduling.task import ScheduledCall
+from txscheduling.tests.task import IncrementingCallable, MinuteSchedule
+from txscheduling.timezone import utc
+
+
+
+class WallClock(object):
+    """ A wall clock that can be stepped independently of the reactor """
+    def __init__(self, reactor, offset):
+        self.reactor = reactor
+        self.offset = offset
+
+    def __call__(self):
+        return self.reactor.seconds() + self.offset
+
+
+class EndingSchedule(MinuteSchedule):
+    """ A wall clock schedule with one entry """
+    def iterEntries(self, current=None, timestamps=False):
+        if current < 1300003200:
+            yield 1300003200
+
+
+class RecordingClaimer(object):
+    """ A claimer that wins every entry and records the slots asked for """
+    def __init__(self):
+        self.slots = []
+
+    def claim(self, jobId, time):
+        self.slots.append((jobId, time))
+        return defer.succeed(True)
+
+
+class AnchoredClockTestCase(unittest.TestCase):
+    """ Tests for mapping wall clock entries to reactor time """
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.reactor.advance(1000)
+        # 2011-03-13 07:59:30 UTC
+        self.wall = WallClock(self.reactor, 1300003170 - 1000)
+        # The offset is measured when the clock is made, so the class reads
+        # the stepped wall clock until the test is done
+        self.wallTime = AnchoredClock.__dict__['_wallTime']
+        AnchoredClock._wallTime = self.wall
+        self.clock = AnchoredClock(self.reactor)
+        self.jumps = []
+        self.clock.addJumpObserver(self.jumps.append)
+
+    def tearDown(self):
+        AnchoredClock._wallTime = self.wallTime
+
+    def test_getNextTime(self):
+        """ Entries are integer timestamps moved by the offset """
+        schedule = CronSchedule('* * * * *', zone=utc)
+        self.assertEqual(self.clock.wallTime(), 1300003170)
+        self.assertEqual(self.clock.getNextTime(schedule), 1030)
+
+        self.reactor.advance(30)
+        self.assertEqual(self.clock.getNextTime(schedule), 1090)
+
+    def test_shared(self):
+        """ The next entry of equal schedules is found once """
+        self.clock.getNextTime(CronSchedule('0 * * * *', zone=utc))
+        schedule = CronSchedule('0 * * * *', zone=utc)
+        self.clock._entries[schedule] = 1300003200 + 42
+        self.assertEqual(self.clock.getNextTime(schedule), 1072)
+
+    def test_prepare(self):
+        """ Entries are found in one batch ahead of getNextTime """
+        schedules = [CronSchedule('* * * * *', zone=utc),
+                     CronSchedule('30 8 * * *', zone=utc)]
+        self.clock.prepare(schedules)
+        self.assertEqual([self.clock._entries[schedule]
+                          for schedule in schedules],
+                         [1300003200, 1300005000])
+        self.assertEqual([self.clock.getNextTime(schedule)
+                          for schedule in schedules], [1030, 2830])
+
+    def test_noEntry(self):
+        """ Schedules without a next entry raise NoMatch """
+        schedule = EndingSchedule(60)
+        self.assertEqual(self.clock.getNextTime(schedule), 1030)
+
+        self.reactor.advance(30)
+        self.assertRaises(NoMatch, self.clock.getNextTime, schedule)
+
+    def test_drift(self):
+        """ Small drift keeps the mapping """
+        self.wall.offset += 0.5
+        self.reactor.advance(5)
+        self.assertEqual(self.clock.check(), 0)
+        self.assertEqual(self.jumps, [])
+
+    def test_jump(self):
+        """ Jumps replace the mapping and are reported """
+        schedule = CronSchedule('0 * * * *', zone=utc)
+        self.assertEqual(self.clock.getNextTime(schedule), 1030)
+
+        self.wall.offset -= 1800
+        self.reactor.advance(0.5)
+        self.assertEqual(self.clock.getNextTime(schedule), 1030)
+
+        self.reactor.advance(0.5)
+        self.assertEqual(self.clock.getNextTime(schedule), 1030 + 1800)
+        self.assertEqual(self.jumps, [-1800])
+        self.assertEqual(self.clock.jumps, 1)
+
+    def test_replan(self):
+        """ The entries jobs of a scheduler service wait for move with the
+        wall clock """
+        callable = IncrementingCallable()
+        service = SchedulerService(self.clock)
+        call = service.addJob('hourly', CronSchedule('0 * * * *', zone=utc),
+                              callable)
+        service.startService()
+
+        # Back by 30 minutes, 08:00 is half an hour further away
+        self.wall.offset -= 1800
+        self.reactor.advance(1)
+        self.clock.check()
+        self.reactor.advance(29)
+        self.assertEqual(callable.count, 0)
+        self.reactor.advance(1800)
+        self.assertEqual((callable.count, call.misfires), (1, 0))
+
+        # Forward by an hour and a minute, past 09:00, which is due at once
+        # and late
+        self.wall.offset += 3660
+        self.reactor.advance(1)
+        self.clock.check()
+        self.reactor.advance(0)
+        self.assertEqual((callable.count, call.misfires), (2, 1))
+        service.stopService()
+
+    def test_checkedPeriodically(self):
+        """ Jumps are found and jobs moved before the stale entry is due,
+        without checking by hand """
+        callable = IncrementingCallable()
+        service = SchedulerService(self.clock)
+        service.addJob('daily', CronSchedule('0 9 * * *', zone=utc),
+                       callable)
+        service.startService()
+
+        # Back by 30 minutes at 08:40, so 09:00 is 50 minutes away
+        self.reactor.advance(2430)
+        self.wall.offset -= 1800
+        self.reactor.pump([1] * 2900)
+        self.assertEqual(callable.count, 0)
+        self.reactor.pump([1] * 200)
+        self.assertEqual(callable.count, 1)
+        self.assertEqual(self.clock.jumps, 1)
+        service.stopService()
+
+    def test_wallTimeState(self):
+        """ Claims and saved states use wall clock times """
+        store = MemoryJobStore()
+        claimer = RecordingClaimer()
+        call = ScheduledCall(IncrementingCallable())
+        call.clock = self.clock
+        call.jobId = 'minutely'
+        call.store = store
+        call.claimer = claimer
+        call.start(CronSchedule('* * * * *', zone=utc))
+        self.assertEqual(store.load()['minutely'].nextRun, 1300003200)
+
+        self.reactor.advance(30)
+        self.assertEqual(claimer.slots, [('minutely', 1300003200)])
+        self.assertEqual(store.load()['minutely'][2:],
+                         (1300003200, 1300003260))
+        call.stop()
+
+    def test_restoreWallTime(self):
+        """ Saved wall clock times are restored on the clock """
+        call = ScheduledCall(IncrementingCallable())
+        call.clock = self.clock
+        schedule = CronSchedule('* * * * *', zone=utc)
+        call.restore(JobState('minutely', repr(schedule), 1300003080,
+                              1300003140))
+        call.start(schedule)
+        self.assertEqual(call.lastRun, 910)
+        self.assertEqual(call.call.getTime(), 1000)
+        call.stop()
+
+    def test_stopsChecking(self):
+        """ The offset is only checked while there are observers or
+        entries """
+        self.clock.removeJumpObserver(self.jumps.append)
+        self.reactor.advance(1)
+        self.assertEqual(self.reactor.getDelayedCalls(), [])
+
+        self.clock.getNextTime(CronSchedule('* * * * *', zone=utc))
+        self.assertEqual(len(self.reactor.getDelayedCalls()), 1)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(AnchoredClockTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
@@ -1,10 +1,18 @@
-from datetime import datetime
+import calendar
+import cPickle as pickle
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from time import mktime
 
 from unittest import TestCase, TextTestRunner, TestSuite, TestLoader
 from doctest import DocTestSuite
 
-from txscheduling import cron
-from txscheduling.cron import CronSchedule, InvalidCronLine
+from txscheduling import cron, timezone
+from txscheduling.cron import CronSchedule, InvalidCronLine, InvalidCronEntry
+from txscheduling.interfaces import IBatchSchedule
+from txscheduling.tests.timezone import central, timestamp
 
 
 
@@ -209,6 +217,590 @@ class AllDOMTestCase(TestCase):
                                                              59, 00, 00)),
                          datetime(2008,10,1,00,00,00,00))
 
+class DayMatchingTestCase(TestCase):
+    def test_restrictedDowOnly(self):
+        """ Only the days of the week are used when days of the month are * """
+        schedule = CronSchedule('*/15 * * * 1,3,5')
+        
+        self.assertEqual(schedule.getNextEntry(datetime(2008,9,2,10,00,00,00)),
+                         datetime(2008,9,3,00,00,00,00))
+    
+    def test_restrictedDomOnly(self):
+        """ Only the days of the month are used when days of the week are * """
+        schedule = CronSchedule('*/15 * 5 * *')
+        
+        self.assertEqual(schedule.getNextEntry(datetime(2008,9,3,10,00,00,00)),
+                         datetime(2008,9,5,00,00,00,00))
+    
+    def test_skipShortMonths(self):
+        """ Months without a matching day of the month are skipped """
+        schedule = CronSchedule('0 0 31 * *')
+        
+        self.assertEqual(schedule.getNextEntry(datetime(2009,1,31,1,00,00,00)),
+                         datetime(2009,3,31,00,00,00,00))
+    
+    def test_leapDay(self):
+        """ The 29th of February is found in the next leap year """
+        schedule = CronSchedule('0 0 29 2 *')
+        
+        self.assertEqual(schedule.getNextEntry(datetime(2009,1,31,1,00,00,00)),
+                         datetime(2012,2,29,00,00,00,00))
+        self.assertEqual(schedule.getNextEntry(datetime(2096,2,29,1,00,00,00)),
+                         datetime(2104,2,29,00,00,00,00))
+
+    def test_neverMatches(self):
+        """ Lines whose days of the month are in none of their months are
+        rejected """
+        self.assertRaises(InvalidCronLine, CronSchedule, '0 0 31 2 *')
+        self.assertRaises(InvalidCronLine, CronSchedule, '0 0 30,31 2 *')
+        self.assertRaises(InvalidCronLine, CronSchedule, '0 0 31 4,6,9,11 *')
+
+        schedule = CronSchedule('0 0 31 2 1')
+        self.assertEqual(schedule.getNextEntry(datetime(2011,1,31,1,00,00,00)),
+                         datetime(2011,2,7,00,00,00,00))
+
+    def test_searchBound(self):
+        """ Sparse lines match within the documented number of candidate
+        months """
+        for line, start, expected in (
+            ('0 0 31 * *', datetime(2011,7,31,1,00), datetime(2011,8,31,00,00)),
+            ('0 0 31 4,12 *', datetime(2011,12,31,1,00),
+             datetime(2012,12,31,00,00)),
+            ('59 23 29 2 *', datetime(2096,2,29,23,59),
+             datetime(2104,2,29,23,59))):
+            schedule = CronSchedule(line)
+            entry = schedule._findEntry(start.year, start.month, start.day,
+                                        start.hour, start.minute + 1)
+            self.assertEqual(datetime(*entry), expected)
+
+class EntriesTestCase(TestCase):
+    def _assertMatchesNextEntry(self, line, start, count):
+        schedule = CronSchedule(line)
+        expected = []
+        current = start
+        
+        for i in range(count):
+            current = schedule.getNextEntry(current)
+            expected.append(current)
+        
+        self.assertEqual(schedule.getNextEntries(start, count), expected)
+        self.assertEqual(schedule.getNextEntries(start, count,
+                                                 timestamps=True),
+                         [mktime(entry.timetuple()) for entry in expected])
+    
+    def test_dense(self):
+        """ Entries of a dense schedule match repeated getNextEntry calls """
+        self._assertMatchesNextEntry('* * * * *', datetime(2008,12,31,23,00),
+                                     200)
+    
+    def test_ranges(self):
+        """ Entries of a ranged schedule match repeated getNextEntry calls """
+        self._assertMatchesNextEntry('15-20 3-6 5-10 5-8 2-3',
+                                     datetime(2008,01,01,00,00), 500)
+    
+    def test_sparse(self):
+        """ Entries of a sparse schedule match repeated getNextEntry calls """
+        self._assertMatchesNextEntry('0 0 29 2 *', datetime(2008,01,01,00,00),
+                                     3)
+    
+    def test_iterator(self):
+        """ iterEntries continues past the requested count """
+        schedule = CronSchedule('*/20 * * * *')
+        entries = schedule.iterEntries(datetime(2008,01,01,00,30))
+        
+        self.assertEqual(entries.next(), datetime(2008,01,01,00,40))
+        self.assertEqual(entries.next(), datetime(2008,01,01,01,00))
+        self.assertEqual(entries.next(), datetime(2008,01,01,01,20))
+    
+    def test_invalid_start(self):
+        """ iterEntries requires a datetime """
+        self.assertRaises(ValueError, CronSchedule('* * * * *').getNextEntries,
+                          '', 5)
+
+class EvaluateSchedulesTestCase(TestCase):
+    lines = ['* * * * *', '15-20 3-6 5-10 5-8 2-3', '*/15 * */5 * *',
+             '*/15 * * * 1,3,5', '0 0 29 2 *', '*/7 1,13 * 3,9 *']
+    
+    def setUp(self):
+        if cron.numpy is None:
+            self.skipTest('numpy is not installed')
+    
+    def test_matchesNextEntry(self):
+        """ Bulk evaluation matches repeated getNextEntry calls """
+        schedules = [CronSchedule(line) for line in self.lines]
+        start = datetime(2008,2,28,22,17,30)
+        end = datetime(2008,3,6,3,45,00)
+        expected = []
+        
+        for index, schedule in enumerate(schedules):
+            current = schedule.getNextEntry(start)
+            while current <= end:
+                expected.append((index, int(mktime(current.timetuple()))))
+                current = schedule.getNextEntry(current)
+        
+        rows = cron.evaluateSchedules(schedules, start, end, chunk=4)
+        self.assertEqual([tuple(row) for row in rows.tolist()], expected)
+    
+    def test_empty(self):
+        """ Bulk evaluation of an empty window """
+        rows = cron.evaluateSchedules([CronSchedule('0 0 * * *')],
+                                      datetime(2008,1,1,1,00),
+                                      datetime(2008,1,1,2,00))
+        self.assertEqual(rows.shape, (0, 2))
+
+class BatchDelaysTestCase(TestCase):
+    lines = ['* * * * *', '15-20 3-6 5-10 5-8 2-3', '*/15 * */5 * *',
+             '*/15 * * * 1,3,5', '0 0 29 2 *', '*/7 1,13 * 3,9 *',
+             '0 12 1,15 * 1', '59 23 31 * *', '*/10 * * * * *']
+    starts = [datetime(2008,2,28,22,17,30), datetime(2008,2,29,23,59,59),
+              datetime(2008,3,31,23,59,0), datetime(2008,6,4,0,0,0),
+              datetime(2008,12,31,23,45,10)]
+    
+    def setUp(self):
+        self.arrayBatch = cron._ARRAY_BATCH
+    
+    def tearDown(self):
+        cron._ARRAY_BATCH = self.arrayBatch
+    
+    def assertMatchesEntries(self, schedules):
+        for start in self.starts:
+            now = mktime(start.timetuple()) + 0.5
+            expected = [schedule.getNextEntries(now, 1, True)[0] - now
+                        for schedule in schedules]
+            self.assertEqual(CronSchedule.getDelaysForNext(schedules, now),
+                             expected)
+    
+    def test_provides(self):
+        """ CronSchedules provide the batch interface """
+        self.assertTrue(IBatchSchedule.providedBy(CronSchedule('* * * * *')))
+    
+    def test_matchesEntries(self):
+        """ Batch delays match the next entry of each schedule """
+        schedules = [CronSchedule(line) for line in self.lines]
+        schedules += [CronSchedule(line, zone=central)
+                      for line in self.lines]
+        schedules.append(schedules[0])
+        self.assertMatchesEntries(schedules)
+    
+    def test_table(self):
+        """ Schedules with a table answer from it """
+        schedule = CronSchedule('15 9 * * 1-5')
+        schedule.useTable(schedule.buildTable(2008))
+        self.assertMatchesEntries([schedule, CronSchedule('15 9 * * 1-5')])
+    
+    def test_arrays(self):
+        """ Whole minute schedules searched with array operations match the
+        next entry of each schedule """
+        if cron.numpy is None:
+            self.skipTest('numpy is not installed')
+        
+        cron._ARRAY_BATCH = 1
+        self.assertMatchesEntries([CronSchedule(line) for line in self.lines])
+
+class CursorTestCase(TestCase):
+    start = mktime(datetime(2008,2,28,22,17,30).timetuple()) + 0.5
+    
+    def assertSteps(self, schedule, count):
+        cursor = schedule.cursor()
+        now = self.start
+        entries = []
+        
+        for i in range(count):
+            now += cursor.getDelayForNext(now)
+            entries.append(now)
+        
+        self.assertEqual(entries,
+                         schedule.getNextEntries(self.start, count, True))
+    
+    def test_steps(self):
+        """ Stepping from each entry matches the entries of the schedule """
+        for line in ('* * * * *', '15-20 3-6 * * 2-6', '*/10 * * * * *',
+                     '0 12 1,15 * 1', '0 0 29 2 *'):
+            self.assertSteps(CronSchedule(line), 3 if '29' in line else 100)
+            self.assertSteps(CronSchedule(line, zone=central),
+                             3 if '29' in line else 100)
+    
+    def test_ahead(self):
+        """ An entry still ahead of the clock is returned again """
+        cursor = CronSchedule('0 * * * *').cursor()
+        delay = cursor.getDelayForNext(self.start)
+        self.assertEqual(cursor.getDelayForNext(self.start + 60), delay - 60)
+    
+    def test_drift(self):
+        """ A clock past the next entry of the cursor searches from now """
+        schedule = CronSchedule('*/5 * * * *')
+        cursor = schedule.cursor()
+        cursor.getDelayForNext(self.start)
+        now = self.start + 86400 * 3 + 17
+        self.assertEqual(now + cursor.getDelayForNext(now),
+                         schedule.getNextEntries(now, 1, True)[0])
+    
+    def test_shared(self):
+        """ Cursors over an interned schedule move independently """
+        schedule = CronSchedule.intern('*/5 * * * *')
+        first, second = schedule.cursor(), schedule.cursor()
+        first.getDelayForNext(self.start)
+        first.getDelayForNext(self.start + 300)
+        self.assertEqual(second.getDelayForNext(self.start), 149.5)
+        self.assertEqual(first.entry, second.entry + 300)
+
+class ParseCacheTestCase(TestCase):
+    def setUp(self):
+        cron.parseCache.clear()
+    
+    def tearDown(self):
+        cron.parseCache.clear()
+    
+    def test_normalizedHits(self):
+        """ Lines differing only in whitespace share a cache entry """
+        CronSchedule('*/5 * * * *')
+        CronSchedule(' */5  *\t* * * ')
+        
+        self.assertEqual(cron.parseCache.hits, 1)
+        self.assertEqual(cron.parseCache.misses, 1)
+        self.assertEqual(len(cron.parseCache), 1)
+    
+    def test_parseCronLineCopies(self):
+        """ parseCronLine results can be modified without affecting the cache """
+        cron.parseCronLine('0 * * * *')['minutes'].append(30)
+        
+        self.assertEqual(cron.parseCronLine('0 * * * *')['minutes'], [0])
+    
+    def test_invalidNotCached(self):
+        """ Invalid lines are not cached """
+        self.assertRaises(InvalidCronLine, CronSchedule, '* * * *')
+        self.assertEqual(len(cron.parseCache), 0)
+    
+    def test_intern(self):
+        """ Interned schedules for equivalent lines are the same object """
+        schedule = CronSchedule.intern('0 0 * * *')
+        
+        self.assertTrue(CronSchedule.intern(' 0 0 * * * ') is schedule)
+        self.assertFalse(CronSchedule('0 0 * * *') is schedule)
+        self.assertEqual(CronSchedule('0 0 * * *'), schedule)
+    
+    def test_pickle(self):
+        """ Schedules pickle as their line and are parsed through the cache
+        when unpickled """
+        schedule = CronSchedule('30 2 * * 1-5', zone=timezone.local)
+        data = pickle.dumps(schedule, pickle.HIGHEST_PROTOCOL)
+        
+        self.assertEqual(pickle.loads(data), schedule)
+        self.assertEqual(cron.parseCache.hits, 1)
+
+class FireTableTestCase(TestCase):
+    def setUp(self):
+        self.path = tempfile.mktemp()
+    
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def test_build(self):
+        """ A table holds every entry of the year as epoch minutes """
+        schedule = CronSchedule('0 12 * * 1')
+        table = schedule.buildTable(2011)
+        
+        self.assertEqual(len(table), 52)
+        self.assertEqual(list(table.minutes),
+                         [int(timestamp // 60) for timestamp in
+                          schedule.getNextEntries(datetime(2010,12,31,23,59),
+                                                  52, timestamps=True)])
+    
+    def test_getNextEntry(self):
+        """ Entries from a table match those found by searching """
+        schedule = CronSchedule('30 9 1,15 * 5')
+        expected = schedule.getNextEntries(datetime(2011,1,1), 60)
+        schedule.useTable(schedule.buildTable(2011))
+        
+        current = datetime(2011,1,1)
+        for entry in expected:
+            current = schedule.getNextEntry(current)
+            self.assertEqual(current, entry)
+    
+    def test_saveLoad(self):
+        """ Saved tables are mapped back with the same entries """
+        schedule = CronSchedule('*/10 * * * *')
+        table = schedule.buildTable(2011)
+        table.save(self.path)
+        
+        loaded = cron.FireTable.load(self.path)
+        try:
+            self.assertEqual(len(loaded), len(table))
+            self.assertEqual(loaded.minutes[-1], table.minutes[-1])
+            
+            minute = table.minutes[1000]
+            self.assertEqual(loaded.getNextMinute(minute),
+                             table.getNextMinute(minute))
+            
+            CronSchedule('*/10 * * * *').useTable(loaded)
+            self.assertRaises(ValueError, CronSchedule('0 * * * *').useTable,
+                              loaded)
+        finally:
+            loaded.close()
+    
+    def test_loadInvalid(self):
+        """ Files that are not tables are rejected """
+        with open(self.path, 'wb') as f:
+            f.write('not a table at all' * 10)
+        
+        self.assertRaises(ValueError, cron.FireTable.load, self.path)
+    
+    def test_outsideTable(self):
+        """ Times the table does not cover fall back to searching """
+        schedule = CronSchedule('0 0 1 1 *')
+        schedule.useTable(schedule.buildTable(2011))
+        
+        self.assertEqual(schedule.getNextEntry(datetime(2011,6,1)),
+                         datetime(2012,1,1))
+        self.assertEqual(schedule.getNextEntry(datetime(2009,6,1)),
+                         datetime(2010,1,1))
+    
+    def test_interned(self):
+        """ A table used by an interned schedule is used by every caller
+        sharing it, with the same answers """
+        schedule = CronSchedule.intern('15 4 * * *')
+        other = CronSchedule.intern('15  4 * * *')
+        expected = other.getNextEntry(datetime(2011,3,1))
+        
+        schedule.useTable(schedule.buildTable(2011))
+        self.assertTrue(other._table is schedule._table)
+        self.assertEqual(other.getNextEntry(datetime(2011,3,1)), expected)
+        
+        other.useTable(None)
+        self.assertTrue(schedule._table is None)
+
+class ZoneTestCase(TestCase):
+    """ Tests for schedules with an explicit zone """
+    def test_entries(self):
+        """ Entries are aware datetimes in the zone """
+        schedule = CronSchedule('0 9 * * *', zone=central)
+        entry = schedule.getNextEntry(datetime(2011,7,4,12,tzinfo=timezone.utc))
+        
+        self.assertEqual(entry.tzinfo, central)
+        self.assertEqual((entry.day, entry.hour), (4, 9))
+        self.assertEqual(timestamp(*entry.utctimetuple()[:6]),
+                         timestamp(2011,7,4,14))
+    
+    def test_naiveWallTime(self):
+        """ Naive datetimes are local times in the zone """
+        schedule = CronSchedule('0 9 * * *', zone=central)
+        
+        self.assertEqual(
+            schedule.getNextEntry(datetime(2011,7,4,8,59)).replace(tzinfo=None),
+            datetime(2011,7,4,9))
+    
+    def test_springForward(self):
+        """ Skipped local times run at the transition by default, once """
+        schedule = CronSchedule('*/20 1-3 * * *', zone=central)
+        entries = schedule.getNextEntries(datetime(2011,3,13,1,30), 4,
+                                          timestamps=True)
+        
+        self.assertEqual(entries, [timestamp(2011,3,13,7,40),
+                                   timestamp(2011,3,13,8),
+                                   timestamp(2011,3,13,8,20),
+                                   timestamp(2011,3,13,8,40)])
+    
+    def test_springForwardSkip(self):
+        """ Skipped local times can be skipped """
+        schedule = CronSchedule('30 2 * * *', zone=central,
+                                missing=timezone.MISSING_SKIP)
+        
+        self.assertEqual(schedule.getNextEntries(datetime(2011,3,12,2), 2,
+                                                 timestamps=True),
+                         [timestamp(2011,3,12,8,30),
+                          timestamp(2011,3,14,7,30)])
+    
+    def test_fallBack(self):
+        """ Repeated local times run once, at the earliest occurrence by
+        default """
+        schedule = CronSchedule('30 1 * * *', zone=central)
+        
+        self.assertEqual(schedule.getNextEntries(datetime(2011,11,5,12), 2,
+                                                 timestamps=True),
+                         [timestamp(2011,11,6,6,30),
+                          timestamp(2011,11,7,7,30)])
+        
+        # Still only once when asked during the second occurrence
+        self.assertEqual(schedule.getNextEntry(timestamp(2011,11,6,7,15)),
+                         schedule.getNextEntry(datetime(2011,11,7)))
+    
+    def test_fallBackLatest(self):
+        """ Repeated local times can run at the latest occurrence """
+        schedule = CronSchedule('30 1 * * *', zone=central,
+                                ambiguous=timezone.AMBIGUOUS_LATEST)
+        
+        self.assertEqual(schedule.getNextEntries(datetime(2011,11,5,12), 1,
+                                                 timestamps=True),
+                         [timestamp(2011,11,6,7,30)])
+    
+    def test_policies(self):
+        """ Unknown policies are rejected """
+        self.assertRaises(ValueError, CronSchedule, '* * * * *',
+                          ambiguous='both')
+        self.assertRaises(ValueError, CronSchedule, '* * * * *',
+                          missing='shift')
+    
+    def test_equality(self):
+        """ Schedules in different zones are not equal """
+        self.assertNotEqual(CronSchedule('0 0 * * *', zone=central),
+                            CronSchedule('0 0 * * *'))
+        self.assertEqual(CronSchedule('0 0 * * *', zone=central),
+                         CronSchedule('0 0 * * *', zone=central))
+        self.assertTrue(CronSchedule.intern('0 0 * * *', central) is not
+                        CronSchedule.intern('0 0 * * *'))
+    
+    def test_localZone(self):
+        """ The local zone agrees with mktime away from transitions """
+        schedule = CronSchedule('15 10 * * *', zone=timezone.local)
+        
+        self.assertEqual(schedule.getNextEntries(datetime(2011,7,4), 3,
+                                                 timestamps=True),
+                         CronSchedule('15 10 * * *').getNextEntries(
+                datetime(2011,7,4), 3, timestamps=True))
+    
+    def test_localFallBackLatest(self):
+        """ Entries at the latest occurrence of a repeated local hour name
+        the moment of their timestamp """
+        self.setLocalZone('America/New_York')
+        schedule = CronSchedule('30 1 * * *', zone=timezone.local,
+                                ambiguous=timezone.AMBIGUOUS_LATEST)
+        
+        entry = schedule.getNextEntry(datetime(2011,11,5,12))
+        self.assertEqual((entry.hour, entry.minute), (1, 30))
+        self.assertEqual(entry.utcoffset(), timedelta(hours=-5))
+        self.assertEqual(calendar.timegm(entry.utctimetuple()),
+                         timestamp(2011,11,6,6,30))
+        self.assertEqual(schedule.getNextEntries(datetime(2011,11,5,12), 1),
+                         [entry])
+    
+    def setLocalZone(self, name):
+        """ Use another system zone until the test is done """
+        previous = os.environ.get('TZ')
+        
+        def restore():
+            if previous is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = previous
+            time.tzset()
+            timezone._transitions.pop(timezone.local, None)
+        
+        self.addCleanup(restore)
+        os.environ['TZ'] = name
+        time.tzset()
+        timezone._transitions.pop(timezone.local, None)
+    
+    def test_getDelayForNext(self):
+        """ The delay is to the next entry in the zone """
+        schedule = CronSchedule('* * * * *', zone=central)
+        
+        self.assertTrue(0 < schedule.getDelayForNext() <= 60)
+
+class NamesTestCase(TestCase):
+    """ Tests for named months and days of the week and @ shortcuts """
+    def test_names(self):
+        """ Names match the same entries as their numbers """
+        self.assertEqual(CronSchedule('30 9 * Jun-aug MON-FRI/2,sun'),
+                         CronSchedule('30 9 * 6-8 2,4,0'))
+    
+    def test_unknownName(self):
+        """ Names that are not abbreviations of the field are rejected """
+        self.assertRaises(InvalidCronEntry, CronSchedule, '0 0 * mon *')
+        self.assertRaises(InvalidCronEntry, CronSchedule, '0 0 * * jan')
+    
+    def test_shortcuts(self):
+        """ Shortcuts are parsed as the lines they stand for """
+        self.assertEqual(CronSchedule('@hourly'), CronSchedule('0 * * * *'))
+        self.assertEqual(CronSchedule('@MIDNIGHT'), CronSchedule('@daily'))
+        self.assertEqual(CronSchedule('@annually').getNextEntry(
+                datetime(2011, 3, 1)), datetime(2012, 1, 1))
+        self.assertEqual(repr(CronSchedule(' @monthly ')),
+                         "CronSchedule('@monthly')")
+        self.assertRaises(InvalidCronLine, CronSchedule, '@reboot')
+    
+    def test_entryCache(self):
+        """ Entries repeated between lines are parsed once and results
+        cannot be modified through parseCronEntry """
+        cron._entryCache.clear()
+        CronSchedule('0 9 * * 1-5')
+        CronSchedule('30 9 * * 1-5')
+        self.assertEqual(len(cron._entryCache), 6)
+        
+        cron.parseCronEntry('1-5', 0, 6).append(6)
+        self.assertEqual(cron.parseCronEntry('1-5', 0, 6), [1, 2, 3, 4, 5])
+
+class SecondsTestCase(TestCase):
+    """ Tests for lines with a seconds field """
+    def test_getNextEntry(self):
+        """ Entries fall on the seconds of matching minutes """
+        schedule = CronSchedule('*/10 * * * * *')
+        
+        self.assertEqual(schedule.getNextEntry(datetime(2011,1,1,10,0,5,500)),
+                         datetime(2011,1,1,10,0,10))
+        self.assertEqual(schedule.getNextEntry(datetime(2011,1,1,10,0,10)),
+                         datetime(2011,1,1,10,0,20))
+        self.assertEqual(schedule.getNextEntry(datetime(2011,1,1,23,59,50)),
+                         datetime(2011,1,2,0,0,0))
+    
+    def test_sparse(self):
+        """ Seconds of minutes that do not match are skipped """
+        schedule = CronSchedule('15,45 30 12 * * 1')
+        
+        self.assertEqual(schedule.getNextEntry(datetime(2011,1,3,12,30,15)),
+                         datetime(2011,1,3,12,30,45))
+        self.assertEqual(schedule.getNextEntry(datetime(2011,1,3,12,30,45)),
+                         datetime(2011,1,10,12,30,15))
+    
+    def test_entries(self):
+        """ Entries match repeated getNextEntry calls """
+        schedule = CronSchedule('5-7,50 */30 * * * *')
+        start = datetime(2011,3,1,23,29,6)
+        expected = []
+        current = start
+        
+        for i in range(20):
+            current = schedule.getNextEntry(current)
+            expected.append(current)
+        
+        self.assertEqual(schedule.getNextEntries(start, 20), expected)
+        self.assertEqual(schedule.getNextEntries(start, 20, timestamps=True),
+                         [mktime(entry.timetuple()) for entry in expected])
+    
+    def test_zone(self):
+        """ Schedules with a zone have seconds too """
+        schedule = CronSchedule('*/15 * * * * *', zone=timezone.utc)
+        
+        self.assertEqual(schedule.getNextEntries(timestamp(2011,1,1,0,0,14),
+                                                 3, timestamps=True),
+                         [timestamp(2011,1,1,0,0,15),
+                          timestamp(2011,1,1,0,0,30),
+                          timestamp(2011,1,1,0,0,45)])
+    
+    def test_getDelayForNext(self):
+        """ Delays are to the next second """
+        schedule = CronSchedule('* * * * * *')
+        
+        self.assertTrue(0 < schedule.getDelayForNext() <= 1)
+    
+    def test_wholeMinutesOnly(self):
+        """ FireTables and evaluateSchedules only take whole minutes """
+        schedule = CronSchedule('*/10 * * * * *')
+        
+        self.assertRaises(ValueError, schedule.buildTable, 2011)
+        self.assertRaises(ValueError, schedule.useTable,
+                          CronSchedule('* * * * *').buildTable(2011))
+        
+        if cron.numpy is not None:
+            self.assertRaises(ValueError, cron.evaluateSchedules, [schedule],
+                              datetime(2011,1,1), datetime(2011,1,2))
+    
+    def test_equality(self):
+        """ Lines with different seconds are not equal """
+        self.assertEqual(CronSchedule('0 * * * * *'), CronSchedule('* * * * *'))
+        self.assertNotEqual(CronSchedule('30 * * * * *'),
+                            CronSchedule('* * * * *'))
+
 class SimpleTests(TestCase):
     def setUp(self):
         self.schedule = CronSchedule('* * * * *')
@@ -232,9 +824,19 @@ def test_suite():
     suite.addTest(TestLoader().loadTestsFromTestCase(SimpleTests))
     suite.addTest(TestLoader().loadTestsFromTestCase(AllDOMTestCase))
     suite.addTest(TestLoader().loadTestsFromTestCase(AllDOWTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(BatchDelaysTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(CursorTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(DayMatchingTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(EntriesTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(EvaluateSchedulesTestCase))
     suite.addTest(TestLoader().loadTestsFromTestCase(FillingCoverageTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(FireTableTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(NamesTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(ParseCacheTestCase))
     suite.addTest(TestLoader().loadTestsFromTestCase(RangeTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(SecondsTestCase))
     suite.addTest(TestLoader().loadTestsFromTestCase(StarTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(ZoneTestCase))
     
     suite.addTest(DocTestSuite(cron))
     return suite
@@ -0,0 +1,166 @@
+import os
+import signal
+import time
+import unittest
+from doctest import DocTestSuite
+
+from twisted.trial.unittest import TestCase
+from twisted.internet import defer, reactor, task
+
+from txscheduling import executor
+from txscheduling.executor import (ReactorExecutor, ThreadExecutor,
+                                   ProcessExecutor, WorkerLost,
+                                   createExecutor, getExecutor)
+from txscheduling.task import ScheduledCall
+from txscheduling.tests.task import SimpleSchedule, TestException
+
+
+
+def square(value):
+    return value * value
+
+def fail(message):
+    raise ValueError(message)
+
+def die():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+class ReactorExecutorTests(TestCase):
+    """ Tests for running functions on the reactor thread """
+    def test_result(self):
+        """ The result of the function is passed back """
+        d = ReactorExecutor().run(square, 3)
+        d.addCallback(self.assertEqual, 9)
+        return d
+    
+    def test_error(self):
+        """ An exception from the function fails the deferred """
+        return self.assertFailure(ReactorExecutor().run(fail, 'broken'),
+                                  ValueError)
+
+class ThreadExecutorTests(TestCase):
+    """ Tests for running functions in a thread pool """
+    def setUp(self):
+        super(ThreadExecutorTests, self).setUp()
+        self.executor = ThreadExecutor(2)
+        self.executor.start()
+        self.addCleanup(self.executor.stop)
+    
+    def test_result(self):
+        """ The result of the function is passed back """
+        d = self.executor.run(square, 4)
+        d.addCallback(self.assertEqual, 16)
+        return d
+    
+    def test_error(self):
+        """ An exception from the function fails the deferred """
+        return self.assertFailure(self.executor.run(fail, 'broken'),
+                                  ValueError)
+
+class ProcessExecutorTests(TestCase):
+    """ Tests for running functions in worker processes """
+    def setUp(self):
+        super(ProcessExecutorTests, self).setUp()
+        self.executor = ProcessExecutor(2)
+        self.addCleanup(self.executor.stop)
+    
+    def test_result(self):
+        """ The result of the function is passed back """
+        d = self.executor.run(square, 5)
+        d.addCallback(self.assertEqual, 25)
+        return d
+    
+    def test_error(self):
+        """ An exception from the function fails the deferred """
+        return self.assertFailure(self.executor.run(fail, 'broken'),
+                                  ValueError)
+    
+    def test_killed(self):
+        """ Functions whose worker is killed fail """
+        self.executor.checkInterval = 0.1
+        return self.assertFailure(self.executor.run(die), WorkerLost)
+    
+    def test_timeout(self):
+        """ Functions running longer than the timeout fail """
+        self.executor.checkInterval = 0.1
+        self.executor.timeout = 0.2
+        return self.assertFailure(self.executor.run(sleep, 1),
+                                  defer.TimeoutError)
+    
+    def test_stopped(self):
+        """ Stopped executors fail the functions they are given """
+        self.executor.stop()
+        return self.assertFailure(self.executor.run(square, 2), RuntimeError)
+    
+    def test_unpicklable(self):
+        """ Functions that cannot be pickled fail the deferred """
+        d = self.executor.run(lambda: None)
+        d.addCallbacks(lambda result: self.fail('Expected a failure'),
+                       lambda failure: None)
+        return d
+
+class ScheduledCallExecutorTests(TestCase):
+    """ Tests for scheduled calls using executors """
+    def setUp(self):
+        super(ScheduledCallExecutorTests, self).setUp()
+        self.clock = task.Clock()
+        self.executor = ThreadExecutor(1)
+        self.executor.start()
+        self.addCleanup(self.executor.stop)
+    
+    def test_names(self):
+        """ Executors can be given by name """
+        self.assertIdentical(getExecutor('reactor'), getExecutor('reactor'))
+        self.assertIdentical(getExecutor(self.executor), self.executor)
+        self.assertRaises(ValueError, getExecutor, 'fork')
+    
+    def test_createBeforeRunning(self):
+        """ The process executor is not forked once the reactor runs unless
+        it was created before """
+        self.patch(executor, '_executors', {})
+        self.patch(reactor, 'running', True)
+        self.assertRaises(RuntimeError, getExecutor, 'process')
+        
+        created = createExecutor('process', 1)
+        self.addCleanup(created.stop)
+        self.assertIdentical(getExecutor('process'), created)
+        self.assertEqual(created.size, 1)
+    
+    def test_rescheduleAfterThread(self):
+        """ Scheduled calls reschedule once the function finishes in its
+        thread and stop on errors """
+        results = []
+        
+        def f():
+            results.append(len(results))
+            if len(results) == 2:
+                raise TestException('broken')
+        
+        sc = ScheduledCall(f)
+        sc.clock = self.clock
+        d = sc.start(SimpleSchedule(1), executor=self.executor)
+        
+        # Functions finish in the thread pool, so time is moved on until the
+        # scheduled call stops
+        advance = task.LoopingCall(lambda: sc.running and self.clock.advance(1))
+        advance.start(0.01)
+        self.addCleanup(advance.stop)
+        
+        d = self.assertFailure(d, TestException)
+        d.addCallback(lambda ignored: self.assertEqual(results, [0, 1]))
+        return d
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ReactorExecutorTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ThreadExecutorTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ProcessExecutorTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ScheduledCallExecutorTests))
+    suite.addTest(DocTestSuite(executor))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
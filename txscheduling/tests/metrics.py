@@ -0,0 +1,103 @@
+import time
+import unittest
+from doctest import DocTestSuite
+
+from twisted.trial.unittest import TestCase
+from twisted.internet import task
+
+from txscheduling import metrics
+from txscheduling.cron import CronSchedule
+from txscheduling.metrics import MetricsObserver
+from txscheduling.tests.task import (TestableScheduledCall, SimpleSchedule,
+                                     MinuteSchedule, IncrementingCallable)
+
+
+
+class MetricsObserverTests(TestCase):
+    """ Tests for collecting metrics of scheduled calls """
+    def setUp(self):
+        super(MetricsObserverTests, self).setUp()
+        self.clock = task.Clock()
+        self.observer = MetricsObserver()
+    
+    def observedCall(self, f):
+        sc = TestableScheduledCall(self.clock, f)
+        sc.observer = self.observer
+        return sc
+    
+    def test_lateness(self):
+        """ Lateness of each firing is recorded per call and in aggregate """
+        first = self.observedCall(IncrementingCallable())
+        second = self.observedCall(IncrementingCallable())
+        first.start(SimpleSchedule(1))
+        second.start(SimpleSchedule(2))
+        
+        self.clock.pump([1.5, 1.5])
+        
+        snapshot = self.observer.snapshot()
+        self.assertEqual(snapshot['aggregate']['lateness']['count'], 3)
+        self.assertEqual(snapshot['aggregate']['lateness']['max'], 1)
+        self.assertEqual(snapshot['calls'][repr(first)]['lateness']['count'],
+                         2)
+        self.assertEqual(snapshot['calls'][repr(second)]['lateness']['total'],
+                         1)
+    
+    def test_durationAndOverruns(self):
+        """ Runs lasting past the next entry are counted as overruns """
+        def f():
+            return task.deferLater(self.clock, 150, lambda: None)
+        
+        sc = self.observedCall(f)
+        sc.start(MinuteSchedule(60))
+        self.clock.pump([60, 150])
+        
+        aggregate = self.observer.snapshot()['aggregate']
+        self.assertEqual(aggregate['duration']['max'], 150)
+        self.assertEqual(aggregate['overruns'], 1)
+        self.assertEqual(aggregate['skipped']['max'], 2)
+    
+    def test_lateOverrun(self):
+        """ Overruns of a late call count the entries passed while it ran
+        """
+        def f():
+            return task.deferLater(self.clock, 60, lambda: None)
+        
+        due = time.mktime((2020, 1, 1, 8, 0, 0, 0, 0, -1))
+        self.clock.advance(due - 10)
+        sc = self.observedCall(f)
+        sc.start(CronSchedule('0 * * * *'))
+        # Fires at 08:59:30 and finishes at 09:00:30
+        self.clock.advance(3580)
+        self.clock.advance(60)
+        
+        aggregate = self.observer.snapshot()['aggregate']
+        self.assertEqual(aggregate['overruns'], 1)
+        self.assertEqual(aggregate['skipped']['max'], 1)
+    
+    def test_skippedMisfires(self):
+        """ Entries skipped by a misfire are recorded when the call fires """
+        sc = self.observedCall(IncrementingCallable())
+        sc.start(MinuteSchedule(60))
+        self.clock.advance(250)
+        
+        skipped = self.observer.snapshot()['aggregate']['skipped']
+        self.assertEqual((skipped['count'], skipped['max']), (1, 3))
+    
+    def test_aggregateOnly(self):
+        """ Per call metrics can be turned off """
+        self.observer.perCall = False
+        sc = self.observedCall(IncrementingCallable())
+        sc.start(SimpleSchedule(1))
+        self.clock.advance(1)
+        
+        self.assertEqual(self.observer.snapshot()['calls'], {})
+        self.assertEqual(self.observer.aggregate.lateness.count, 1)
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(MetricsObserverTests))
+    suite.addTest(DocTestSuite(metrics))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
@@ -0,0 +1,143 @@
+import time
+import unittest
+from doctest import DocTestSuite
+
+from twisted.internet import defer
+
+from txscheduling import shard
+from txscheduling.shard import ShardedScheduler, shardFor
+from txscheduling.task import ScheduledCall, MISFIRE_SKIP
+from txscheduling.tests.task import SimpleSchedule, TestException
+
+
+
+def noop():
+    pass
+
+def fail():
+    raise TestException()
+
+def pending():
+    return defer.Deferred()
+
+
+class ShardedSchedulerTestCase(unittest.TestCase):
+    """ Tests for running scheduled calls in worker processes """
+    def setUp(self):
+        self.scheduler = ShardedScheduler(2)
+
+    def tearDown(self):
+        if self.scheduler.running:
+            self.scheduler.stop()
+
+    def add(self, jobId, f=noop, delay=0.05):
+        call = ScheduledCall(f)
+        call.jobId = jobId
+        self.scheduler.add(call, SimpleSchedule(delay))
+
+    def test_partition(self):
+        """ Jobs are started in the shard their id hashes to """
+        jobIds = ['job%d' % (i,) for i in range(20)]
+        for jobId in jobIds:
+            self.add(jobId)
+        self.scheduler.start()
+
+        stats = self.scheduler.stats()
+        self.assertEqual([s['shard'] for s in stats], [0, 1])
+        self.assertEqual(len(set([s['pid'] for s in stats])), 2)
+        self.assertEqual(stats[1]['jobs'],
+                         sum([shardFor(jobId, 2) for jobId in jobIds]))
+        self.assertEqual(stats[0]['jobs'] + stats[1]['jobs'], 20)
+
+    def test_dispatch(self):
+        """ Jobs added while running fire in their shard until removed """
+        self.scheduler.start()
+        self.add('job')
+        time.sleep(0.3)
+
+        stats = self.scheduler.stats()[shardFor('job', 2)]
+        self.assertEqual(stats['jobs'], 1)
+        self.assertTrue(stats['fired'] >= 2)
+
+        self.scheduler.remove('job')
+        stats = self.scheduler.stats()[shardFor('job', 2)]
+        self.assertEqual((stats['jobs'], stats['pending']), (0, 0))
+        self.assertTrue(stats['fired'] >= 2)
+
+    def test_settings(self):
+        """ Calls in shards keep the misfire settings of the added call """
+        call = ScheduledCall(noop)
+        call.jobId = 'job'
+        call.misfirePolicy = MISFIRE_SKIP
+        self.scheduler.add(call, SimpleSchedule(0.05))
+        self.assertEqual(len(self.scheduler.jobs), 1)
+
+    def test_errors(self):
+        """ Jobs that raise stop and are counted as errors """
+        self.add('failing', fail)
+        self.scheduler.start()
+        time.sleep(0.2)
+
+        stats = self.scheduler.stats()[shardFor('failing', 2)]
+        self.assertEqual((stats['jobs'], stats['errors'], stats['fired']),
+                         (0, 1, 1))
+
+    def test_pendingDeferred(self):
+        """ Jobs returning a deferred that has not fired stop with an
+        error """
+        self.add('pending', pending)
+        self.scheduler.start()
+        time.sleep(0.2)
+
+        stats = self.scheduler.stats()[shardFor('pending', 2)]
+        self.assertEqual((stats['jobs'], stats['errors'], stats['fired']),
+                         (0, 1, 1))
+
+    def test_jobIdTypes(self):
+        """ Integer and unicode job ids are sharded """
+        for jobId in (5, u'caf\xe9'):
+            self.assertTrue(0 <= shardFor(jobId, 2) < 2)
+            self.add(jobId)
+        self.assertEqual(shardFor(u'caf\xe9', 2),
+                         shardFor('caf\xc3\xa9', 2))
+        self.scheduler.start()
+
+        stats = self.scheduler.stats()
+        self.assertEqual(stats[0]['jobs'] + stats[1]['jobs'], 2)
+
+    def test_lateStats(self):
+        """ Replies to a request that timed out are not taken for later
+        ones """
+        self.scheduler.start()
+        self.add('job')
+        process, connection = self.scheduler.shards[0]
+        connection.send(('stats', -1))
+        time.sleep(0.2)
+
+        stats = self.scheduler.stats()
+        self.assertEqual([s['shard'] for s in stats], [0, 1])
+        self.assertEqual(sum([s['jobs'] for s in stats]), 1)
+        self.assertFalse(connection.poll(0.1))
+
+    def test_jobId(self):
+        """ Calls without a job id cannot be sharded """
+        self.assertRaises(ValueError, self.scheduler.add,
+                          ScheduledCall(noop), SimpleSchedule())
+
+    def test_stop(self):
+        """ Stopping the scheduler shuts down its workers """
+        self.scheduler.start()
+        processes = [process for process, connection in
+                     self.scheduler.shards]
+        self.scheduler.stop()
+        self.assertFalse([p for p in processes if p.is_alive()])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ShardedSchedulerTestCase))
+    suite.addTest(DocTestSuite(shard))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
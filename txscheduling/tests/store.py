@@ -0,0 +1,192 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from doctest import DocTestSuite
+
+from twisted.internet import task
+
+from txscheduling import store
+from txscheduling.store import (JobState, MemoryJobStore, SQLiteJobStore,
+                                restoreCalls)
+from txscheduling.tests.task import (TestableScheduledCall, MinuteSchedule,
+                                     IncrementingCallable)
+
+
+
+class KeyedSchedule(MinuteSchedule):
+    """ A schedule whose saved state is found by a key rather than its
+    repr """
+    scheduleKey = 'every minute'
+
+
+
+class SQLiteJobStoreTestCase(unittest.TestCase):
+    """ Tests for the SQLite job store """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'jobs.db')
+        self.clock = task.Clock()
+        self.store = SQLiteJobStore(self.path, flushInterval=5,
+                                    clock=self.clock)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def written(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            return sorted(connection.execute('SELECT * FROM jobs'))
+        finally:
+            connection.close()
+
+    def test_roundTrip(self):
+        """ Saved jobs load in a new store """
+        self.store.record(JobState(u'a', u'schedule', 10.0, 70.0))
+        self.store.record(JobState(u'b', u'schedule', None, 60.0))
+        self.store.close()
+
+        self.store = SQLiteJobStore(self.path, clock=self.clock)
+        self.assertEqual(self.store.load(),
+                         {u'a': (u'a', u'schedule', 10.0, 70.0),
+                          u'b': (u'b', u'schedule', None, 60.0)})
+
+    def test_batched(self):
+        """ Changes are written together after the flush interval """
+        for i in range(100):
+            self.store.record(JobState(str(i), 'schedule', None, i))
+        self.store.record(JobState('0', 'schedule', 1.0, 61.0))
+        self.assertEqual(self.written(), [])
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.assertEqual(self.store.load()['0'].nextRun, 61.0)
+
+        self.clock.advance(5)
+        written = self.written()
+        self.assertEqual(len(written), 100)
+        self.assertEqual(written[0], (u'0', u'schedule', 1.0, 61.0))
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_jobIds(self):
+        """ Jobs with integer and byte string ids are found again """
+        self.store.record(JobState(5, 'schedule', None, 60.0))
+        self.store.record(JobState('caf\xc3\xa9', 'schedule', None, 60.0))
+        self.store.close()
+
+        self.store = SQLiteJobStore(self.path, clock=self.clock)
+        calls = []
+        for jobId in (5, 'caf\xc3\xa9', 'missing'):
+            call = TestableScheduledCall(self.clock, IncrementingCallable())
+            call.jobId = jobId
+            calls.append(call)
+        self.assertEqual(restoreCalls(self.store, calls), 2)
+
+        self.store.remove(5)
+        self.assertEqual(sorted(self.store.load()), [u'caf\xe9'])
+
+    def test_remove(self):
+        """ Removed jobs are deleted when changes are written """
+        self.store.record(JobState('a', 'schedule', None, 60.0))
+        self.store.flush()
+        self.store.remove('a')
+        self.assertEqual(self.store.load(), {})
+        self.assertEqual(len(self.written()), 1)
+
+        self.store.flush()
+        self.assertEqual(self.written(), [])
+
+
+class ScheduledCallStoreTestCase(unittest.TestCase):
+    """ Tests for scheduled calls saving and restoring their state """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.store = MemoryJobStore()
+        self.schedule = MinuteSchedule(60)
+        self.callable = IncrementingCallable()
+
+    def makeCall(self, jobId='job'):
+        call = TestableScheduledCall(self.clock, self.callable)
+        call.store = self.store
+        call.jobId = jobId
+        return call
+
+    def test_record(self):
+        """ Each time a call is scheduled its state is recorded """
+        call = self.makeCall()
+        call.start(self.schedule)
+        self.assertEqual(self.store.jobs['job'],
+                         ('job', repr(self.schedule), None, 60))
+
+        self.clock.advance(60)
+        self.assertEqual(self.store.jobs['job'],
+                         ('job', repr(self.schedule), 60, 120))
+        call.stop()
+
+    def test_restoreMissed(self):
+        """ A call restored after its next due time fires at once as a
+        misfire """
+        self.store.record(JobState('job', repr(self.schedule), 60, 120))
+        self.clock.advance(300)
+
+        call = self.makeCall()
+        self.assertEqual(restoreCalls(self.store, [call]), 1)
+        call.start(self.schedule)
+        self.assertEqual(self.callable.count, 0)
+
+        self.clock.advance(0)
+        self.assertEqual(self.callable.count, 1)
+        self.assertEqual((call.misfires, call.missed), (1, 3))
+        call.stop()
+
+    def test_restoreFuture(self):
+        """ A call restored before its next due time follows its schedule """
+        self.store.record(JobState('job', repr(self.schedule), 0, 60))
+
+        call = self.makeCall()
+        restoreCalls(self.store, [call])
+        call.start(self.schedule)
+        self.assertEqual(call.lastRun, 0)
+
+        self.clock.advance(60)
+        self.assertEqual((self.callable.count, call.misfires), (1, 0))
+        call.stop()
+
+    def test_restoreKey(self):
+        """ Schedules with a key are matched by it in another process """
+        first = self.makeCall()
+        first.start(KeyedSchedule(60))
+        first.stop()
+        self.assertEqual(self.store.jobs['job'].schedule, 'every minute')
+        self.clock.advance(300)
+
+        call = self.makeCall()
+        restoreCalls(self.store, [call])
+        call.start(KeyedSchedule(60))
+        self.clock.advance(0)
+        self.assertEqual((call.misfires, self.callable.count), (1, 1))
+        call.stop()
+
+    def test_restoreChanged(self):
+        """ State saved for a different schedule is ignored """
+        self.store.record(JobState('job', 'MinuteSchedule()', 60, 120))
+        self.clock.advance(300)
+
+        call = self.makeCall()
+        restoreCalls(self.store, [call])
+        call.start(self.schedule)
+        self.clock.advance(0)
+        self.assertEqual(self.callable.count, 0)
+        self.assertEqual(call.lastRun, None)
+        call.stop()
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(SQLiteJobStoreTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ScheduledCallStoreTestCase))
+    suite.addTest(DocTestSuite(store))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
@@ -1,3 +1,6 @@
+import gc
+import sys
+import types
 import unittest
 
 import zope.interface
@@ -8,8 +11,11 @@ from twisted.internet import interfaces, task, reactor, defer, error
 
 from twisted.python import failure
 
-from txscheduling.task import ScheduledCall
-from txscheduling.interfaces import ISchedule
+from txscheduling.task import ScheduledCall, TimerWheel, ConcurrencyLimiter
+from txscheduling.task import MISFIRE_SKIP, MISFIRE_RUN_ONCE, MISFIRE_RUN_ALL
+from txscheduling.task import JOB_MEMORY_BUDGET
+from txscheduling.interfaces import ISchedule, IWallClockSchedule
+from txscheduling.cron import CronSchedule
 
 
 
@@ -29,6 +35,34 @@ class SimpleSchedule(object):
     def getDelayForNext(self):
         return self._delay
 
+class CountingCronSchedule(CronSchedule):
+    """ A cron schedule that counts the searches for its next entry, alone
+    or in a batch """
+    def __init__(self, *a, **kw):
+        CronSchedule.__init__(self, *a, **kw)
+        self.count = 0
+    
+    def getDelayForNext(self):
+        self.count += 1
+        return CronSchedule.getDelayForNext(self)
+    
+    @classmethod
+    def getDelaysForNext(cls, schedules, now=None):
+        for schedule in schedules:
+            schedule.count += 1
+        return super(CountingCronSchedule, cls).getDelaysForNext(schedules,
+                                                                 now)
+
+class MinuteSchedule(SimpleSchedule):
+    """ A wall clock schedule with entries every minute after the delay """
+    zope.interface.implements(IWallClockSchedule)
+    
+    def iterEntries(self, current=None, timestamps=False):
+        entry = current
+        while True:
+            entry += 60
+            yield entry
+
 class IncrementingCallable(object):
     def __init__(self):
         self.count = 0
@@ -84,6 +118,25 @@ class CallableTests(TestCase):
         super(CallableTests, self).setUp()
         self.clock = task.Clock()
     
+    def test_cursor(self):
+        """ Calls step through the entries of a shared schedule with a
+        cursor of their own """
+        schedule = CronSchedule.intern('* * * * *')
+        first = TestableScheduledCall(self.clock, IncrementingCallable())
+        second = TestableScheduledCall(self.clock, IncrementingCallable())
+        first.start(schedule)
+        second.start(schedule)
+        
+        self.assertTrue(first._cursor is not second._cursor)
+        self.assertEqual(first._cursor.schedule, schedule)
+        
+        first.stop()
+        cursor = first._cursor
+        first.start(schedule)
+        self.assertTrue(first._cursor is not cursor)
+        first.stop()
+        second.stop()
+    
     def test_callable_exception(self):
         """ Test error back call raises exception """
         def f(*args, **kwargs):
@@ -308,12 +361,360 @@ class LongRunningTimingTests(TestCase):
         self.assertEqual(self.started.count, 2,
                          u'Callable should not be called after stopping: %f' % (self.clock.rightNow,))
 
+class TimerWheelTests(TestCase):
+    """ Tests for sharing a TimerWheel between scheduled calls """
+    def setUp(self):
+        super(TimerWheelTests, self).setUp()
+        self.clock = task.Clock()
+        self.wheel = TimerWheel(self.clock)
+    
+    def test_singleTimer(self):
+        """ Many scheduled calls use a single delayed call of the clock """
+        callables = [IncrementingCallable() for i in range(100)]
+        calls = [TestableScheduledCall(self.wheel, c) for c in callables]
+        
+        for i, sc in enumerate(calls):
+            sc.start(SimpleSchedule(1 + (i % 3)))
+        
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.assertEqual(len(self.wheel.getDelayedCalls()), 100)
+        
+        self.clock.pump([0.5]*13)
+        self.assertEqual([c.count for c in callables[:3]], [6, 3, 2])
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        
+        for sc in calls:
+            sc.stop()
+        
+        self.assertEqual(len(self.wheel), 0)
+        self.clock.pump([1]*5)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+    
+    def test_order(self):
+        """ Due calls are made in time order across buckets """
+        wheel = TimerWheel(self.clock, resolution=1)
+        made = []
+        
+        wheel.callLater(2.5, made.append, 3)
+        wheel.callLater(0.5, made.append, 1)
+        wheel.callLater(1.5, made.append, 2)
+        
+        self.clock.advance(1)
+        self.assertEqual(made, [1])
+        self.clock.advance(2)
+        self.assertEqual(made, [1, 2, 3])
+    
+    def test_cancelEarliest(self):
+        """ Cancelling the earliest call moves the wakeup on """
+        made = []
+        
+        self.wheel.callLater(1, made.append, 1).cancel()
+        self.wheel.callLater(2, made.append, 2)
+        
+        self.clock.advance(1)
+        self.assertEqual(made, [])
+        self.assertEqual(self.clock.getDelayedCalls()[0].getTime(), 2)
+        self.clock.advance(1)
+        self.assertEqual(made, [2])
+    
+    def test_reset(self):
+        """ Delayed calls from the wheel can be reset and delayed """
+        made = []
+        
+        earlier = self.wheel.callLater(100, made.append, 1)
+        later = self.wheel.callLater(1, made.append, 2)
+        earlier.reset(0.5)
+        later.delay(200)
+        
+        self.clock.advance(1)
+        self.assertEqual(made, [1])
+        self.clock.advance(100)
+        self.assertEqual(made, [1])
+        self.clock.advance(100)
+        self.assertEqual(made, [1, 2])
+        self.assertFalse(later.active())
+    
+    def test_cancelDuringWakeup(self):
+        """ Calls cancelled or moved by an earlier call of the same wakeup
+        are not made """
+        made = []
+        later = []
+        
+        def first():
+            made.append(1)
+            later[0].cancel()
+            later[1].reset(10)
+        
+        self.wheel.callLater(1, first)
+        later.append(self.wheel.callLater(1.5, made.append, 2))
+        later.append(self.wheel.callLater(1.5, made.append, 3))
+        
+        self.clock.advance(2)
+        self.assertEqual(made, [1])
+        self.assertFalse(later[0].active())
+        self.assertTrue(later[1].active())
+        
+        self.clock.advance(60)
+        self.assertEqual(made, [1, 3])
+    
+    def test_coalescedSchedule(self):
+        """ Calls sharing a wall clock schedule fire together and compute the
+        next entry once """
+        schedule = CountingCronSchedule('0 0 1 1 *')
+        callables = [IncrementingCallable() for i in range(50)]
+        
+        for c in callables:
+            TestableScheduledCall(self.wheel, c).start(schedule)
+            self.clock.advance(0.5)
+        
+        self.assertEqual(schedule.count, 1)
+        self.assertEqual(len(self.wheel._buckets), 1)
+        
+        self.clock.advance(self.clock.getDelayedCalls()[0].getTime() -
+                           self.clock.seconds())
+        self.assertEqual([c.count for c in callables], [1] * 50)
+        self.assertEqual(schedule.count, 2)
+        self.assertEqual(len(set([call.getTime() for call in
+                                  self.wheel.getDelayedCalls()])), 1)
+    
+    def test_prepare(self):
+        """ Next times are computed in one batch ahead of getNextTime """
+        schedules = [CountingCronSchedule('%d 3 * * *' % (minute,))
+                     for minute in range(10)]
+        self.wheel.prepare(schedules + schedules[:1] + [SimpleSchedule(1)])
+        self.assertEqual([schedule.count for schedule in schedules], [1] * 10)
+        
+        for schedule in schedules:
+            self.wheel.getNextTime(schedule)
+        self.assertEqual([schedule.count for schedule in schedules], [1] * 10)
+    
+    def test_relativeScheduleNotShared(self):
+        """ Schedules that are not wall clock schedules are not shared """
+        schedule = SimpleSchedule(1)
+        first = IncrementingCallable()
+        second = IncrementingCallable()
+        
+        TestableScheduledCall(self.wheel, first).start(schedule)
+        self.clock.advance(0.5)
+        TestableScheduledCall(self.wheel, second).start(schedule)
+        self.clock.advance(0.5)
+        
+        self.assertEqual((first.count, second.count), (1, 0))
+        self.clock.advance(0.5)
+        self.assertEqual((first.count, second.count), (1, 1))
+    
+    def test_errorsLogged(self):
+        """ A failing call does not prevent the other due calls """
+        made = []
+        
+        def fail():
+            raise TestException('broken')
+        
+        self.wheel.callLater(1, fail)
+        self.wheel.callLater(1, made.append, 1)
+        
+        self.clock.advance(1)
+        self.assertEqual(made, [1])
+
+class ConcurrencyLimiterTests(TestCase):
+    """ Tests for limiting how many scheduled calls run at once """
+    def setUp(self):
+        super(ConcurrencyLimiterTests, self).setUp()
+        self.clock = task.Clock()
+        self.pending = []
+    
+    def deferredCallable(self, name):
+        d = defer.Deferred()
+        self.pending.append((name, d))
+        return d
+    
+    def startCalls(self, limiter, groups):
+        calls = []
+        for i, group in enumerate(groups):
+            sc = TestableScheduledCall(self.clock, self.deferredCallable, i)
+            sc.limiter = limiter
+            sc.group = group
+            sc.start(SimpleSchedule(1))
+            calls.append(sc)
+        return calls
+    
+    def test_overallLimit(self):
+        """ Calls over the overall limit wait for running calls """
+        limiter = ConcurrencyLimiter(2, clock=self.clock)
+        self.startCalls(limiter, [None] * 5)
+        
+        self.clock.advance(1)
+        self.assertEqual([name for name, d in self.pending], [0, 1])
+        self.assertEqual((limiter.running, limiter.queued), (2, 3))
+        
+        self.clock.advance(0.5)
+        self.pending.pop(0)[1].callback(None)
+        self.assertEqual([name for name, d in self.pending], [1, 2])
+        
+        stats = limiter.stats()
+        self.assertEqual(stats['queued'], 2)
+        self.assertEqual(stats['waited'], 3)
+        self.assertEqual(stats['maxWait'], 0.5)
+    
+    def test_groupLimit(self):
+        """ Calls over a group limit wait without blocking other groups """
+        limiter = ConcurrencyLimiter(groupLimits={'reports': 1},
+                                     clock=self.clock)
+        calls = self.startCalls(limiter, ['reports', 'reports', None, 'reports'])
+        calls[0].deferred.addErrback(lambda failure: None)
+        
+        self.clock.advance(1)
+        self.assertEqual([name for name, d in self.pending], [0, 2])
+        self.assertEqual(limiter.stats()['groupsQueued'], {'reports': 2})
+        
+        self.pending.pop(0)[1].errback(TestException('broken'))
+        self.assertEqual([name for name, d in self.pending], [2, 1])
+    
+    def test_errorReleases(self):
+        """ A failing call releases its place and errbacks the start """
+        limiter = ConcurrencyLimiter(1, clock=self.clock)
+        calls = self.startCalls(limiter, [None, None])
+        failures = []
+        calls[0].deferred.addErrback(failures.append)
+        
+        self.clock.advance(1)
+        self.pending.pop(0)[1].errback(TestException('broken'))
+        
+        self.assertEqual(len(failures), 1)
+        self.assertEqual([name for name, d in self.pending], [1])
+        self.assertEqual(limiter.running, 1)
+
+class MisfireTests(TestCase):
+    """ Tests for calls that fire late """
+    def setUp(self):
+        super(MisfireTests, self).setUp()
+        self.clock = task.Clock()
+        self.callable = IncrementingCallable()
+        self.sc = TestableScheduledCall(self.clock, self.callable)
+    
+    def test_onTime(self):
+        """ Calls within the grace time are not misfires """
+        self.sc.start(SimpleSchedule(60))
+        self.clock.pump([60.5, 60])
+        
+        self.assertEqual(self.callable.count, 2)
+        stats = self.sc.misfireStats()
+        self.assertEqual((stats['fired'], stats['misfires']), (2, 0))
+        self.assertEqual(stats['maxLateness'], 0.5)
+    
+    def test_runOnce(self):
+        """ The default policy runs a late call once """
+        self.sc.start(MinuteSchedule(60))
+        self.clock.advance(250)
+        
+        self.assertEqual(self.callable.count, 1)
+        stats = self.sc.misfireStats()
+        self.assertEqual((stats['misfires'], stats['missed']), (1, 3))
+        self.assertEqual(stats['maxLateness'], 190)
+    
+    def test_skip(self):
+        """ The skip policy does not run late calls """
+        self.sc.misfirePolicy = MISFIRE_SKIP
+        self.sc.start(MinuteSchedule(60))
+        self.clock.advance(250)
+        self.assertEqual(self.callable.count, 0)
+        self.assertEqual(self.sc.misfireStats()['missed'], 4)
+        
+        self.clock.advance(60)
+        self.assertEqual(self.callable.count, 1)
+    
+    def test_runAllMissed(self):
+        """ The run all missed policy runs each missed entry up to a limit """
+        self.sc.misfirePolicy = MISFIRE_RUN_ALL
+        self.sc.start(MinuteSchedule(60))
+        self.clock.advance(250)
+        self.assertEqual(self.callable.count, 4)
+        
+        self.sc.misfireLimit = 2
+        self.clock.advance(600)
+        self.assertEqual(self.callable.count, 6)
+        self.assertEqual(self.sc.misfireStats()['missed'], 8)
+    
+    def test_runAllMissedRelative(self):
+        """ Only the late entry is known for schedules that are not wall clock
+        schedules """
+        self.sc.misfirePolicy = MISFIRE_RUN_ALL
+        self.sc.start(SimpleSchedule(60))
+        self.clock.advance(250)
+        self.assertEqual(self.callable.count, 1)
+    
+    def test_invalidPolicy(self):
+        """ Unknown misfire policies are rejected """
+        self.sc.misfirePolicy = 'sometimes'
+        self.assertRaises(ValueError, self.sc.start, SimpleSchedule(60))
+
+def _reachable(obj, stop):
+    """ Return the objects reachable from obj by id, without following the
+    objects in stop, types, modules or functions """
+    found = {}
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in found or id(obj) in stop or isinstance(obj,
+                (type, types.ModuleType, types.FunctionType,
+                 types.BuiltinFunctionType)):
+            continue
+        found[id(obj)] = obj
+        pending.extend(gc.get_referents(obj))
+    return found
+
+def _ownedSize(makeSchedule):
+    """ Return the bytes sys.getsizeof counts for the objects reachable from
+    a running call on a TimerWheel that are not shared with a second one """
+    wheel = TimerWheel(task.Clock())
+    calls = []
+    for i in range(2):
+        sc = ScheduledCall(lambda: None)
+        sc.clock = wheel
+        sc.start(makeSchedule())
+        calls.append(sc)
+    
+    stop = set([id(wheel), id(wheel.clock)])
+    stop.update([id(bucket) for bucket in wheel._buckets.values()])
+    other = _reachable(calls[1], stop)
+    size = sum([sys.getsizeof(obj) for key, obj
+                in _reachable(calls[0], stop).items() if key not in other])
+    for sc in calls:
+        sc.stop()
+    return size
+
+class MemoryTests(TestCase):
+    """ Tests for the memory taken by each scheduled call """
+    def test_slots(self):
+        """ Calls, cron schedules and wheel delayed calls have no __dict__ """
+        wheel = TimerWheel(task.Clock())
+        sc = ScheduledCall(lambda: None)
+        sc.clock = wheel
+        sc.start(CronSchedule('* * * * *'))
+        
+        for obj in (sc, sc.schedule, sc.call):
+            self.assertFalse(hasattr(obj, '__dict__'))
+        sc.stop()
+    
+    def test_budget(self):
+        """ Running calls stay within the documented memory budget, with a
+        shared schedule or one of their own """
+        shared = _ownedSize(lambda: CronSchedule.intern('*/5 * * * *'))
+        own = _ownedSize(lambda: CronSchedule('7 3 * * *'))
+        self.assertTrue(0 < shared < own, (shared, own))
+        self.assertTrue(own <= JOB_MEMORY_BUDGET, own)
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(SimpleTests))
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(CallableTests))
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(SimpleTimingTests))
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(LongRunningTimingTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TimerWheelTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ConcurrencyLimiterTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(MisfireTests))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(MemoryTests))
     return suite
 
 if __name__ == '__main__':
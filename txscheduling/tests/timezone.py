@@ -0,0 +1,107 @@
+import calendar
+import unittest
+from datetime import datetime, timedelta, tzinfo
+from doctest import DocTestSuite
+
+from txscheduling import timezone
+from txscheduling.timezone import Transitions, wallSeconds
+
+
+
+class USCentral(tzinfo):
+    """ US Central time with the daylight saving rules in use since 2007 """
+    def _transitions(self, year):
+        # 2am local on the second Sunday of March and the first of November
+        march = datetime(year, 3, 8)
+        november = datetime(year, 11, 1)
+        return (march + timedelta(days=(6 - march.weekday()), hours=8),
+                november + timedelta(days=(6 - november.weekday()), hours=7))
+
+    def fromutc(self, dt):
+        dt = dt.replace(tzinfo=None)
+        start, end = self._transitions(dt.year)
+        if start <= dt < end:
+            return (dt - timedelta(hours=5)).replace(tzinfo=self)
+        return (dt - timedelta(hours=6)).replace(tzinfo=self)
+
+    def dst(self, dt):
+        start, end = self._transitions(dt.year)
+        if (start - timedelta(hours=6) <= dt.replace(tzinfo=None) <
+            end - timedelta(hours=6)):
+            return timedelta(hours=1)
+        return timedelta(0)
+
+    def utcoffset(self, dt):
+        return timedelta(hours=-6) + self.dst(dt)
+
+    def tzname(self, dt):
+        return self.dst(dt) and 'CDT' or 'CST'
+
+central = USCentral()
+
+def timestamp(*args):
+    """ The POSIX timestamp of a UTC time """
+    return calendar.timegm(datetime(*args).utctimetuple())
+
+
+class TransitionsTestCase(unittest.TestCase):
+    """ Tests for the cached UTC offset transitions of a zone """
+    def setUp(self):
+        self.transitions = Transitions(central)
+
+    def test_utcoffset(self):
+        """ Offsets change at the moment of each transition """
+        utcoffset = self.transitions.utcoffset
+        self.assertEqual(utcoffset(timestamp(2011,3,13,7,59,59)), -6 * 3600)
+        self.assertEqual(utcoffset(timestamp(2011,3,13,8)), -5 * 3600)
+        self.assertEqual(utcoffset(timestamp(2011,11,6,6,59,59)), -5 * 3600)
+        self.assertEqual(utcoffset(timestamp(2011,11,6,7)), -6 * 3600)
+
+    def test_cached(self):
+        """ Each year is computed once and years are added as needed """
+        self.transitions.utcoffset(timestamp(2011,6,1))
+        self.assertEqual(self.transitions._years, (2011, 2011))
+        self.assertEqual(len(self.transitions._times), 3)
+
+        self.transitions.utcoffset(timestamp(2013,6,1))
+        self.assertEqual(self.transitions._years, (2011, 2013))
+        self.assertEqual(len(self.transitions._times), 7)
+
+    def test_resolve(self):
+        """ Unique local times resolve to their only occurrence """
+        self.assertEqual(
+            self.transitions.resolve(wallSeconds(2011,7,4,12,0)),
+            timestamp(2011,7,4,17))
+
+    def test_ambiguous(self):
+        """ Repeated local times resolve to the occurrence chosen by the
+        policy """
+        wall = wallSeconds(2011,11,6,1,30)
+        self.assertEqual(self.transitions.resolve(wall), timestamp(2011,11,6,6,30))
+        self.assertEqual(self.transitions.resolve(wall,
+                                                  timezone.AMBIGUOUS_LATEST),
+                         timestamp(2011,11,6,7,30))
+
+    def test_missing(self):
+        """ Skipped local times resolve to the transition or to nothing """
+        wall = wallSeconds(2011,3,13,2,30)
+        self.assertEqual(self.transitions.resolve(wall),
+                         timestamp(2011,3,13,8))
+        self.assertEqual(self.transitions.resolve(wall,
+                                                  missing=timezone.MISSING_SKIP),
+                         None)
+
+    def test_getTransitions(self):
+        """ Transitions are shared between users of a zone """
+        self.assertTrue(timezone.getTransitions(central) is
+                        timezone.getTransitions(central))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TransitionsTestCase))
+    suite.addTest(DocTestSuite(timezone))
+    return suite
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(test_suite())
@@ -0,0 +1,301 @@
+import bisect
+import calendar
+import datetime
+import time
+
+
+
+""" This module provides the UTC offset transition tables used by
+txscheduling.cron.CronSchedule to schedule in an explicit timezone, the
+policies for local times that occur twice or not at all when the offset
+changes, and tzinfo implementations for UTC and the system's local time. """
+
+# Policies for local times that occur twice when the offset decreases
+AMBIGUOUS_EARLIEST = 'earliest'
+AMBIGUOUS_LATEST = 'latest'
+
+# Policies for local times that do not occur when the offset increases
+MISSING_SKIP = 'skip'
+MISSING_TRANSITION = 'transition'
+
+_ambiguousPolicies = (AMBIGUOUS_EARLIEST, AMBIGUOUS_LATEST)
+_missingPolicies = (MISSING_SKIP, MISSING_TRANSITION)
+
+_ZERO = datetime.timedelta(0)
+_DAY = 86400
+_SAMPLE = 6 * 3600
+
+class UTC(datetime.tzinfo):
+    """Coordinated universal time. """
+
+    def utcoffset(self, dt):
+        return _ZERO
+
+    def dst(self, dt):
+        return _ZERO
+
+    def tzname(self, dt):
+        return 'UTC'
+
+    def __repr__(self):
+        return 'UTC()'
+
+    def __reduce__(self):
+        # Unpickled as the shared instance, so schedules stay equal
+        return 'utc'
+
+
+class Local(datetime.tzinfo):
+    """The system's local time, as used by time.localtime. """
+
+    def fromutc(self, dt):
+        timestamp = calendar.timegm(dt.replace(tzinfo=None).timetuple())
+        offset = calendar.timegm(time.localtime(timestamp)) - timestamp
+        return dt + datetime.timedelta(seconds=offset)
+
+    def _isdst(self, dt):
+        return time.localtime(time.mktime((dt.year, dt.month, dt.day, dt.hour,
+                                           dt.minute, dt.second, 0, 0,
+                                           -1))).tm_isdst > 0
+
+    def utcoffset(self, dt):
+        if self._isdst(dt):
+            return datetime.timedelta(seconds=-time.altzone)
+        return datetime.timedelta(seconds=-time.timezone)
+
+    def dst(self, dt):
+        if self._isdst(dt):
+            return datetime.timedelta(seconds=time.timezone - time.altzone)
+        return _ZERO
+
+    def tzname(self, dt):
+        return time.tzname[self._isdst(dt)]
+
+    def __repr__(self):
+        return 'Local()'
+
+    def __reduce__(self):
+        return 'local'
+
+
+class FixedOffset(datetime.tzinfo):
+    """A constant offset of C{offset} seconds from UTC, given to datetimes
+    whose own zone cannot tell which occurrence of a wall time they are.
+
+    >>> FixedOffset(-18000).tzname(None)
+    'UTC-05:00'
+    """
+
+    def __init__(self, offset, name=None):
+        self.offset = offset
+        if name is None:
+            sign = offset < 0 and '-' or '+'
+            name = 'UTC%s%02d:%02d' % (sign, abs(offset) // 3600,
+                                       abs(offset) // 60 % 60)
+        self.name = name
+        self._delta = datetime.timedelta(seconds=offset)
+
+    def __getinitargs__(self):
+        return (self.offset, self.name)
+
+    def utcoffset(self, dt):
+        return self._delta
+
+    def dst(self, dt):
+        return _ZERO
+
+    def tzname(self, dt):
+        return self.name
+
+    def __repr__(self):
+        return 'FixedOffset(%d, %r)' % (self.offset, self.name)
+
+
+utc = UTC()
+local = Local()
+
+def wallSeconds(year, month, day, hour, minute):
+    """Return the seconds since the epoch of a wall clock time as if it were
+    UTC, which is calendar.timegm without building a time tuple.
+
+    >>> wallSeconds(2011, 3, 13, 2, 30) == calendar.timegm(
+    ...     (2011, 3, 13, 2, 30, 0, 0, 0, 0))
+    True
+    """
+    if month < 3:
+        year -= 1
+        month += 12
+    days = (365 * year + year // 4 - year // 100 + year // 400 +
+            (153 * (month - 3) + 2) // 5 + day - 719469)
+    return days * _DAY + hour * 3600 + minute * 60
+
+
+class Transitions(object):
+    """The UTC offsets of a tzinfo as a table of the times they start. The
+    table is computed a year at a time the first time a year is needed, so
+    converting between UTC and local time is a bisect rather than tzinfo
+    arithmetic. Use L{getTransitions} to share tables between schedules.
+
+    @ivar zone: The C{datetime.tzinfo}.
+    """
+
+    def __init__(self, zone):
+        self.zone = zone
+        self._times = []
+        self._offsets = []
+        self._years = None
+
+    def _offsetAt(self, timestamp):
+        # The wall clock fields fromutc produces, rather than utcoffset, so
+        # tzinfo implementations that cannot resolve ambiguous wall times
+        # still give the right answer
+        wall = self.zone.fromutc(datetime.datetime(1970, 1, 1,
+                                                   tzinfo=self.zone) +
+                                 datetime.timedelta(seconds=timestamp))
+        return wallSeconds(wall.year, wall.month, wall.day, wall.hour,
+                           wall.minute) + wall.second - timestamp
+
+    def _computeYear(self, year):
+        """Return the (time, offset) transitions of a year, starting with the
+        offset in effect at its start. Offsets are sampled every six hours,
+        which no zone has changed twice within, and each change is narrowed
+        down to the second. """
+        start = wallSeconds(year, 1, 1, 0, 0)
+        end = wallSeconds(year + 1, 1, 1, 0, 0)
+        offset = self._offsetAt(start)
+        transitions = [(start, offset)]
+
+        for sample in xrange(start + _SAMPLE, end + _SAMPLE, _SAMPLE):
+            sample = min(sample, end - 1)
+            next = self._offsetAt(sample)
+
+            if next != offset:
+                low, high = sample - _SAMPLE, sample
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if self._offsetAt(middle) == offset:
+                        low = middle
+                    else:
+                        high = middle
+                transitions.append((high, next))
+                offset = next
+
+        return transitions
+
+    def _extend(self, timestamp):
+        year = datetime.datetime.utcfromtimestamp(timestamp).year
+
+        if self._years is None:
+            first = last = year
+        else:
+            first = min(year, self._years[0])
+            last = max(year, self._years[1])
+
+        times = []
+        offsets = []
+
+        for year in range(first, last + 1):
+            for start, offset in self._computeYear(year):
+                if not offsets or offsets[-1] != offset:
+                    times.append(start)
+                    offsets.append(offset)
+
+        self._times = times
+        self._offsets = offsets
+        self._years = (first, last)
+        self._start = wallSeconds(first, 1, 1, 0, 0)
+        self._end = wallSeconds(last + 1, 1, 1, 0, 0)
+
+    def utcoffset(self, timestamp):
+        """Return the offset in seconds of local time from UTC at a POSIX
+        timestamp.
+
+        >>> getTransitions(utc).utcoffset(1300000000)
+        0
+        """
+        if self._years is None or not self._start <= timestamp < self._end:
+            self._extend(timestamp)
+
+        return self._offsets[bisect.bisect_right(self._times, timestamp) - 1]
+
+    def datetime(self, timestamp):
+        """Return a POSIX timestamp as an aware datetime in the zone. When
+        the zone gives the wall time a different offset than the one in
+        effect at the timestamp, such as L{Local} for the second occurrence
+        of a repeated hour, the datetime has a L{FixedOffset} instead so it
+        still names the same moment.
+
+        >>> getTransitions(utc).datetime(1300000000)
+        datetime.datetime(2011, 3, 13, 7, 6, 40, tzinfo=UTC())
+        """
+        result = datetime.datetime.fromtimestamp(timestamp, self.zone)
+        offset = self.utcoffset(timestamp)
+
+        if result.utcoffset() != datetime.timedelta(seconds=offset):
+            result = result.replace(tzinfo=FixedOffset(offset))
+
+        return result
+
+    def resolve(self, wall, ambiguous=AMBIGUOUS_EARLIEST,
+                missing=MISSING_TRANSITION):
+        """Return the POSIX timestamp of a local time given as L{wallSeconds}.
+        A local time occurring twice resolves to its earliest or latest
+        occurrence and one that does not occur resolves to None or to the
+        moment the offset changed, according to the policies. """
+        # Every candidate lies within a day of the wall time
+        if (self._years is None or not self._start <= wall - _DAY or
+            not wall + _DAY < self._end):
+            self._extend(wall - _DAY)
+            self._extend(wall + _DAY)
+
+        times = self._times
+        offsets = self._offsets
+        low = bisect.bisect_right(times, wall - _DAY) - 1
+        high = bisect.bisect_right(times, wall + _DAY)
+
+        if high - low == 1:
+            return wall - offsets[low]
+
+        utcoffset = self.utcoffset
+        candidates = set(offsets[low:high])
+        found = [wall - offset for offset in candidates
+                 if utcoffset(wall - offset) == offset]
+
+        if found:
+            if ambiguous == AMBIGUOUS_LATEST:
+                return max(found)
+            return min(found)
+
+        if missing == MISSING_SKIP:
+            return None
+
+        # Read with the offset before the change, the time falls after it
+        after = wall - min(candidates)
+        return times[bisect.bisect_right(times, after) - 1]
+
+
+_transitions = {}
+
+def getTransitions(zone):
+    """Return the L{Transitions} of a tzinfo, shared by all of its users. """
+    transitions = _transitions.get(zone)
+
+    if transitions is None:
+        transitions = _transitions.setdefault(zone, Transitions(zone))
+
+    return transitions
+
+__all__ = [
+    'AMBIGUOUS_EARLIEST',
+    'AMBIGUOUS_LATEST',
+    'MISSING_SKIP',
+    'MISSING_TRANSITION',
+    'UTC',
+    'Local',
+    'FixedOffset',
+    'utc',
+    'local',
+    'Transitions',
+    'getTransitions',
+    'wallSeconds'
+]